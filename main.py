@@ -1,14 +1,40 @@
+from contextlib import asynccontextmanager
+
 from asgi_correlation_id import CorrelationIdMiddleware
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from src.config.core import settings
+from src.module.recommendation_system.neo4j_pool import (
+    close_async_neo4j_pool, close_neo4j_pool, init_async_neo4j_pool,
+    init_neo4j_pool)
+from src.module.recommendation_system.recommend import (
+    start_interaction_ingestion, start_recommendation_engine,
+    stop_interaction_ingestion, stop_recommendation_engine)
+from src.module.related_items.related_events import (
+    start_related_items_clients, stop_related_items_clients)
 from src.router.content_router import router as content_router
 from src.router.main_router import router as main_router
 from src.router.recommend_router import router as recommendation_router
 from src.router.related_items_router import router as related_items_router
 
-app = FastAPI(title=settings.PROJECT_NAME)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_neo4j_pool()
+    init_async_neo4j_pool()
+    start_interaction_ingestion()
+    start_recommendation_engine()
+    start_related_items_clients()
+    yield
+    stop_related_items_clients()
+    stop_recommendation_engine()
+    stop_interaction_ingestion()
+    await close_async_neo4j_pool()
+    close_neo4j_pool()
+
+
+app = FastAPI(title=settings.PROJECT_NAME, lifespan=lifespan)
 
 origins = ["*"]
 
@@ -0,0 +1,140 @@
+"""
+Fit an embedding codec and report recall against index size.
+
+    python -m src.cli.embedding_codec report --local-index related_index
+    python -m src.cli.embedding_codec fit --zilliz 20000 --projection pca --dims 256 \
+        --dtype int8 --output embedding_codec.npz
+
+Vectors are read from a .npy file, the local index or Zilliz. The report
+compares exact top-k search over encoded vectors with exact float32 search
+over the originals, so it measures the loss of the encoding alone.
+
+Sizes are reported for both backends: the local index stores vectors in
+the codec's dtype, Zilliz and Mongo store the projected vectors as
+float32, so only the projection shrinks them.
+"""
+import argparse
+import json
+
+import numpy as np
+
+from src.module.embedding.vector_codec import (DTYPES, VectorCodec,
+                                               dequantize, quantize)
+from src.utils.logger import logger
+
+
+def load_vectors(args):
+    if args.vectors:
+        return np.load(args.vectors).astype(np.float32)
+    if args.local_index:
+        from src.module.local_index.ivf_index import IVFIndex
+
+        index = IVFIndex(path=args.local_index)
+        index.refresh(force=True)
+        parts = [index._segment.dense()] if index._segment.meta["count"] else []
+        if index._delta_vectors is not None:
+            parts.append(index._delta_vectors)
+        index.close()
+        if not parts:
+            raise SystemExit(f"No vectors in {args.local_index}")
+        return np.vstack(parts)
+    if args.zilliz:
+        from src.module.zillizdb.zilliz_client import ZillizClient
+
+        zilliz = ZillizClient()
+        rows = zilliz.client.query(
+            zilliz.collection_name, filter="event_id >= 0",
+            output_fields=["embedding"], limit=args.zilliz,
+        )
+        zilliz.disconnect_db()
+        return np.array([row["embedding"] for row in rows], dtype=np.float32)
+    raise SystemExit("Pass --vectors, --local-index or --zilliz")
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def _top_k(base, queries, query_rows, k):
+    scores = queries @ base.T
+    # a query is one of the vectors; it must not find itself
+    scores[np.arange(len(queries)), query_rows] = -np.inf
+    return np.argpartition(-scores, k, axis=1)[:, :k]
+
+
+def recall_report(vectors, dims_list, projections, dtypes, queries=200, k=10, seed=0):
+    """Recall@k and bytes per vector of every codec configuration."""
+    rng = np.random.default_rng(seed)
+    query_rows = rng.choice(len(vectors), min(queries, len(vectors)), replace=False)
+    exact = _top_k(_normalize(vectors), _normalize(vectors[query_rows]), query_rows, k)
+    full_dims = vectors.shape[1]
+
+    rows = []
+    for projection in projections:
+        for dims in dims_list:
+            if projection == "none" and dims:
+                continue
+            if projection != "none" and (not dims or dims >= full_dims):
+                continue
+            for dtype in dtypes:
+                codec = VectorCodec.fit(vectors, dims=dims, projection=projection, dtype=dtype)
+                encoded = codec.project(vectors)
+                stored = dequantize(*quantize(encoded, dtype))
+                found = _top_k(stored, encoded[query_rows], query_rows, k)
+                recall = np.mean([
+                    len(set(found[i]) & set(exact[i])) / k for i in range(len(query_rows))
+                ])
+                size = codec.bytes_per_vector(full_dims)
+                store_size = codec.store_bytes_per_vector(full_dims)
+                rows.append({
+                    "codec": codec.version,
+                    "dims": dims or full_dims,
+                    "dtype": dtype,
+                    "local_bytes_per_vector": size,
+                    "local_index_mb": round(size * len(vectors) / 2 ** 20, 2),
+                    "store_bytes_per_vector": store_size,
+                    "store_index_mb": round(store_size * len(vectors) / 2 ** 20, 2),
+                    f"recall@{k}": round(float(recall), 4),
+                })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit an embedding codec or report recall vs size")
+    parser.add_argument("command", choices=["report", "fit"])
+    parser.add_argument("--vectors", help=".npy file of embeddings")
+    parser.add_argument("--local-index", help="local index directory to read embeddings from")
+    parser.add_argument("--zilliz", type=int, help="read up to N embeddings from Zilliz")
+    parser.add_argument("--projection", choices=["none", "truncate", "pca"], default="pca")
+    parser.add_argument("--dims", type=int, nargs="*",
+                        help="target dimensions (0 = unprojected); report defaults to 0 512 256 128 64, "
+                             "fit requires exactly one")
+    parser.add_argument("--dtype", choices=DTYPES, nargs="*", default=list(DTYPES))
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--output", default="embedding_codec.npz", help="codec file written by fit")
+    args = parser.parse_args()
+    if args.command == "fit" and (not args.dims or len(args.dims) != 1):
+        parser.error("fit requires --dims with exactly one value")
+
+    vectors = load_vectors(args)
+    logger.info("LOADED %s VECTORS OF %s DIMENSIONS", len(vectors), vectors.shape[1])
+
+    if args.command == "report":
+        projections = ["none", "truncate", "pca"] if args.projection == "pca" else ["none", args.projection]
+        rows = recall_report(vectors, args.dims or [0, 512, 256, 128, 64], projections, args.dtype, queries=args.queries, k=args.k)
+        print(json.dumps(rows, indent=4))
+        return
+
+    codec = VectorCodec.fit(
+        vectors, dims=args.dims[0] or None,
+        projection=args.projection, dtype=args.dtype[0],
+    )
+    codec.save(args.output)
+    print(f"Wrote codec {codec.version} to {args.output}; set EMBEDDING_CODEC_PATH to use it")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""
+Sync the recommendation graph from MySQL.
+
+    python -m src.cli.graph_sync --mode incremental --interval 300
+"""
+import argparse
+import time
+
+from src.module.recommendation_system.recommend import init_neo4j
+from src.utils.logger import logger
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync the recommendation graph from MySQL")
+    parser.add_argument("--mode", choices=["full", "shadow", "incremental"], default="incremental")
+    parser.add_argument(
+        "--interval", type=float, default=0,
+        help="repeat every INTERVAL seconds; 0 runs once",
+    )
+    args = parser.parse_args()
+
+    while True:
+        try:
+            # the process may exit right after, so the old version is dropped here
+            init_neo4j(mode=args.mode, defer_gc=False)
+        except Exception as e:
+            if not args.interval:
+                raise
+            logger.error("GRAPH SYNC FAILED: %s", e)
+        if not args.interval:
+            return
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Bulk-ingest events into the related-items vector store.
+
+    python -m src.cli.ingest_related_events events.jsonl --batch-size 500
+
+The input is a JSON array of events or one JSON event per line, with the
+fields of RelatedItemModel. Events that failed are written to --failed.
+--tags-only fills the tag index of hybrid retrieval without embedding.
+"""
+import argparse
+import json
+
+from src.config.constant import RelatedItemsCFG
+from src.models.related_item_model import RelatedItemModel
+from src.module.related_items.related_events import insert_events_to_zilliz
+from src.module.related_items.tag_index import get_tag_index
+from src.utils.logger import logger
+
+
+def read_events(path):
+    with open(path, encoding="utf-8") as file:
+        content = file.read().strip()
+    if content.startswith("["):
+        rows = json.loads(content)
+    else:
+        rows = [json.loads(line) for line in content.splitlines() if line.strip()]
+    return [RelatedItemModel(**row) for row in rows]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest events for related items")
+    parser.add_argument("path", help="JSON or JSON-lines file of events")
+    parser.add_argument("--batch-size", type=int, default=RelatedItemsCFG.INGEST_BATCH_SIZE)
+    parser.add_argument("--failed", help="write the ids and errors of failed events to this file")
+    parser.add_argument(
+        "--tags-only", action="store_true",
+        help="only index the tags of events already in the vector store",
+    )
+    args = parser.parse_args()
+
+    events = read_events(args.path)
+    if args.tags_only:
+        get_tag_index().set_many([(event.event_id, event.event_tags) for event in events])
+        print(json.dumps(get_tag_index().stats(), indent=4))
+        return
+    logger.info("INGESTING %s EVENTS FROM %s", len(events), args.path)
+    response = insert_events_to_zilliz(events, batch_size=args.batch_size)
+
+    failed = [result for result in response["results"] if not result["status"]]
+    if args.failed and failed:
+        with open(args.failed, "w", encoding="utf-8") as file:
+            for result in failed:
+                file.write(json.dumps(result) + "\n")
+    print(json.dumps(response["stats"], indent=4))
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Precompute the recommendations of every user into the recommendation store.
+
+    python -m src.cli.precompute_recommendations --k 50 --workers 4
+"""
+import argparse
+import time
+
+from src.config.constant import RecommendationCFG
+from src.module.recommendation_system.neo4j_pool import (close_neo4j_pool,
+                                                         init_neo4j_pool)
+from src.module.recommendation_system.precompute import \
+    precompute_recommendations
+from src.utils.logger import logger
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute recommendations of every user")
+    parser.add_argument("--k", type=int, default=RecommendationCFG.PRECOMPUTE_K)
+    parser.add_argument("--chunk-size", type=int, default=RecommendationCFG.PRECOMPUTE_CHUNK_SIZE)
+    parser.add_argument("--workers", type=int, default=RecommendationCFG.PRECOMPUTE_WORKERS)
+    parser.add_argument(
+        "--restart", action="store_true",
+        help="ignore the checkpoint of an interrupted run",
+    )
+    parser.add_argument(
+        "--interval", type=float, default=0,
+        help="repeat every INTERVAL seconds; 0 runs once",
+    )
+    args = parser.parse_args()
+
+    init_neo4j_pool()
+    try:
+        while True:
+            try:
+                precompute_recommendations(
+                    k=args.k, restart=args.restart,
+                    chunk_size=args.chunk_size, workers=args.workers,
+                )
+            except Exception as e:
+                if not args.interval:
+                    raise
+                logger.error("PRECOMPUTE FAILED: %s", e)
+            if not args.interval:
+                return
+            time.sleep(args.interval)
+    finally:
+        close_neo4j_pool()
+
+
+if __name__ == "__main__":
+    main()
@@ -9,10 +9,126 @@ class GeminiAiCFG:
     API_EMBEDDING_MODEL = os.getenv("GEMINI_API_EMBEDDING_MODEL", "models/embedding-001")
 
 
+class EmbeddingCFG:
+    CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+    CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embeddings.sqlite3")
+    CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "10000"))
+    CACHE_MEMORY_TTL = float(os.getenv("EMBEDDING_CACHE_MEMORY_TTL", "86400"))
+    # bytes of packed vectors kept on disk before least recently used ones are evicted
+    CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+    # texts per batchEmbedContents request (API limit 100) and requests in flight
+    BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+    CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+    # codec file written by src.cli.embedding_codec (projection and storage dtype);
+    # without one, vectors are stored unprojected as CODEC_DTYPE. The dtype only
+    # applies to the local index, Zilliz and Mongo always get float32 vectors
+    CODEC_PATH = os.getenv("EMBEDDING_CODEC_PATH", "")
+    CODEC_DTYPE = os.getenv("EMBEDDING_CODEC_DTYPE", "float32")
+
+
+class RelatedItemsCFG:
+    # events embedded and written to the vector store per batch by bulk ingestion
+    INGEST_BATCH_SIZE = int(os.getenv("RELATED_ITEMS_INGEST_BATCH_SIZE", "500"))
+    # "zilliz" uses the managed cluster, "local" the in-process IVF index
+    VECTOR_BACKEND = os.getenv("RELATED_ITEMS_VECTOR_BACKEND", "zilliz")
+    # related-event results per normalized query, invalidated when events are inserted
+    CACHE_ENABLED = os.getenv("RELATED_ITEMS_CACHE_ENABLED", "true").lower() == "true"
+    CACHE_MAX_ENTRIES = int(os.getenv("RELATED_ITEMS_CACHE_MAX_ENTRIES", "10000"))
+    CACHE_TTL = float(os.getenv("RELATED_ITEMS_CACHE_TTL", "600"))
+    # tag -> event ids index used by hybrid retrieval
+    TAG_INDEX_PATH = os.getenv("RELATED_ITEMS_TAG_INDEX_PATH", "related_tags.sqlite3")
+    # hybrid retrieval: events sharing tags that are ranked (and searched densely),
+    # dense candidates fetched per result, and the reciprocal rank fusion constant
+    HYBRID_TAG_CANDIDATES = int(os.getenv("RELATED_ITEMS_HYBRID_TAG_CANDIDATES", "1000"))
+    HYBRID_VECTOR_OVERFETCH = int(os.getenv("RELATED_ITEMS_HYBRID_VECTOR_OVERFETCH", "4"))
+    # "sync" embeds and inserts in the request, "queued" uses the durable ingest queue
+    INSERT_MODE = os.getenv("RELATED_ITEMS_INSERT_MODE", "sync")
+    QUEUE_PATH = os.getenv("RELATED_ITEMS_QUEUE_PATH", "related_ingest_queue.sqlite3")
+    QUEUE_BATCH_SIZE = int(os.getenv("RELATED_ITEMS_QUEUE_BATCH_SIZE", "100"))
+    QUEUE_POLL_INTERVAL = float(os.getenv("RELATED_ITEMS_QUEUE_POLL_INTERVAL", "1"))
+    # seconds the worker waits after an enqueue so that concurrent inserts share a batch
+    QUEUE_LINGER = float(os.getenv("RELATED_ITEMS_QUEUE_LINGER", "0.2"))
+    # failed events are retried after BACKOFF_BASE * 2^(attempts - 1) seconds (at most
+    # BACKOFF_MAX) and dead-lettered after MAX_ATTEMPTS
+    QUEUE_MAX_ATTEMPTS = int(os.getenv("RELATED_ITEMS_QUEUE_MAX_ATTEMPTS", "5"))
+    QUEUE_BACKOFF_BASE = float(os.getenv("RELATED_ITEMS_QUEUE_BACKOFF_BASE", "2"))
+    QUEUE_BACKOFF_MAX = float(os.getenv("RELATED_ITEMS_QUEUE_BACKOFF_MAX", "300"))
+    # events claimed by a worker that died are handed out again after this many seconds
+    QUEUE_CLAIM_TIMEOUT = float(os.getenv("RELATED_ITEMS_QUEUE_CLAIM_TIMEOUT", "600"))
+    QUEUE_DONE_RETENTION = float(os.getenv("RELATED_ITEMS_QUEUE_DONE_RETENTION", "86400"))
+    HYBRID_RRF_K = int(os.getenv("RELATED_ITEMS_HYBRID_RRF_K", "60"))
+
+
+class LocalIndexCFG:
+    PATH = os.getenv("LOCAL_INDEX_PATH", "related_index")
+    # clusters of the IVF index (0 = sqrt of the number of vectors) and clusters scanned per query
+    NLIST = int(os.getenv("LOCAL_INDEX_NLIST", "0"))
+    NPROBE = int(os.getenv("LOCAL_INDEX_NPROBE", "8"))
+    KMEANS_ITERATIONS = int(os.getenv("LOCAL_INDEX_KMEANS_ITERATIONS", "10"))
+    # seconds between checks for adds/deletes made by other workers
+    REFRESH_INTERVAL = float(os.getenv("LOCAL_INDEX_REFRESH_INTERVAL", "2"))
+    # adds/deletes are folded into a new segment every COMPACT_INTERVAL seconds,
+    # or sooner once COMPACT_MAX_DELTA of them are pending
+    COMPACT_INTERVAL = float(os.getenv("LOCAL_INDEX_COMPACT_INTERVAL", "3600"))
+    COMPACT_MAX_DELTA = int(os.getenv("LOCAL_INDEX_COMPACT_MAX_DELTA", "5000"))
+
+
 class Neo4jCFG:
     URL = os.environ["NEO4J_URL"]
     USERNAME = os.environ["NEO4J_USERNAME"]
     PASSWORD = os.environ["NEO4J_PASSWORD"]
+    MAX_CONNECTION_POOL_SIZE = int(os.getenv("NEO4J_MAX_CONNECTION_POOL_SIZE", "50"))
+    CONNECTION_ACQUISITION_TIMEOUT = float(os.getenv("NEO4J_CONNECTION_ACQUISITION_TIMEOUT", "10"))
+    MAX_CONNECTION_LIFETIME = float(os.getenv("NEO4J_MAX_CONNECTION_LIFETIME", "3600"))
+
+
+class RecommendationCFG:
+    UPSERT_BATCH_SIZE = int(os.getenv("RECOMMENDATION_UPSERT_BATCH_SIZE", "500"))
+    # "sync" writes each interaction immediately, "buffered" uses the write-behind buffer
+    INTERACTION_WRITE_MODE = os.getenv("RECOMMENDATION_INTERACTION_WRITE_MODE", "sync")
+    INTERACTION_BUFFER_MAX_SIZE = int(os.getenv("RECOMMENDATION_INTERACTION_BUFFER_MAX_SIZE", "10000"))
+    INTERACTION_BUFFER_PUT_TIMEOUT = float(os.getenv("RECOMMENDATION_INTERACTION_BUFFER_PUT_TIMEOUT", "2"))
+    INTERACTION_FLUSH_BATCH_SIZE = int(os.getenv("RECOMMENDATION_INTERACTION_FLUSH_BATCH_SIZE", "500"))
+    INTERACTION_FLUSH_INTERVAL = float(os.getenv("RECOMMENDATION_INTERACTION_FLUSH_INTERVAL", "1"))
+    # after a failed flush the flusher waits FLUSH_INTERVAL seconds, doubling up to this
+    INTERACTION_FLUSH_BACKOFF_MAX = float(os.getenv("RECOMMENDATION_INTERACTION_FLUSH_BACKOFF_MAX", "30"))
+    CACHE_ENABLED = os.getenv("RECOMMENDATION_CACHE_ENABLED", "true").lower() == "true"
+    CACHE_MAX_ENTRIES = int(os.getenv("RECOMMENDATION_CACHE_MAX_ENTRIES", "10000"))
+    CACHE_TTL = float(os.getenv("RECOMMENDATION_CACHE_TTL", "300"))
+    # number of most similar users whose events are recommended
+    NEIGHBOURS = int(os.getenv("RECOMMENDATION_NEIGHBOURS", "10"))
+    # nodes with more relationships are not expanded when generating candidates (0 = no cap)
+    CANDIDATE_MAX_HUB_DEGREE = int(os.getenv("RECOMMENDATION_CANDIDATE_MAX_HUB_DEGREE", "0"))
+    CANDIDATE_FAN_OUT = int(os.getenv("RECOMMENDATION_CANDIDATE_FAN_OUT", "5000"))
+    # "cypher" runs the query in Neo4j, "sparse" uses the in-process sparse matrix engine
+    BACKEND = os.getenv("RECOMMENDATION_BACKEND", "cypher")
+    SPARSE_FOLD_INTERVAL = float(os.getenv("RECOMMENDATION_SPARSE_FOLD_INTERVAL", "1"))
+    SPARSE_RELOAD_INTERVAL = float(os.getenv("RECOMMENDATION_SPARSE_RELOAD_INTERVAL", "3600"))
+    # batch endpoint: users per query / engine pass, chunks evaluated at once, users per request
+    BATCH_CHUNK_SIZE = int(os.getenv("RECOMMENDATION_BATCH_CHUNK_SIZE", "200"))
+    BATCH_CONCURRENCY = int(os.getenv("RECOMMENDATION_BATCH_CONCURRENCY", "4"))
+    BATCH_MAX_USERS = int(os.getenv("RECOMMENDATION_BATCH_MAX_USERS", "100000"))
+    # precomputed recommendations (src.cli.precompute_recommendations), served before live scoring
+    STORE_ENABLED = os.getenv("RECOMMENDATION_STORE_ENABLED", "false").lower() == "true"
+    STORE_PATH = os.getenv("RECOMMENDATION_STORE_PATH", "recommendations.sqlite3")
+    PRECOMPUTE_K = int(os.getenv("RECOMMENDATION_PRECOMPUTE_K", os.getenv("RECOMMENDATION_PAGE_DEPTH", "100")))
+    PRECOMPUTE_CHUNK_SIZE = int(os.getenv("RECOMMENDATION_PRECOMPUTE_CHUNK_SIZE", "500"))
+    PRECOMPUTE_WORKERS = int(os.getenv("RECOMMENDATION_PRECOMPUTE_WORKERS", "4"))
+    # users with at most this many viewed/liked events get popular events of their categories
+    COLD_START_ENABLED = os.getenv("RECOMMENDATION_COLD_START_ENABLED", "true").lower() == "true"
+    COLD_START_MAX_INTERACTIONS = int(os.getenv("RECOMMENDATION_COLD_START_MAX_INTERACTIONS", "3"))
+    COLD_START_RELOAD_INTERVAL = float(os.getenv("RECOMMENDATION_COLD_START_RELOAD_INTERVAL", "900"))
+    # popularity changes are batched and the affected categories re-ranked at most this often
+    COLD_START_RERANK_INTERVAL = float(os.getenv("RECOMMENDATION_COLD_START_RERANK_INTERVAL", "5"))
+    # length of the ranked list the first page computes, later pages are served from it
+    PAGE_DEPTH = int(os.getenv("RECOMMENDATION_PAGE_DEPTH", "100"))
+    PAGE_MAX_K = int(os.getenv("RECOMMENDATION_PAGE_MAX_K", "100"))
+    # users whose interactions this worker skips on later pages / lifetime of a cursor
+    PAGE_CACHE_MAX_ENTRIES = int(os.getenv("RECOMMENDATION_PAGE_CACHE_MAX_ENTRIES", "10000"))
+    PAGE_CACHE_TTL = float(os.getenv("RECOMMENDATION_PAGE_CACHE_TTL", "1800"))
+    # signs cursors so any worker can serve the next page; must be the same on all of them
+    # and a dedicated random value, since clients see payloads together with their tags
+    PAGE_CURSOR_SECRET = os.environ["RECOMMENDATION_PAGE_CURSOR_SECRET"]
 
 
 class MongodbCFG:
@@ -22,6 +138,11 @@ class MongodbCFG:
     MONGODB_NAME = os.environ["MONGODB_NAME"]
     MONGODB_COLLECTION_NAME_RELATED_EVENT = os.environ["MONGODB_COLLECTION_NAME_RELATED_EVENT"]
     MONGODB_INDEX_NAME_RELATED_EVENT = os.environ["MONGODB_INDEX_NAME_RELATED_EVENT"]
+    MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+    MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+    CONNECT_TIMEOUT_MS = int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000"))
+    SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000"))
+    SOCKET_TIMEOUT_MS = int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "10000"))
 
 class ZillizCFG:
     ZILLIZDB_USERNAME = os.environ["ZILLIZDB_USERNAME"]
@@ -29,6 +150,9 @@ class ZillizCFG:
     ZILLIZDB_HOST = os.environ["ZILLIZDB_HOST"]
     ZILLIZDB_PORT = os.environ["ZILLIZDB_PORT"]
     ZILLIZDB_COLLECTION_NAME_RELATED_EVENT = os.environ["ZILLIZDB_COLLECTION_NAME_RELATED_EVENT"]
+    # seconds to wait for the connection and for each insert/search call
+    CONNECT_TIMEOUT = float(os.getenv("ZILLIZDB_CONNECT_TIMEOUT", "10"))
+    REQUEST_TIMEOUT = float(os.getenv("ZILLIZDB_REQUEST_TIMEOUT", "10"))
 
 class MysqlCFG:
     MYSQL_HOST = os.environ["MYSQL_HOST"]
@@ -36,3 +160,28 @@ class MysqlCFG:
     MYSQL_PASSWORD = os.environ["MYSQL_PASSWORD"]
     MYSQL_DATABASE = os.environ["MYSQL_DATABASE"]
     MYSQL_PORT = os.environ["MYSQL_PORT"]
+
+
+class GraphSyncCFG:
+    BATCH_SIZE = int(os.getenv("GRAPH_SYNC_BATCH_SIZE", "5000"))
+    MAX_IN_FLIGHT = int(os.getenv("GRAPH_SYNC_MAX_IN_FLIGHT", "4"))
+    PROGRESS_EVERY = int(os.getenv("GRAPH_SYNC_PROGRESS_EVERY", "20"))
+    USER_ID_COLUMN = os.getenv("GRAPH_SYNC_USER_ID_COLUMN", "username")
+    EVENT_ID_COLUMN = os.getenv("GRAPH_SYNC_EVENT_ID_COLUMN", "id")
+    CATEGORY_ID_COLUMN = os.getenv("GRAPH_SYNC_CATEGORY_ID_COLUMN", "id")
+    # column used as high-water mark by the incremental sync (updated_at or an increasing id)
+    USER_WATERMARK_COLUMN = os.getenv("GRAPH_SYNC_USER_WATERMARK_COLUMN", "updated_at")
+    EVENT_WATERMARK_COLUMN = os.getenv("GRAPH_SYNC_EVENT_WATERMARK_COLUMN", "updated_at")
+    CATEGORY_WATERMARK_COLUMN = os.getenv("GRAPH_SYNC_CATEGORY_WATERMARK_COLUMN", "updated_at")
+    # seconds an API worker keeps the live and rebuilding graph versions before re-reading them
+    VERSION_REFRESH_INTERVAL = float(os.getenv("GRAPH_SYNC_VERSION_REFRESH_INTERVAL", "5"))
+    # seconds the previous version is kept after a swap, so in-flight queries finish
+    SHADOW_GC_GRACE = float(os.getenv("GRAPH_SYNC_SHADOW_GC_GRACE", "30"))
+    GC_BATCH_SIZE = int(os.getenv("GRAPH_SYNC_GC_BATCH_SIZE", "10000"))
+    # a shadow graph with fewer edges than this share of the live one is not swapped in
+    MIN_EDGE_RATIO = float(os.getenv("GRAPH_SYNC_MIN_EDGE_RATIO", "0.9"))
+    # implicit VIEWED edges: users per transaction and events per preferred category (0 = all)
+    VIEW_EDGE_USER_BATCH_SIZE = int(os.getenv("GRAPH_SYNC_VIEW_EDGE_USER_BATCH_SIZE", "500"))
+    VIEW_EDGES_PER_CATEGORY = int(os.getenv("GRAPH_SYNC_VIEW_EDGES_PER_CATEGORY", "50"))
+    # "popular" keeps the events with the most views/likes, "recent" the highest ids
+    VIEW_EDGE_ORDER = os.getenv("GRAPH_SYNC_VIEW_EDGE_ORDER", "popular")
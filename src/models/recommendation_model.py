@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import List, Literal, Optional
 
 from pydantic import BaseModel
 
@@ -20,6 +20,15 @@ class RecommendationUserEventEdge(BaseModel):
     user_id: str
     event_id: str
 
+class RecommendationInteractionModel(BaseModel):
+    user_id: str
+    event_id: str
+    type: Literal["view", "like", "unlike"]
+
+class RecommendationBatchModel(BaseModel):
+    user_ids: List[str]
+    k: int = 20
+
 class RecommendationEventResponse(BaseModel):
     event_id: str
 
@@ -30,5 +39,9 @@ class RecommendationUserEventResponse(BaseModel):
     event_id: str
     user_id: str
 
+class RecommendationInteractionResponse(BaseModel):
+    accepted: int
+    buffered: bool
+
 class RecommendationItemResponse(BaseModel):
     item_list: List[str]
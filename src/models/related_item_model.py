@@ -8,3 +8,7 @@ class RelatedItemModel(BaseModel):
     event_name: Optional[str] = ""
     event_tags: Optional[List[str]] = []
     event_description: Optional[str] = ""
+
+
+class RelatedItemBatchModel(BaseModel):
+    events: List[RelatedItemModel]
@@ -0,0 +1,167 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from array import array
+
+from src.config.constant import EmbeddingCFG
+from src.utils.logger import logger
+from src.utils.ttl_cache import TTLCache
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def embedding_key(model, task_type, title, text):
+    """Content address of an embedding: sha256 of (model, task type, title, normalized text)."""
+    text = _WHITESPACE.sub(" ", text).strip()
+    payload = "\x1f".join([model, task_type, title or "", text])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def pack_vector(vector):
+    return array("f", vector).tobytes()
+
+
+def unpack_vector(blob):
+    vector = array("f")
+    vector.frombytes(blob)
+    return vector.tolist()
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache: an in-process LRU in front of a SQLite file
+    shared by the workers of a host. Vectors are stored as packed float32.
+
+    The file is bounded by `max_bytes` of vector data; when it grows past
+    it, the least recently used vectors are evicted down to 90% of it.
+    """
+
+    def __init__(
+        self,
+        path=EmbeddingCFG.CACHE_PATH,
+        memory_entries=EmbeddingCFG.CACHE_MEMORY_ENTRIES,
+        memory_ttl=EmbeddingCFG.CACHE_MEMORY_TTL,
+        max_bytes=EmbeddingCFG.CACHE_MAX_BYTES,
+    ):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._memory = TTLCache(max_entries=memory_entries, ttl=memory_ttl)
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    key TEXT PRIMARY KEY,
+                    vector BLOB NOT NULL,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )""")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)"
+            )
+            self._bytes = self._connection.execute(
+                "SELECT coalesce(sum(size), 0) FROM embeddings"
+            ).fetchone()[0]
+
+    def get(self, key):
+        vector = self._memory.get(key)
+        if vector is not None:
+            self.memory_hits += 1
+            return vector
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT vector FROM embeddings WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._connection.execute(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key)
+                )
+        if row is None:
+            self.misses += 1
+            return None
+        self.disk_hits += 1
+        vector = unpack_vector(row[0])
+        self._memory.set(key, vector)
+        return vector
+
+    def set(self, key, vector):
+        self.set_many([(key, vector)])
+
+    def set_many(self, items):
+        rows = [(key, pack_vector(vector)) for key, vector in items]
+        now = time.time()
+        with self._lock, self._connection:
+            for key, blob in rows:
+                previous = self._connection.execute(
+                    "SELECT size FROM embeddings WHERE key = ?", (key,)
+                ).fetchone()
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?)",
+                    (key, blob, len(blob), now),
+                )
+                self._bytes += len(blob) - (previous[0] if previous else 0)
+            if self._bytes > self.max_bytes:
+                self._evict()
+        for key, vector in items:
+            self._memory.set(key, list(vector))
+
+    def _evict(self):
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        while self._bytes > target:
+            rows = self._connection.execute(
+                "SELECT key, size FROM embeddings ORDER BY last_used LIMIT 500"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self._bytes <= target:
+                    break
+                self._connection.execute("DELETE FROM embeddings WHERE key = ?", (key,))
+                self._memory.pop(key)
+                self._bytes -= size
+                evicted += 1
+        self.evictions += evicted
+        logger.info("EMBEDDING CACHE EVICTED %s VECTORS", evicted)
+
+    def stats(self):
+        with self._lock:
+            entries = self._connection.execute("SELECT count(*) FROM embeddings").fetchone()[0]
+            size = self._bytes
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory": self._memory.stats(),
+            "disk_entries": entries,
+            "disk_bytes": size,
+            "max_bytes": self.max_bytes,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": ((self.memory_hits + self.disk_hits) / lookups) if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Embedding cache of this worker, or None when caching is disabled."""
+    global _cache
+    if _cache is None and EmbeddingCFG.CACHE_ENABLED:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache()
+    return _cache
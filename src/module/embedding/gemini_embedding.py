@@ -1,5 +1,9 @@
+from concurrent.futures import ThreadPoolExecutor
+
 import google.generativeai as genai
-from src.config.constant import GeminiAiCFG
+from src.config.constant import EmbeddingCFG, GeminiAiCFG
+from src.module.embedding.embedding_cache import (embedding_key,
+                                                  get_embedding_cache)
 from src.utils.logger import logger
 
 
@@ -12,17 +16,66 @@ class GeminiEmbeddingModel:
     def get_embedding(self, text: str, task_type, title=""):
         logger.info("TASK TYPE %s", task_type)
         if task_type in "retrieval_query":
-            return genai.embed_content(
+            # the title is not sent for queries, so it is not part of the key either
+            title = ""
+
+        cache = get_embedding_cache()
+        key = embedding_key(self.model, task_type, title, text)
+        if cache is not None:
+            vector = cache.get(key)
+            if vector is not None:
+                return {"embedding": vector}
+
+        if task_type in "retrieval_query":
+            embedding = genai.embed_content(
                 model=self.model,
                 content=text,
                 task_type=task_type,
             )
+        else:
+            embedding = genai.embed_content(
+                model=self.model,
+                content=text,
+                task_type=task_type,
+                title=title
+            )
 
-        embedding = genai.embed_content(
-            model=self.model,
-            content=text,
-            task_type=task_type,
-            title=title
-        )
-
+        if cache is not None:
+            cache.set(key, embedding["embedding"])
         return embedding
+
+    def _embed_batch(self, texts, task_type, title):
+        if task_type in "retrieval_query":
+            return genai.embed_content(model=self.model, content=texts, task_type=task_type)["embedding"]
+        return genai.embed_content(
+            model=self.model, content=texts, task_type=task_type, title=title
+        )["embedding"]
+
+    def get_embeddings(self, texts, task_type, title=""):
+        """
+        Embeddings of many texts, in the order given. Cached texts are not
+        sent; the rest go out as batchEmbedContents requests of BATCH_SIZE
+        texts, up to CONCURRENCY at a time.
+        """
+        logger.info("TASK TYPE %s, %s TEXTS", task_type, len(texts))
+        if task_type in "retrieval_query":
+            title = ""
+        cache = get_embedding_cache()
+        keys = [embedding_key(self.model, task_type, title, text) for text in texts]
+        vectors = [cache.get(key) if cache is not None else None for key in keys]
+        missing = [position for position, vector in enumerate(vectors) if vector is None]
+        batches = [
+            missing[start:start + EmbeddingCFG.BATCH_SIZE]
+            for start in range(0, len(missing), EmbeddingCFG.BATCH_SIZE)
+        ]
+        with ThreadPoolExecutor(max_workers=EmbeddingCFG.CONCURRENCY) as executor:
+            results = executor.map(
+                lambda batch: self._embed_batch([texts[p] for p in batch], task_type, title),
+                batches,
+            )
+            for batch, embeddings in zip(batches, results):
+                for position, vector in zip(batch, embeddings):
+                    vectors[position] = vector
+                if cache is not None:
+                    cache.set_many([(keys[p], vectors[p]) for p in batch])
+        return vectors
@@ -0,0 +1,165 @@
+import hashlib
+import threading
+
+import numpy as np
+
+from src.config.constant import EmbeddingCFG
+from src.utils.logger import logger
+
+DTYPES = ("float32", "float16", "int8")
+PROJECTIONS = ("none", "truncate", "pca")
+
+
+def quantize(vectors, dtype):
+    """
+    (codes, scales) of float32 vectors. int8 codes use one scale per
+    vector (max |x| / 127); float32 and float16 have no scales.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dtype == "int8" and len(vectors):
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(vectors / scales[:, None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    if dtype == "int8":
+        return vectors.astype(np.int8), np.empty(0, dtype=np.float32)
+    return vectors.astype(dtype), None
+
+
+def dequantize(codes, scales=None):
+    vectors = np.asarray(codes, dtype=np.float32)
+    if scales is not None:
+        vectors = vectors * np.asarray(scales, dtype=np.float32)[:, None]
+    return vectors
+
+
+def quantized_scores(codes, scales, query):
+    """Dot products of quantized vectors with a float32 query."""
+    scores = np.asarray(codes, dtype=np.float32) @ query
+    if scales is not None:
+        scores = scores * scales
+    return scores
+
+
+def _normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+class VectorCodec:
+    """
+    Encoding of embeddings between GeminiEmbeddingModel and the vector
+    stores: an optional projection to `dims` dimensions (truncation or a
+    fitted PCA), then L2 normalization; `dtype` is the scalar type vectors
+    are stored as where the store supports it (the local index).
+
+    Document and query vectors must go through the same codec. Its
+    `version` names the projection and changes whenever it is refitted; it
+    is stored with the documents and local index segments it encoded.
+    """
+
+    def __init__(self, projection="none", dims=None, dtype="float32", mean=None, components=None):
+        if projection not in PROJECTIONS:
+            raise ValueError(f"Unknown projection {projection!r}")
+        if dtype not in DTYPES:
+            raise ValueError(f"Unknown dtype {dtype!r}")
+        self.projection = projection
+        self.dims = dims
+        self.dtype = dtype
+        self.mean = None if mean is None else np.asarray(mean, dtype=np.float32)
+        self.components = None if components is None else np.asarray(components, dtype=np.float32)
+
+    @classmethod
+    def fit(cls, vectors, dims=None, projection="pca", dtype="float32"):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if projection != "pca" or not dims:
+            return cls(projection=projection if dims else "none", dims=dims, dtype=dtype)
+        mean = vectors.mean(axis=0)
+        # principal axes are the right singular vectors of the centred sample
+        _, _, vt = np.linalg.svd(vectors - mean, full_matrices=False)
+        return cls(projection="pca", dims=dims, dtype=dtype, mean=mean, components=vt[:dims])
+
+    @property
+    def identity(self):
+        return self.projection == "none" and self.dtype == "float32"
+
+    @property
+    def version(self):
+        if self.projection == "none":
+            return f"none-{self.dtype}"
+        name = f"{self.projection}{self.dims}-{self.dtype}"
+        if self.projection == "pca":
+            digest = hashlib.sha256(self.components.tobytes() + self.mean.tobytes()).hexdigest()
+            name = f"{name}-{digest[:8]}"
+        return name
+
+    def project(self, vectors):
+        """Projected, L2-normalized float32 vectors."""
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if self.projection == "truncate":
+            vectors = vectors[:, :self.dims]
+        elif self.projection == "pca":
+            vectors = (vectors - self.mean) @ self.components.T
+        return _normalize(vectors)
+
+    def encode(self, vector):
+        """
+        One embedding as the list of floats sent to the vector stores.
+        Always float32: Zilliz and Mongo store the projected vectors
+        unquantized, only the local index applies `dtype`.
+        """
+        if self.projection == "none":
+            return list(vector)
+        return self.project(vector)[0].tolist()
+
+    def bytes_per_vector(self, dims):
+        """Stored size of one vector in the local index."""
+        dims = self.dims or dims
+        return dims * np.dtype(self.dtype).itemsize + (4 if self.dtype == "int8" else 0)
+
+    def store_bytes_per_vector(self, dims):
+        """Size of one vector in Zilliz or Mongo: the projection applies, the dtype does not."""
+        return (self.dims or dims) * np.dtype(np.float32).itemsize
+
+    def save(self, path):
+        arrays = {}
+        if self.projection == "pca":
+            arrays = {"mean": self.mean, "components": self.components}
+        with open(path, "wb") as file:
+            np.savez(
+                file,
+                projection=self.projection,
+                dims=self.dims or 0,
+                dtype=self.dtype,
+                **arrays,
+            )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                projection=str(data["projection"]),
+                dims=int(data["dims"]) or None,
+                dtype=str(data["dtype"]),
+                mean=data["mean"] if "mean" in data else None,
+                components=data["components"] if "components" in data else None,
+            )
+
+
+_codec = None
+_codec_lock = threading.Lock()
+
+
+def get_vector_codec():
+    """Codec of this deployment: loaded from EMBEDDING_CODEC_PATH, or the identity codec."""
+    global _codec
+    if _codec is None:
+        with _codec_lock:
+            if _codec is None:
+                if EmbeddingCFG.CODEC_PATH:
+                    _codec = VectorCodec.load(EmbeddingCFG.CODEC_PATH)
+                else:
+                    _codec = VectorCodec(dtype=EmbeddingCFG.CODEC_DTYPE)
+                logger.info("VECTOR CODEC %s", _codec.version)
+    return _codec
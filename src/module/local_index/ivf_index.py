@@ -0,0 +1,418 @@
+import fcntl
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from src.config.constant import LocalIndexCFG
+from src.module.embedding.vector_codec import (dequantize, quantize,
+                                               quantized_scores)
+from src.utils.logger import logger
+
+CURRENT = "CURRENT"
+_ASSIGN_CHUNK = 65536
+
+
+def normalize(vectors):
+    vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def assign_clusters(vectors, centroids):
+    """Index of the most similar centroid of every (normalized) vector."""
+    assign = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), _ASSIGN_CHUNK):
+        chunk = vectors[start:start + _ASSIGN_CHUNK]
+        assign[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assign
+
+
+def train_centroids(vectors, nlist, iterations, seed=0):
+    """Spherical k-means on a sample of at most 256 vectors per cluster."""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > nlist * 256:
+        vectors = vectors[np.sort(rng.choice(len(vectors), nlist * 256, replace=False))]
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = assign_clusters(vectors, centroids)
+        members = csr_matrix(
+            (np.ones(len(vectors), dtype=np.float32), (assign, np.arange(len(vectors)))),
+            shape=(nlist, len(vectors)),
+        )
+        sums = np.asarray(members @ vectors)
+        empty = np.asarray(members.sum(axis=1)).ravel() == 0
+        # an empty cluster restarts from a random vector
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+        centroids = normalize(sums)
+    return centroids
+
+
+class _Segment:
+    """
+    Immutable, memory-mapped IVF segment: vectors sorted by cluster, with
+    `offsets[c]:offsets[c + 1]` the rows of cluster c. Workers mapping the
+    same files share their pages through the OS page cache.
+
+    Vectors are stored as float32, float16 or int8 codes with one scale
+    per row (scales.npy).
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._order = None
+        if path is None:
+            self.name = None
+            self.meta = {"seq": 0, "dim": None, "count": 0, "nlist": 0, "dtype": None, "codec": None}
+            self.ids = np.empty(0, dtype=np.int64)
+            return
+        self.name = os.path.basename(path)
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as file:
+            self.meta = json.load(file)
+        self.ids = np.load(os.path.join(path, "ids.npy"), mmap_mode="r")
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        scales = os.path.join(path, "scales.npy")
+        self.scales = np.load(scales, mmap_mode="r") if os.path.exists(scales) else None
+        self.centroids = np.load(os.path.join(path, "centroids.npy"))
+        self.offsets = np.load(os.path.join(path, "offsets.npy"))
+
+    def search(self, query, nprobe):
+        """(ids, scores) of the rows in the `nprobe` clusters closest to the query."""
+        if not len(self.ids):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        probe = np.argsort(-(self.centroids @ query))[:nprobe]
+        ids, scores = [], []
+        for cluster in probe:
+            start, end = self.offsets[cluster], self.offsets[cluster + 1]
+            if start < end:
+                ids.append(self.ids[start:end])
+                scales = self.scales[start:end] if self.scales is not None else None
+                scores.append(quantized_scores(self.vectors[start:end], scales, query))
+        if not ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return np.concatenate(ids), np.concatenate(scores)
+
+    def lookup(self, event_id):
+        """Stored (normalized) vector of an event, or None."""
+        if not len(self.ids):
+            return None
+        if self._order is None:
+            self._order = np.argsort(self.ids)
+        position = np.searchsorted(self.ids, event_id, sorter=self._order)
+        if position == len(self.ids) or self.ids[self._order[position]] != event_id:
+            return None
+        row = self._order[position]
+        return dequantize(
+            self.vectors[row:row + 1], self.scales[row:row + 1] if self.scales is not None else None
+        )[0]
+
+    def dense(self):
+        """All vectors as float32, in row order."""
+        if not len(self.ids):
+            return np.empty((0, 0), dtype=np.float32)
+        return dequantize(self.vectors, self.scales)
+
+    @staticmethod
+    def write(directory, ids, vectors, nlist, iterations, seq, dtype="float32", codec=None):
+        """Cluster the vectors and write a new segment under `directory`; returns its path."""
+        name = f"segment-{seq:012d}-{uuid.uuid4().hex[:8]}"
+        path = os.path.join(directory, name)
+        tmp = path + ".tmp"
+        os.makedirs(tmp)
+        if len(ids):
+            nlist = min(nlist or int(np.sqrt(len(ids))) or 1, len(ids))
+            centroids = train_centroids(vectors, nlist, iterations)
+            assign = assign_clusters(vectors, centroids)
+            order = np.argsort(assign, kind="stable")
+            ids, vectors = ids[order], vectors[order]
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))])
+        else:
+            nlist = 0
+            centroids = np.empty((0, vectors.shape[1] if vectors.ndim == 2 else 0), dtype=np.float32)
+            offsets = np.zeros(1, dtype=np.int64)
+        np.save(os.path.join(tmp, "ids.npy"), np.ascontiguousarray(ids, dtype=np.int64))
+        codes, scales = quantize(vectors, dtype)
+        np.save(os.path.join(tmp, "vectors.npy"), np.ascontiguousarray(codes))
+        if scales is not None:
+            np.save(os.path.join(tmp, "scales.npy"), scales)
+        np.save(os.path.join(tmp, "centroids.npy"), centroids.astype(np.float32))
+        np.save(os.path.join(tmp, "offsets.npy"), offsets.astype(np.int64))
+        meta = {
+            "seq": seq,
+            "dim": int(vectors.shape[1]) if vectors.ndim == 2 and len(ids) else None,
+            "count": int(len(ids)),
+            "nlist": int(nlist),
+            "dtype": dtype,
+            "codec": codec,
+            "created_at": time.time(),
+        }
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as file:
+            json.dump(meta, file)
+        os.rename(tmp, path)
+        return path
+
+
+class IVFIndex:
+    """
+    Cosine-similarity IVF index over event embeddings, stored under `path`.
+
+    Searchable vectors live in an immutable memory-mapped segment plus a
+    delta of adds and deletes kept in a SQLite log shared by the workers of
+    the host. Every worker replays the log entries it has not seen at most
+    every `refresh_interval` seconds (and right after its own writes).
+
+    `compact` folds the log into a new segment and re-clusters it; the
+    CURRENT file names the live segment and is swapped atomically, so
+    workers pick the new segment up on their next refresh. Only one
+    process compacts at a time (flock on compact.lock).
+    """
+
+    def __init__(
+        self,
+        path=LocalIndexCFG.PATH,
+        nprobe=LocalIndexCFG.NPROBE,
+        refresh_interval=LocalIndexCFG.REFRESH_INTERVAL,
+        dtype="float32",
+        codec_version=None,
+    ):
+        self.path = path
+        self.dtype = dtype
+        self.codec_version = codec_version
+        self.nprobe = nprobe
+        self.refresh_interval = refresh_interval
+        os.makedirs(path, exist_ok=True)
+        self._connection = sqlite3.connect(
+            os.path.join(path, "delta.sqlite3"), check_same_thread=False, timeout=30
+        )
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS delta (
+                    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                    event_id INTEGER NOT NULL,
+                    vector BLOB
+                )""")
+        self._segment = _Segment()
+        self._seq = 0
+        self._delta = {}
+        self._delta_ids = np.empty(0, dtype=np.int64)
+        self._delta_added_ids = np.empty(0, dtype=np.int64)
+        self._delta_vectors = None
+        self._refreshed_at = 0.0
+        self.searches = 0
+        self.refresh(force=True)
+
+    # ---------- log replay ----------
+
+    def _current_segment_path(self):
+        try:
+            with open(os.path.join(self.path, CURRENT), encoding="utf-8") as file:
+                name = file.read().strip()
+        except FileNotFoundError:
+            return None
+        return os.path.join(self.path, name) if name else None
+
+    def refresh(self, force=False):
+        if not force and time.monotonic() - self._refreshed_at < self.refresh_interval:
+            return
+        with self._lock:
+            segment_path = self._current_segment_path()
+            changed = segment_path != self._segment.path
+            if changed:
+                self._segment = _Segment(segment_path)
+                self._seq = self._segment.meta["seq"]
+                self._delta = {}
+            rows = self._connection.execute(
+                "SELECT seq, event_id, vector FROM delta WHERE seq > ? ORDER BY seq", (self._seq,)
+            ).fetchall()
+            for seq, event_id, blob in rows:
+                self._delta[event_id] = (
+                    np.frombuffer(blob, dtype=np.float32) if blob is not None else None
+                )
+                self._seq = seq
+            if changed or rows:
+                added = [(event_id, vector) for event_id, vector in self._delta.items() if vector is not None]
+                self._delta_ids = np.fromiter(self._delta, dtype=np.int64, count=len(self._delta))
+                self._delta_added_ids = np.array([event_id for event_id, _ in added], dtype=np.int64)
+                self._delta_vectors = np.vstack([vector for _, vector in added]) if added else None
+            self._refreshed_at = time.monotonic()
+
+    # ---------- writes ----------
+
+    def add(self, event_ids, vectors):
+        """Add or replace the vectors of `event_ids`."""
+        vectors = normalize(vectors)
+        dim = self._segment.meta["dim"]
+        if dim is None and self._delta_vectors is not None:
+            dim = self._delta_vectors.shape[1]
+        if dim is not None and vectors.shape[1] != dim:
+            raise ValueError(f"Expected {dim}-dimensional vectors, got {vectors.shape[1]}")
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO delta (event_id, vector) VALUES (?, ?)",
+                [(int(event_id), vector.tobytes()) for event_id, vector in zip(event_ids, vectors)],
+            )
+        self.refresh(force=True)
+
+    def delete(self, event_ids):
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO delta (event_id, vector) VALUES (?, NULL)",
+                [(int(event_id),) for event_id in event_ids],
+            )
+        self.refresh(force=True)
+
+    def pending(self):
+        """Log entries not yet folded into a segment."""
+        with self._lock:
+            return self._connection.execute("SELECT count(*) FROM delta").fetchone()[0]
+
+    # ---------- queries ----------
+
+    def get_vector(self, event_id):
+        """Indexed vector of an event, or None when it is not in the index."""
+        self.refresh()
+        event_id = int(event_id)
+        with self._lock:
+            segment = self._segment
+            if event_id in self._delta:
+                return self._delta[event_id]
+        return segment.lookup(event_id)
+
+    def search(self, vector, k=16, exclude=None):
+        """[(event_id, cosine similarity)] of the `k` most similar events, except `exclude`."""
+        self.refresh()
+        query = normalize(vector)[0]
+        with self._lock:
+            segment = self._segment
+            delta_ids = self._delta_ids
+            added_ids = self._delta_added_ids
+            added_vectors = self._delta_vectors
+        self.searches += 1
+        ids, scores = segment.search(query, self.nprobe)
+        if len(delta_ids) and len(ids):
+            # rows replaced or deleted since the segment was written
+            keep = ~np.isin(ids, delta_ids)
+            ids, scores = ids[keep], scores[keep]
+        if added_vectors is not None:
+            ids = np.concatenate([ids, added_ids])
+            scores = np.concatenate([scores, added_vectors @ query])
+        if exclude is not None:
+            keep = ids != int(exclude)
+            ids, scores = ids[keep], scores[keep]
+        if len(ids) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return [(int(ids[i]), float(scores[i])) for i in order]
+
+    def search_ids(self, vector, event_ids, k=16, exclude=None):
+        """Exact search restricted to `event_ids`; ids not in the index are skipped."""
+        query = normalize(vector)[0]
+        hits = []
+        for event_id in event_ids:
+            if exclude is not None and int(event_id) == int(exclude):
+                continue
+            stored = self.get_vector(event_id)
+            if stored is not None:
+                hits.append((int(event_id), float(stored @ query)))
+        hits.sort(key=lambda hit: -hit[1])
+        return hits[:k]
+
+    # ---------- compaction ----------
+
+    def compact(self, nlist=LocalIndexCFG.NLIST, iterations=LocalIndexCFG.KMEANS_ITERATIONS):
+        """
+        Fold the log into a new segment. Returns its stats, or None when
+        another process is compacting or there is nothing to fold.
+        """
+        with open(os.path.join(self.path, "compact.lock"), "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return None
+            start = time.perf_counter()
+            previous = _Segment(self._current_segment_path())
+            with self._lock:
+                rows = self._connection.execute(
+                    "SELECT seq, event_id, vector FROM delta WHERE seq > ? ORDER BY seq",
+                    (previous.meta["seq"],),
+                ).fetchall()
+            if not rows:
+                return None
+            seq = rows[-1][0]
+            delta = {}
+            for _, event_id, blob in rows:
+                delta[event_id] = np.frombuffer(blob, dtype=np.float32) if blob is not None else None
+
+            keep = ~np.isin(previous.ids, np.fromiter(delta, dtype=np.int64, count=len(delta)))
+            added = [(event_id, vector) for event_id, vector in delta.items() if vector is not None]
+            ids = np.concatenate([
+                np.asarray(previous.ids)[keep],
+                np.array([event_id for event_id, _ in added], dtype=np.int64),
+            ])
+            parts = [previous.dense()[keep]] if len(previous.ids) else []
+            if added:
+                parts.append(np.vstack([vector for _, vector in added]))
+            vectors = np.vstack(parts) if parts else np.empty((0, 0), dtype=np.float32)
+
+            segment_path = _Segment.write(
+                self.path, ids, vectors, nlist, iterations, seq,
+                dtype=self.dtype, codec=self.codec_version,
+            )
+            tmp = os.path.join(self.path, CURRENT + ".tmp")
+            with open(tmp, "w", encoding="utf-8") as file:
+                file.write(os.path.basename(segment_path))
+            os.replace(tmp, os.path.join(self.path, CURRENT))
+            with self._lock, self._connection:
+                self._connection.execute("DELETE FROM delta WHERE seq <= ?", (seq,))
+            self._remove_segments(keep={os.path.basename(segment_path), previous.name})
+
+        self.refresh(force=True)
+        stats = {
+            "segment": os.path.basename(segment_path),
+            "vectors": int(len(ids)),
+            "folded": len(rows),
+            "seconds": round(time.perf_counter() - start, 3),
+        }
+        logger.info(
+            "LOCAL INDEX COMPACTED %s LOG ENTRIES INTO %s (%s VECTORS) IN %.2fs",
+            stats["folded"], stats["segment"], stats["vectors"], stats["seconds"],
+        )
+        return stats
+
+    def _remove_segments(self, keep):
+        # the previous segment stays on disk for workers that have not refreshed yet
+        for name in os.listdir(self.path):
+            if name.startswith("segment-") and name not in keep:
+                shutil.rmtree(os.path.join(self.path, name), ignore_errors=True)
+
+    def stats(self):
+        with self._lock:
+            segment = self._segment
+            delta = len(self._delta)
+        return {
+            "path": self.path,
+            "segment": segment.name,
+            "segment_vectors": segment.meta["count"],
+            "nlist": segment.meta["nlist"],
+            "nprobe": self.nprobe,
+            "dim": segment.meta["dim"],
+            "dtype": segment.meta.get("dtype", "float32"),
+            "codec": segment.meta.get("codec"),
+            "delta": delta,
+            "searches": self.searches,
+        }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,148 @@
+import threading
+import time
+
+from src.config.constant import LocalIndexCFG
+from src.module.embedding.gemini_embedding import GeminiEmbeddingModel
+from src.module.embedding.vector_codec import get_vector_codec
+from src.module.local_index.ivf_index import IVFIndex
+from src.utils.logger import logger
+
+
+class LocalIndexClient:
+    """
+    Related-events vector store backed by the in-process IVFIndex, with the
+    interface of ZillizClient. Search results have the shape of Milvus
+    search results: one list of {"id", "distance", "entity"} per query.
+
+    A background thread compacts the index every COMPACT_INTERVAL seconds,
+    or as soon as COMPACT_MAX_DELTA adds/deletes are pending.
+
+    An index built with another codec than this worker's is neither
+    searched, written nor compacted: its vectors are not comparable to
+    the ones this worker encodes.
+    """
+
+    def __init__(
+        self,
+        path=LocalIndexCFG.PATH,
+        compact_interval=LocalIndexCFG.COMPACT_INTERVAL,
+        compact_max_delta=LocalIndexCFG.COMPACT_MAX_DELTA,
+    ):
+        codec = get_vector_codec()
+        self.codec_version = codec.version
+        self.index = IVFIndex(path=path, dtype=codec.dtype, codec_version=codec.version)
+        try:
+            self._check_codec()
+        except RuntimeError as e:
+            logger.error("%s", e)
+        self.compact_interval = compact_interval
+        self.compact_max_delta = compact_max_delta
+        self._compact_requested = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._compact_loop, name="local-index-compaction", daemon=True
+        )
+        self._thread.start()
+
+    def _check_codec(self):
+        segment_codec = self.index.stats()["codec"]
+        if segment_codec is not None and segment_codec != self.codec_version:
+            raise RuntimeError(
+                f"Local index {self.index.path} was built with codec {segment_codec}, not "
+                f"{self.codec_version}: delete it and re-ingest the events"
+            )
+
+    def _compact_loop(self):
+        next_compaction = time.monotonic() + self.compact_interval
+        while not self._stop.is_set():
+            self._compact_requested.wait(max(next_compaction - time.monotonic(), 0))
+            if self._stop.is_set():
+                return
+            self._compact_requested.clear()
+            next_compaction = time.monotonic() + self.compact_interval
+            try:
+                self._check_codec()
+                self.index.compact()
+            except Exception as e:
+                logger.error("LOCAL INDEX COMPACTION FAILED: %s", e)
+
+    def _after_write(self):
+        if self.index.pending() >= self.compact_max_delta:
+            self._compact_requested.set()
+
+    def disconnect_db(self):
+        self._stop.set()
+        self._compact_requested.set()
+        self._thread.join(timeout=5)
+        self.index.close()
+
+    def insert_records(self, records):
+        self._check_codec()
+        self.index.add(
+            [record["event_id"] for record in records],
+            [record["embedding"] for record in records],
+        )
+        self._after_write()
+
+    def delete_records(self, event_ids):
+        self._check_codec()
+        self.index.delete(event_ids)
+        self._after_write()
+
+    def health(self):
+        try:
+            self._check_codec()
+        except RuntimeError as e:
+            return {"status": "error", "error": str(e), **self.index.stats()}
+        return {"status": "ok", **self.index.stats()}
+
+    def get_vector(self, event_id):
+        self._check_codec()
+        vector = self.index.get_vector(event_id)
+        return vector.tolist() if vector is not None else None
+
+    def vector_search(self, query, limit_num=16):
+        embedding = GeminiEmbeddingModel()
+        query_emb = embedding.get_embedding(query, task_type="retrieval_query")
+        query_emb = get_vector_codec().encode(query_emb.get("embedding"))
+        return self.search_vector(query_emb, limit_num=limit_num)
+
+    def search_vector(self, vector, limit_num=16, exclude_event_id=None, event_ids=None):
+        self._check_codec()
+        if event_ids is not None:
+            hits = self.index.search_ids(vector, event_ids, k=limit_num, exclude=exclude_event_id)
+        else:
+            hits = self.index.search(vector, k=limit_num, exclude=exclude_event_id)
+        return [[
+            {"id": event_id, "distance": score, "entity": {"event_id": event_id}}
+            for event_id, score in hits
+        ]]
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def init_local_index_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LocalIndexClient()
+            logger.info("LOCAL INDEX OPENED %s", _client.index.stats())
+        return _client
+
+
+def get_local_index_client():
+    """Shared index for this worker; opened on first use outside the app lifespan."""
+    if _client is None:
+        return init_local_index_client()
+    return _client
+
+
+def close_local_index_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.disconnect_db()
+            _client = None
+            logger.info("LOCAL INDEX CLOSED")
@@ -1,9 +1,13 @@
 import json
+import threading
+import time
+
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 
 from src.config.constant import MongodbCFG
 from src.module.embedding.gemini_embedding import GeminiEmbeddingModel
+from src.module.embedding.vector_codec import get_vector_codec
 from src.utils.logger import logger
 
 
@@ -11,22 +15,12 @@ class MongoDBClient:
 
     def __init__(
         self, 
-        collection_name=MongodbCFG.MONGODB_COLLECTION_NAME_RELATED_EVENT
+        collection_name=MongodbCFG.MONGODB_COLLECTION_NAME_RELATED_EVENT,
+        client=None,
     ):
-        self.client = self.connect_db()
+        self.client = client or get_mongodb_client()
         self.mongo_collection = self.client[MongodbCFG.MONGODB_NAME][collection_name]
 
-    def connect_db(self):
-        uri = f"mongodb+srv://{MongodbCFG.MONGODB_USERNAME}:{MongodbCFG.MONGODB_PASSWORD}@{MongodbCFG.MONGODB_HOST}/?retryWrites=true&w=majority"
-        logger.info("MONGO URI %s", uri)
-        client = MongoClient(uri, server_api=ServerApi("1"))
-        try:
-            client.admin.command("ping")
-            # print("Pinged your deployment. You successfully connected to MongoDB!")
-        except Exception as e:
-            print(e)
-        return client
-
     def reset_db(self):
         self.mongo_collection.delete_many({})
 
@@ -36,17 +30,20 @@ class MongoDBClient:
     def vector_search(self, index_name, query, record_num=100, limit_num=10):
         embedding = GeminiEmbeddingModel()
         query_emb = embedding.get_embedding(query, task_type="retrieval_query")
-        query_emb = query_emb.get("embedding")
+        codec = get_vector_codec()
+        query_emb = codec.encode(query_emb.get("embedding"))
+        vector_search = {
+            "index": index_name,
+            "path": "embedding",
+            "queryVector": query_emb,
+            "numCandidates": record_num,
+            "limit": limit_num,
+        }
+        if not codec.identity:
+            # embedding_codec must be a filter field of the search index
+            vector_search["filter"] = {"embedding_codec": codec.version}
         pipeline = [
-            {
-                "$vectorSearch": {
-                    "index": index_name,
-                    "path": "embedding",
-                    "queryVector": query_emb,
-                    "numCandidates": record_num,
-                    "limit": limit_num,
-                }
-            },
+            {"$vectorSearch": vector_search},
             {
                 "$project": {
                     "embedding": 0,
@@ -64,3 +61,62 @@ class MongoDBClient:
 
         extracted_results = [event.get("event_id") for event in results]
         return extracted_results
+
+
+def connect_db():
+    uri = f"mongodb+srv://{MongodbCFG.MONGODB_USERNAME}:{MongodbCFG.MONGODB_PASSWORD}@{MongodbCFG.MONGODB_HOST}/?retryWrites=true&w=majority"
+    client = MongoClient(
+        uri,
+        server_api=ServerApi("1"),
+        maxPoolSize=MongodbCFG.MAX_POOL_SIZE,
+        minPoolSize=MongodbCFG.MIN_POOL_SIZE,
+        connectTimeoutMS=MongodbCFG.CONNECT_TIMEOUT_MS,
+        serverSelectionTimeoutMS=MongodbCFG.SERVER_SELECTION_TIMEOUT_MS,
+        socketTimeoutMS=MongodbCFG.SOCKET_TIMEOUT_MS,
+    )
+    try:
+        client.admin.command("ping")
+    except Exception as e:
+        logger.error("MONGODB PING FAILED: %s", e)
+    return client
+
+
+def mongodb_health(client=None):
+    start = time.perf_counter()
+    try:
+        (client or get_mongodb_client()).admin.command("ping")
+        return {"status": "ok", "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+    except Exception as e:
+        return {"status": "error", "error": str(e)}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def init_mongodb_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = connect_db()
+            logger.info(
+                "MONGODB CLIENT CREATED (%s, max pool size %s)",
+                MongodbCFG.MONGODB_HOST, MongodbCFG.MAX_POOL_SIZE,
+            )
+        return _client
+
+
+def get_mongodb_client():
+    """Shared MongoClient for this worker; created on first use outside the app lifespan."""
+    if _client is None:
+        return init_mongodb_client()
+    return _client
+
+
+def close_mongodb_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+            logger.info("MONGODB CLIENT CLOSED")
@@ -0,0 +1,110 @@
+from src.config.constant import RecommendationCFG
+from src.module.recommendation_system.graph_version import (
+    get_live_version_async, get_write_versions_async, labelled)
+from src.module.recommendation_system.neo4j_client import (
+    BATCH_RECOMMENDATION_QUERY, DELETE_EVENT_QUERY, DELETE_USER_QUERY,
+    RECOMMENDATION_QUERY, UPSERT_EVENTS_QUERY, UPSERT_USERS_QUERY, _batched,
+    batch_recommendation_params, event_rows, interaction_statements,
+    recommendation_params, user_rows)
+
+
+async def _run_and_consume(tx, query, params):
+    result = await tx.run(query, params)
+    return (await result.consume()).counters
+
+
+async def _write_interactions_tx(tx, statements):
+    for query, edges in statements:
+        result = await tx.run(query, edges=edges)
+        await result.consume()
+
+
+class AsyncNeo4jClient:
+    """
+    Neo4jClient for the request path, on an AsyncNeo4jPool. It runs the same
+    queries; the sync client stays in use for Neo4jInit, the interaction
+    buffer, the sparse engine and scripts.
+    """
+
+    def __init__(self, pool, version=None):
+        self.pool = pool
+        self.driver = pool.driver
+        self.pinned = version is not None
+        self.version = version
+
+    async def _labelled(self, query):
+        if self.version is None:
+            self.version = await get_live_version_async(self.pool)
+        return labelled(query, self.version)
+
+    async def fetch_query(self, query, params={}):
+        """Run a read query and return its records as a list of dicts."""
+        query = await self._labelled(query)
+        async with self.pool.session() as session:
+            result = await session.run(query=query, parameters=params)
+            return await result.data()
+
+    async def write_query(self, query, params={}):
+        """
+        Run a write query without materializing any rows.
+        Returns the summary counters of the query.
+        """
+        query = await self._labelled(query)
+        async with self.pool.session() as session:
+            result = await session.run(query=query, parameters=params)
+            return (await result.consume()).counters
+
+    async def write_transaction(self, query, params={}):
+        """
+        Run a write query as one managed (retryable) transaction.
+        Returns the summary counters of the query.
+        """
+        query = await self._labelled(query)
+        async with self.pool.session() as session:
+            return await session.execute_write(_run_and_consume, query, params)
+
+    async def upsert_events(self, events):
+        for batch in _batched(event_rows(events), RecommendationCFG.UPSERT_BATCH_SIZE):
+            await self.write_transaction(query=UPSERT_EVENTS_QUERY, params={'events': batch})
+
+    async def delete_event(self, event_id):
+        await self.write_query(query=DELETE_EVENT_QUERY, params={'event_id': int(event_id)})
+
+    async def upsert_users(self, users):
+        for batch in _batched(user_rows(users), RecommendationCFG.UPSERT_BATCH_SIZE):
+            await self.write_transaction(query=UPSERT_USERS_QUERY, params={'users': batch})
+
+    async def delete_user(self, user_id):
+        await self.write_query(query=DELETE_USER_QUERY, params={'user_id': user_id})
+
+    async def write_interactions(self, interactions):
+        """Write a batch of view/like/unlike interactions in one transaction, see Neo4jClient."""
+        if self.pinned:
+            versions = [self.version]
+        else:
+            versions = await get_write_versions_async(self.pool)
+        statements = [
+            statement
+            for version in versions
+            for statement in interaction_statements(interactions, version)
+        ]
+        async with self.pool.session() as session:
+            await session.execute_write(_write_interactions_tx, statements)
+
+    async def get_recommendation(self, user_id, k=20):
+        """Recommend k events for user, see Neo4jClient.get_recommendation."""
+        query = await self._labelled(RECOMMENDATION_QUERY)
+        async with self.pool.session() as session:
+            result = await session.run(query=query, parameters=recommendation_params(user_id, k))
+            return [record[0] async for record in result]
+
+    async def get_recommendations(self, user_ids, k=20):
+        """Recommend k events for many users, see Neo4jClient.get_recommendations."""
+        recommendations = {user_id: [] for user_id in user_ids}
+        query = await self._labelled(BATCH_RECOMMENDATION_QUERY)
+        params = batch_recommendation_params(list(recommendations), k)
+        async with self.pool.session() as session:
+            result = await session.run(query=query, parameters=params)
+            async for user_id, event_ids in result:
+                recommendations[user_id] = event_ids
+        return recommendations
@@ -0,0 +1,306 @@
+import heapq
+import threading
+import time
+from bisect import bisect_left, insort
+
+from src.config.constant import RecommendationCFG
+from src.utils.logger import logger
+
+
+class _Index:
+    """
+    Per category, its events as (-popularity, event_id) in ascending order,
+    i.e. most viewed/liked first. Users are tracked only as far as the
+    cold-start path needs: preferred categories, interaction count and, for
+    users with few interactions, the events they have seen.
+
+    Popularity changes are collected in `deltas` and only applied, with
+    the affected categories re-sorted, by rerank().
+    """
+
+    def __init__(self, max_interactions):
+        self.max_interactions = max_interactions
+        self.ranked = {}
+        self.popularity = {}
+        self.event_categories = {}
+        self.user_categories = {}
+        self.user_interactions = {}
+        self.user_seen = {}
+        self.deltas = {}
+        self.reranked_at = time.monotonic()
+
+    def add_event(self, event_id, categories, popularity=0):
+        self.remove_event(event_id)
+        self.popularity[event_id] = popularity
+        self.event_categories[event_id] = set(categories)
+        for category_id in categories:
+            insort(self.ranked.setdefault(category_id, []), (-popularity, event_id))
+
+    def remove_event(self, event_id):
+        popularity = self.popularity.pop(event_id, None)
+        for category_id in self.event_categories.pop(event_id, ()):
+            ranked = self.ranked[category_id]
+            position = bisect_left(ranked, (-popularity, event_id))
+            if position < len(ranked) and ranked[position] == (-popularity, event_id):
+                del ranked[position]
+
+    def add_popularity(self, event_id, delta):
+        if event_id in self.popularity:
+            self.deltas[event_id] = self.deltas.get(event_id, 0) + delta
+
+    def rerank(self):
+        """Apply the batched popularity deltas, sorting each affected category once."""
+        categories = set()
+        for event_id, delta in self.deltas.items():
+            popularity = self.popularity.get(event_id)
+            if popularity is None or not delta:
+                continue
+            self.popularity[event_id] = max(popularity + delta, 0)
+            categories.update(self.event_categories[event_id])
+        for category_id in categories:
+            self.ranked[category_id] = sorted(
+                (-self.popularity[event_id], event_id) for _, event_id in self.ranked[category_id]
+            )
+        self.deltas = {}
+        self.reranked_at = time.monotonic()
+
+    def add_interaction(self, user_id, event_id):
+        if user_id not in self.user_categories:
+            return
+        seen = self.user_seen.get(user_id)
+        if seen is not None and event_id in seen:
+            return
+        self.user_interactions[user_id] = self.user_interactions.get(user_id, 0) + 1
+        if seen is not None:
+            seen.add(event_id)
+            if len(seen) > self.max_interactions:
+                # no longer a cold-start user, stop tracking its events
+                del self.user_seen[user_id]
+
+    def is_cold(self, user_id):
+        return self.user_interactions.get(user_id, 0) <= self.max_interactions
+
+    def recommend(self, user_id, k):
+        seen = self.user_seen.get(user_id, set())
+        # an event of the top k unseen ranks at most k + len(seen) in each list
+        depth = k + len(seen)
+        ranked = [
+            self.ranked[category_id][:depth]
+            for category_id in self.user_categories.get(user_id, ())
+            if category_id in self.ranked
+        ]
+        events = []
+        added = set(seen)
+        for _, event_id in heapq.merge(*ranked):
+            if event_id not in added:
+                added.add(event_id)
+                events.append(event_id)
+                if len(events) == k:
+                    break
+        return events
+
+
+class CategoryIndex:
+    """
+    Cold-start recommendations from memory: users with at most
+    COLD_START_MAX_INTERACTIONS viewed/liked events get the most popular
+    events of their preferred categories, merged with heapq.merge.
+
+    Popularity follows the interactions once they are written to the
+    graph, re-ranked at most every `rerank_interval` seconds. Only the
+    events of cold-start users are tracked, so a repeated view or like by
+    another user adds to popularity again; the whole index is reloaded
+    every `reload_interval` seconds to correct that. Updates made while a
+    reload runs are replayed onto it.
+    """
+
+    def __init__(
+        self,
+        client_factory,
+        max_interactions=RecommendationCFG.COLD_START_MAX_INTERACTIONS,
+        reload_interval=RecommendationCFG.COLD_START_RELOAD_INTERVAL,
+        rerank_interval=RecommendationCFG.COLD_START_RERANK_INTERVAL,
+    ):
+        self.client_factory = client_factory
+        self.max_interactions = max_interactions
+        self.reload_interval = reload_interval
+        self.rerank_interval = rerank_interval
+        self._lock = threading.RLock()
+        self._index = _Index(max_interactions)
+        self._journal = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.hits = 0
+
+    def load(self):
+        start = time.perf_counter()
+        with self._lock:
+            self._journal = []
+        try:
+            index = self._read_index(self.client_factory())
+            with self._lock:
+                for name, args in self._journal:
+                    getattr(self, name)(index, *args)
+                self._index = index
+        finally:
+            with self._lock:
+                self._journal = None
+        logger.info(
+            "CATEGORY INDEX LOADED %s CATEGORIES, %s EVENTS IN %.2fs",
+            len(index.ranked), len(index.popularity), time.perf_counter() - start,
+        )
+
+    def _read_index(self, neo4j_client):
+        index = _Index(self.max_interactions)
+        # implicit VIEWED edges (neo4j_init.add_view_edge) are not interactions
+        query = """
+            MATCH (e:Event)
+            RETURN e.id, [(e)-[:IN_CATEGORY]->(c:Category) | c.id],
+                   size([(e)<-[r:VIEWED|LIKED]-(:User) WHERE r.implicit IS NULL | 1])
+            """
+        for event_id, categories, popularity in neo4j_client.stream_query(query):
+            index.add_event(event_id, categories, popularity)
+
+        query = """
+            MATCH (u:User)
+            WITH u, size([(u)-[r:VIEWED|LIKED]->(:Event) WHERE r.implicit IS NULL | 1]) AS interactions
+            RETURN u.id, [(u)-[:PREFERRED]->(c:Category) | c.id], interactions,
+                   CASE WHEN interactions <= $max_interactions
+                        THEN [(u)-[r:VIEWED|LIKED]->(e:Event) WHERE r.implicit IS NULL | e.id]
+                        ELSE [] END
+            """
+        params = {"max_interactions": self.max_interactions}
+        for user_id, categories, interactions, seen in neo4j_client.stream_query(query, params=params):
+            index.user_categories[user_id] = set(categories)
+            index.user_interactions[user_id] = interactions
+            if interactions <= self.max_interactions:
+                index.user_seen[user_id] = set(seen)
+        return index
+
+    def _reload_loop(self):
+        while not self._stop.wait(self.reload_interval):
+            try:
+                self.load()
+            except Exception as e:
+                logger.error("CATEGORY INDEX RELOAD FAILED: %s", e)
+
+    def start(self):
+        self.load()
+        if self.reload_interval > 0:
+            self._thread = threading.Thread(
+                target=self._reload_loop, name="category-index-reload", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # ---------- incremental updates ----------
+
+    def _record(self, name, *args):
+        with self._lock:
+            getattr(self, name)(self._index, *args)
+            if self._journal is not None:
+                self._journal.append((name, args))
+
+    def apply_interactions(self, interactions):
+        self._record("_apply_interactions", [dict(i) for i in interactions])
+
+    def apply_user(self, user_id, categories):
+        self._record("_apply_user", user_id, [int(c) for c in categories])
+
+    def remove_user(self, user_id):
+        self._record("_remove_user", user_id)
+
+    def apply_event(self, event_id, categories):
+        self._record("_apply_event", int(event_id), [int(c) for c in categories])
+
+    def remove_event(self, event_id):
+        self._record("_remove_event", int(event_id))
+
+    @staticmethod
+    def _apply_interactions(index, interactions):
+        for interaction in interactions:
+            event_id = int(interaction["event_id"])
+            if interaction["type"] == "unlike":
+                index.add_popularity(event_id, -1)
+                continue
+            seen = index.user_seen.get(interaction["user_id"])
+            if seen is None or event_id not in seen:
+                index.add_popularity(event_id, 1)
+            index.add_interaction(interaction["user_id"], event_id)
+
+    @staticmethod
+    def _apply_user(index, user_id, categories):
+        if user_id not in index.user_categories:
+            index.user_interactions[user_id] = 0
+            index.user_seen[user_id] = set()
+        index.user_categories[user_id] = set(categories)
+
+    @staticmethod
+    def _remove_user(index, user_id):
+        index.user_categories.pop(user_id, None)
+        index.user_interactions.pop(user_id, None)
+        index.user_seen.pop(user_id, None)
+
+    @staticmethod
+    def _apply_event(index, event_id, categories):
+        index.add_event(event_id, categories, index.popularity.get(event_id, 0))
+
+    @staticmethod
+    def _remove_event(index, event_id):
+        index.remove_event(event_id)
+
+    # ---------- queries ----------
+
+    def recommend(self, user_id, k=20):
+        """
+        The user's cold-start recommendations, or None when the user is
+        unknown or has enough interactions for the collaborative path.
+        """
+        with self._lock:
+            index = self._index
+            if user_id not in index.user_categories or not index.is_cold(user_id):
+                return None
+            if index.deltas and time.monotonic() - index.reranked_at >= self.rerank_interval:
+                index.rerank()
+            self.hits += 1
+            return index.recommend(user_id, k)
+
+    def stats(self):
+        with self._lock:
+            index = self._index
+            return {
+                "categories": len(index.ranked),
+                "events": len(index.popularity),
+                "users": len(index.user_categories),
+                "cold_users": len(index.user_seen),
+                "hits": self.hits,
+            }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def init_category_index(client_factory):
+    global _index
+    with _index_lock:
+        if _index is None:
+            index = CategoryIndex(client_factory=client_factory)
+            index.start()
+            _index = index
+        return _index
+
+
+def get_category_index():
+    """Loaded cold-start index of this worker, or None when it has not been started."""
+    return _index
+
+
+def stop_category_index():
+    global _index
+    with _index_lock:
+        if _index is not None:
+            _index.stop()
+            _index = None
@@ -0,0 +1,96 @@
+import re
+import threading
+import time
+
+from src.config.constant import GraphSyncCFG
+
+GRAPH_NAME = "recommendation"
+
+_LABEL_PATTERN = re.compile(r":\s*(User|Event|Category)\b")
+
+
+def version_label(label, version):
+    """Label of `label` nodes in graph `version`; version 0 is the unversioned graph."""
+    return f"{label}_v{version}" if version else label
+
+
+def labelled(query, version):
+    """Rewrite the User/Event/Category labels of a query to those of graph `version`."""
+    if not version:
+        return query
+    return _LABEL_PATTERN.sub(lambda match: ":" + version_label(match.group(1), version), query)
+
+
+_VERSIONS_QUERY = "MATCH (v:GraphVersion {name: $name}) RETURN v.live, v.building"
+
+
+def _versions(record):
+    """(live version, version being rebuilt or None) of a GraphVersion record."""
+    if record is None:
+        return 0, None
+    return record[0] or 0, record[1]
+
+
+def read_live_version(session):
+    return _versions(session.run(_VERSIONS_QUERY, name=GRAPH_NAME).single())[0]
+
+
+_versions_cache = None
+_read_at = 0.0
+_lock = threading.Lock()
+
+
+def _fresh():
+    return _versions_cache is not None and time.monotonic() - _read_at < GraphSyncCFG.VERSION_REFRESH_INTERVAL
+
+
+def _read_versions(pool):
+    global _versions_cache, _read_at
+    if _fresh():
+        return _versions_cache
+    with _lock:
+        if not _fresh():
+            with pool.session() as session:
+                _versions_cache = _versions(session.run(_VERSIONS_QUERY, name=GRAPH_NAME).single())
+            _read_at = time.monotonic()
+        return _versions_cache
+
+
+def get_live_version(pool):
+    """
+    Version of the graph recommendations are served from, re-read at most
+    every GRAPH_SYNC_VERSION_REFRESH_INTERVAL seconds per worker.
+    """
+    return _read_versions(pool)[0]
+
+
+def get_write_versions(pool):
+    """
+    Versions interactions are written to: the live one and, during a shadow
+    rebuild, the one being built, so it misses no interaction and no unlike.
+    """
+    live, building = _read_versions(pool)
+    return [live] if building in (None, live) else [live, building]
+
+
+async def _read_versions_async(pool):
+    global _versions_cache, _read_at
+    if _fresh():
+        return _versions_cache
+    async with pool.session() as session:
+        result = await session.run(_VERSIONS_QUERY, name=GRAPH_NAME)
+        record = await result.single()
+    _versions_cache = _versions(record)
+    _read_at = time.monotonic()
+    return _versions_cache
+
+
+async def get_live_version_async(pool):
+    """get_live_version for an AsyncNeo4jPool, sharing the same per-worker cache."""
+    return (await _read_versions_async(pool))[0]
+
+
+async def get_write_versions_async(pool):
+    """get_write_versions for an AsyncNeo4jPool."""
+    live, building = await _read_versions_async(pool)
+    return [live] if building in (None, live) else [live, building]
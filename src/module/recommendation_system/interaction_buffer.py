@@ -0,0 +1,252 @@
+import threading
+import time
+from collections import OrderedDict
+
+from src.config.constant import RecommendationCFG
+from src.utils.logger import logger
+
+VIEW = "view"
+LIKE = "like"
+UNLIKE = "unlike"
+
+# like/unlike toggle the same LIKED edge, so they share a slot and the
+# latest one wins when coalescing.
+_EDGE_OF = {VIEW: "VIEWED", LIKE: "LIKED", UNLIKE: "LIKED"}
+
+
+class InteractionBufferOverflow(Exception):
+    """One add() with more distinct interactions than the buffer can hold."""
+
+
+def interaction_key(interaction):
+    return (
+        interaction["user_id"],
+        int(interaction["event_id"]),
+        _EDGE_OF[interaction["type"]],
+    )
+
+
+def coalesce_interactions(interactions):
+    """Last interaction per (user, event, edge), ordered by when it was made."""
+    latest = {}
+    for interaction in interactions:
+        key = interaction_key(interaction)
+        latest.pop(key, None)
+        latest[key] = interaction["type"]
+    return [
+        {"user_id": user_id, "event_id": event_id, "type": interaction_type}
+        for (user_id, event_id, _), interaction_type in latest.items()
+    ]
+
+
+class InteractionBuffer:
+    """
+    Bounded write-behind buffer for view/like/unlike interactions.
+
+    Interactions are coalesced per (user, event, edge) and handed to
+    `flush_fn` in batches by a background thread, either when a batch is
+    full or every `flush_interval` seconds. After a failed flush the
+    thread waits `flush_interval` seconds, doubling up to
+    `flush_backoff_max`, before trying again.
+
+    `add` accepts all of its interactions or none: it blocks for at most
+    `put_timeout` seconds until the buffer has room for the whole list and
+    then raises TimeoutError. A list larger than the whole buffer raises
+    InteractionBufferOverflow at once.
+    """
+
+    def __init__(
+        self,
+        flush_fn,
+        on_flush=None,
+        max_size=RecommendationCFG.INTERACTION_BUFFER_MAX_SIZE,
+        batch_size=RecommendationCFG.INTERACTION_FLUSH_BATCH_SIZE,
+        flush_interval=RecommendationCFG.INTERACTION_FLUSH_INTERVAL,
+        put_timeout=RecommendationCFG.INTERACTION_BUFFER_PUT_TIMEOUT,
+        flush_backoff_max=RecommendationCFG.INTERACTION_FLUSH_BACKOFF_MAX,
+    ):
+        self.flush_fn = flush_fn
+        self.on_flush = on_flush
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.put_timeout = put_timeout
+        self.flush_backoff_max = flush_backoff_max
+
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._stopping = False
+        self._thread = None
+
+        self._accepted = 0
+        self._coalesced = 0
+        self._rejected = 0
+        self._flushes = 0
+        self._flushed = 0
+        self._flush_failures = 0
+        self._dropped = 0
+        self._flush_last = 0.0
+        self._flush_total = 0.0
+        self._flush_max = 0.0
+
+    def add(self, interactions):
+        """
+        Args:
+            interactions (list of dict)
+            - user_id (str)
+            - event_id (str)
+            - type (str), one of view/like/unlike
+        """
+        keys = [interaction_key(interaction) for interaction in interactions]
+        if len(set(keys)) > self.max_size:
+            with self._cond:
+                self._rejected += len(interactions)
+            raise InteractionBufferOverflow("More interactions than the buffer can hold")
+        deadline = time.monotonic() + self.put_timeout
+        with self._cond:
+            while len(self._pending) + len(set(keys).difference(self._pending)) > self.max_size:
+                self._cond.notify_all()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stopping:
+                    self._rejected += len(interactions)
+                    raise TimeoutError("Interaction buffer is full")
+                self._cond.wait(remaining)
+            for key, interaction in zip(keys, interactions):
+                if key in self._pending:
+                    self._coalesced += 1
+                    self._pending.move_to_end(key)
+                self._pending[key] = interaction["type"]
+                self._accepted += 1
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify_all()
+
+    def _take_batch(self):
+        with self._cond:
+            batch = []
+            while self._pending and len(batch) < self.batch_size:
+                (user_id, event_id, _), interaction_type = self._pending.popitem(last=False)
+                batch.append(
+                    {"user_id": user_id, "event_id": event_id, "type": interaction_type}
+                )
+            self._cond.notify_all()
+            return batch
+
+    def _requeue(self, batch):
+        """Put back a failed batch, unless newer interactions already replaced it."""
+        with self._cond:
+            for interaction in batch:
+                key = interaction_key(interaction)
+                if key in self._pending:
+                    continue
+                if len(self._pending) >= self.max_size:
+                    self._dropped += 1
+                    continue
+                self._pending[key] = interaction["type"]
+                self._pending.move_to_end(key, last=False)
+
+    def _flush(self):
+        """Write everything currently pending. Returns (interactions written, whether a batch failed)."""
+        written = 0
+        with self._flush_lock:
+            while True:
+                batch = self._take_batch()
+                if not batch:
+                    return written, False
+                start = time.perf_counter()
+                try:
+                    self.flush_fn(batch)
+                except Exception as e:
+                    logger.error("INTERACTION FLUSH FAILED: %s", e)
+                    self._flush_failures += 1
+                    self._requeue(batch)
+                    return written, True
+                elapsed = time.perf_counter() - start
+                self._flushes += 1
+                self._flushed += len(batch)
+                self._flush_last = elapsed
+                self._flush_total += elapsed
+                self._flush_max = max(self._flush_max, elapsed)
+                written += len(batch)
+                if self.on_flush is not None:
+                    self.on_flush(batch)
+
+    def flush(self):
+        """Write everything currently pending. Returns the number of interactions written."""
+        return self._flush()[0]
+
+    def _run(self):
+        backoff = 0.0
+        while True:
+            with self._cond:
+                if backoff:
+                    # a full buffer wakes the thread, but it keeps waiting out the backoff
+                    deadline = time.monotonic() + backoff
+                    while not self._stopping and time.monotonic() < deadline:
+                        self._cond.wait(deadline - time.monotonic())
+                elif not self._stopping and len(self._pending) < self.batch_size:
+                    self._cond.wait(self.flush_interval)
+                if self._stopping:
+                    return
+            _, failed = self._flush()
+            if failed:
+                backoff = min(backoff * 2 or self.flush_interval, self.flush_backoff_max)
+            else:
+                backoff = 0.0
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="interaction-buffer-flusher", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def stats(self):
+        with self._cond:
+            depth = len(self._pending)
+        return {
+            "queue_depth": depth,
+            "max_size": self.max_size,
+            "accepted": self._accepted,
+            "coalesced": self._coalesced,
+            "rejected": self._rejected,
+            "dropped": self._dropped,
+            "flushes": self._flushes,
+            "flushed": self._flushed,
+            "flush_failures": self._flush_failures,
+            "flush_last_ms": self._flush_last * 1000,
+            "flush_avg_ms": (self._flush_total / self._flushes * 1000) if self._flushes else 0.0,
+            "flush_max_ms": self._flush_max * 1000,
+        }
+
+
+_buffer = None
+
+
+def start_interaction_buffer(flush_fn, on_flush=None):
+    global _buffer
+    if _buffer is None:
+        _buffer = InteractionBuffer(flush_fn=flush_fn, on_flush=on_flush)
+        _buffer.start()
+        logger.info("INTERACTION BUFFER STARTED")
+    return _buffer
+
+
+def get_interaction_buffer():
+    """Running buffer of this worker, or None when interactions are written synchronously."""
+    return _buffer
+
+
+def stop_interaction_buffer():
+    global _buffer
+    if _buffer is not None:
+        _buffer.stop()
+        _buffer = None
+        logger.info("INTERACTION BUFFER STOPPED")
@@ -1,18 +1,224 @@
-from collections import defaultdict
+from src.config.constant import RecommendationCFG
+from src.module.recommendation_system.graph_version import (
+    get_live_version, get_write_versions, labelled)
+from src.module.recommendation_system.interaction_buffer import \
+    coalesce_interactions
 
-import pandas as pd
-from neo4j import GraphDatabase
+
+def _run_and_consume(tx, query, params):
+    return tx.run(query, params).consume().counters
+
+
+_INTERACTION_QUERIES = {
+    'view': """
+        UNWIND $edges AS edge
+        MATCH (u:User {id: edge.user_id}), (e:Event {id: edge.event_id})
+        MERGE (u)-[r:VIEWED]->(e)
+        REMOVE r.implicit
+        """,
+    'like': """
+        UNWIND $edges AS edge
+        MATCH (u:User {id: edge.user_id}), (e:Event {id: edge.event_id})
+        MERGE (u)-[:LIKED]->(e)
+        """,
+    'unlike': """
+        UNWIND $edges AS edge
+        MATCH (u:User {id: edge.user_id}) - [r:LIKED] -> (e:Event {id: edge.event_id})
+        DELETE r
+        """,
+}
+
+
+UPSERT_EVENTS_QUERY = """
+    UNWIND $events AS event
+    MERGE (e:Event {id: event.id})
+    SET e.name = event.name, e.tags = event.tags
+    FOREACH (stale IN [(e)-[r:IN_CATEGORY]->(c:Category) WHERE NOT c.id IN event.categories | r] |
+        DELETE stale)
+    WITH e, event
+    UNWIND event.categories AS category_id
+    MATCH (c:Category {id: category_id})
+    MERGE (e)-[:IN_CATEGORY]->(c)
+    """
+
+DELETE_EVENT_QUERY = """
+    MATCH (e:Event {id: $event_id})
+    DETACH DELETE e
+    """
+
+UPSERT_USERS_QUERY = """
+    UNWIND $users AS user
+    MERGE (u:User {id: user.id})
+    FOREACH (stale IN [(u)-[r:PREFERRED]->(c:Category) WHERE NOT c.id IN user.categories | r] |
+        DELETE stale)
+    WITH u, user
+    UNWIND user.categories AS category_id
+    MATCH (c:Category {id: category_id})
+    MERGE (u)-[:PREFERRED]->(c)
+    """
+
+DELETE_USER_QUERY = """
+    MATCH (u:User {id: $user_id})
+    DETACH DELETE u
+    """
+
+# Adamic-Adar over the user's 2-hop neighbourhood, see Neo4jClient.get_recommendation
+RECOMMENDATION_QUERY = """
+    MATCH (p1:User {id: $user_id}) - [:VIEWED|LIKED|PREFERRED] -> (z)
+    WITH DISTINCT p1, z
+    WHERE $max_hub_degree = 0 OR size([(z)--() | 1]) <= $max_hub_degree
+    MATCH (z) <- [:VIEWED|LIKED|PREFERRED] - (p2:User)
+    WHERE p2 <> p1
+    WITH DISTINCT p1, p2
+    LIMIT $fan_out
+    MATCH (p1) - [:VIEWED|LIKED|PREFERRED] -> (z) <- [:VIEWED|LIKED|PREFERRED] - (p2)
+    WITH DISTINCT p1, p2, z
+    WITH p1, p2, sum(1.0 / log(size([(z)--() | 1]))) AS score
+    ORDER BY score DESC
+    LIMIT $neighbours
+    MATCH (p2) - [:VIEWED|LIKED] -> (e:Event)
+    WHERE NOT (p1) - [:VIEWED|LIKED] -> (e)
+    WITH e, max(score) AS score
+    ORDER BY score DESC
+    LIMIT $k
+    RETURN e.id as event_id
+    """
+
+# RECOMMENDATION_QUERY run per user of $user_ids; users without results get no row
+BATCH_RECOMMENDATION_QUERY = (
+    """
+    UNWIND $user_ids AS user_id
+    CALL {
+        WITH user_id
+    """
+    + RECOMMENDATION_QUERY.replace("$user_id", "user_id")
+    + """
+    }
+    RETURN user_id, collect(event_id) AS event_ids
+    """
+)
+
+
+def event_rows(events):
+    return [
+        {
+            'id': int(event['id']),
+            'name': event['name'],
+            'tags': event['tags'],
+            'categories': [int(category_id) for category_id in event['categories']],
+        }
+        for event in events
+    ]
+
+
+def user_rows(users):
+    return [
+        {
+            'id': user['id'],
+            'categories': [int(category_id) for category_id in user['categories']],
+        }
+        for user in users
+    ]
+
+
+def interaction_statements(interactions, version):
+    """
+    (query, edges) pairs writing a batch of interactions, one per interaction
+    type. The batch is coalesced to the last interaction per (user, event,
+    edge) first, since the types are not written in request order.
+    """
+    edges = {'view': [], 'like': [], 'unlike': []}
+    for interaction in coalesce_interactions(interactions):
+        edges[interaction['type']].append(
+            {'user_id': interaction['user_id'], 'event_id': int(interaction['event_id'])}
+        )
+    return [
+        (labelled(_INTERACTION_QUERIES[interaction_type], version), type_edges)
+        for interaction_type, type_edges in edges.items()
+        if type_edges
+    ]
+
+
+def recommendation_params(user_id, k):
+    return {
+        'user_id': user_id,
+        'k': k,
+        'neighbours': RecommendationCFG.NEIGHBOURS,
+        'max_hub_degree': RecommendationCFG.CANDIDATE_MAX_HUB_DEGREE,
+        'fan_out': RecommendationCFG.CANDIDATE_FAN_OUT,
+    }
+
+
+def batch_recommendation_params(user_ids, k):
+    params = recommendation_params(None, k)
+    del params['user_id']
+    params['user_ids'] = user_ids
+    return params
+
+
+def _write_interactions_tx(tx, statements):
+    for query, edges in statements:
+        tx.run(query, edges=edges).consume()
+
+
+def _batched(rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
 
 
 class Neo4jClient:
-    def __init__(self, url, username, password):
-        self.driver = GraphDatabase.driver(url, auth=(username, password))
+    def __init__(self, pool, version=None):
+        """
+        Queries are written against the User/Event/Category labels and run
+        against the live graph version unless `version` is given.
+        """
+        self.pool = pool
+        self.driver = pool.driver
+        self.pinned = version is not None
+        self.version = get_live_version(pool) if version is None else version
 
     def process_query(self, query, params={}):
-        with self.driver.session() as session:
-            result = session.run(query=query, parameters=params)
-            return pd.DataFrame(
-                data=[r.values() for r in result], columns=result.keys()
+        """
+        Run a query and return the result as a pandas DataFrame.
+        Only meant for notebooks/scripts, pandas is an optional dependency.
+        """
+        with self.pool.session() as session:
+            result = session.run(query=labelled(query, self.version), parameters=params)
+            return result.to_df()
+
+    def stream_query(self, query, params={}):
+        """
+        Yield each record of a read query as a plain tuple.
+        The session stays open until the generator is exhausted or closed.
+        """
+        with self.pool.session() as session:
+            result = session.run(query=labelled(query, self.version), parameters=params)
+            for record in result:
+                yield tuple(record.values())
+
+    def fetch_query(self, query, params={}):
+        """Run a read query and return its records as a list of dicts."""
+        with self.pool.session() as session:
+            result = session.run(query=labelled(query, self.version), parameters=params)
+            return result.data()
+
+    def write_query(self, query, params={}):
+        """
+        Run a write query without materializing any rows.
+        Returns the summary counters of the query.
+        """
+        with self.pool.session() as session:
+            result = session.run(query=labelled(query, self.version), parameters=params)
+            return result.consume().counters
+
+    def write_transaction(self, query, params={}):
+        """
+        Run a write query as one managed (retryable) transaction.
+        Returns the summary counters of the query.
+        """
+        with self.pool.session() as session:
+            return session.execute_write(
+                _run_and_consume, labelled(query, self.version), params
             )
 
     def upsert_event(self, event):
@@ -26,31 +232,18 @@ class Neo4jClient:
             - name (str)
             - tags (list of str)
         """
-        event['id'] = int(event['id'])
-        for i in range(len(event['categories'])):
-            event['categories'][i] = int(event['categories'][i])
-        queries = [
-            """
-            MERGE (e: Event {id: $event.id})
-            ON CREATE SET
-                e.id = $event.id,
-                e.name = $event.name,
-                e.tags = $event.tags
-            ON MATCH SET e.name = $event.name, e.tags = $event.tags
-            """,
-            """
-            MATCH (e: Event {id: $event.id}) - [r:IN_CATEGORY] -> (c: Category)
-            DELETE r
-            """,
-            """
-            UNWIND $event.categories as category_id
-            MATCH (e:Event {id: $event.id}), (c:Category {id: category_id})
-            WHERE NOT EXISTS((e)-[:IN_CATEGORY]->(c))
-            CREATE (e)-[:IN_CATEGORY]->(c)
-            """
-        ]
-        for query in queries:
-            self.process_query(query=query, params={'event': event})
+        self.upsert_events([event])
+
+    def upsert_events(self, events):
+        """
+        Insert/Update events in batches, one transaction and one statement per batch.
+        Stale IN_CATEGORY edges are removed and missing ones created in the same statement.
+
+        Args:
+            events (list of dict), same fields as upsert_event
+        """
+        for batch in _batched(event_rows(events), RecommendationCFG.UPSERT_BATCH_SIZE):
+            self.write_transaction(query=UPSERT_EVENTS_QUERY, params={'events': batch})
 
     def delete_event(self, event_id):
         """
@@ -59,11 +252,7 @@ class Neo4jClient:
         Args:
             event_id (str)
         """
-        query = """
-            MATCH (e:Event {id: $event_id})
-            DETACH DELETE e
-            """
-        self.process_query(query=query, params={'event_id': int(event_id)})
+        self.write_query(query=DELETE_EVENT_QUERY, params={'event_id': int(event_id)})
 
     def upsert_user(self, user):
         """
@@ -73,44 +262,25 @@ class Neo4jClient:
             - id (str)
             - categories (list of str)
         """
+        self.upsert_users([user])
 
-        queries = [
-            """
-            MERGE (u: User {id: $user_id})
-            ON CREATE SET u.id = $user_id
-            """,
-            """
-            MATCH (e: User {id: $user_id}) - [r:PREFERRED] -> (c: Category)
-            DELETE r
-            """
-        ]
-        for query in queries:
-            self.process_query(query=query, params={'user_id': user['id']})
+    def upsert_users(self, users):
+        """
+        Insert/Update users in batches, one transaction and one statement per batch.
+        Stale PREFERRED edges are removed and missing ones created in the same statement.
 
-        query = """
-            MATCH (u:User {id: $user_id}), (c:Category {id: $category_id})
-            WHERE NOT EXISTS((u)-[:PREFERRED]->(c))
-            CREATE (u)-[:PREFERRED]->(c)
-            """
-        for category_id in user['categories']:
-            self.process_query(
-                query=query,
-                params={
-                    'user_id': user['id'],
-                    'category_id': int(category_id)
-                }
-            )
+        Args:
+            users (list of dict), same fields as upsert_user
+        """
+        for batch in _batched(user_rows(users), RecommendationCFG.UPSERT_BATCH_SIZE):
+            self.write_transaction(query=UPSERT_USERS_QUERY, params={'users': batch})
 
     def delete_user(self, user_id):
         """
         Delete user in neo4j graph database
         Args: user_id (str)
         """
-        query = """
-            MATCH (u:User {id: $user_id})
-            DETACH DELETE u
-            """
-        self.process_query(query=query, params={'user_id': user_id})
+        self.write_query(query=DELETE_USER_QUERY, params={'user_id': user_id})
 
     def view_event(self, user_id, event_id):
         """
@@ -123,10 +293,10 @@ class Neo4jClient:
         """
         query = """
             MATCH (u:User {id: $user_id}), (e:Event {id: $event_id})
-            WHERE NOT EXISTS((u)-[:VIEWED]->(e))
-            CREATE (u)-[:VIEWED]->(e)
+            MERGE (u)-[r:VIEWED]->(e)
+            REMOVE r.implicit
             """
-        self.process_query(query=query, params={'user_id': user_id, 'event_id': int(event_id)})
+        self.write_query(query=query, params={'user_id': user_id, 'event_id': int(event_id)})
 
     def like_event(self, user_id, event_id):
         """
@@ -142,7 +312,7 @@ class Neo4jClient:
             WHERE NOT EXISTS((u)-[:LIKED]->(e))
             CREATE (u)-[:LIKED]->(e)
             """
-        self.process_query(
+        self.write_query(
             query=query,
             params={'user_id': user_id, 'event_id': int(event_id)}
         )
@@ -160,32 +330,55 @@ class Neo4jClient:
             MATCH (u:User {id: $user_id}) - [r:LIKED] -> (e:Event {id: $event_id})
             DELETE r
             """
-        self.process_query(
+        self.write_query(
             query=query,
             params={'user_id': user_id, 'event_id': int(event_id)}
         )
 
+    def write_interactions(self, interactions):
+        """
+        Write a batch of view/like/unlike interactions in one transaction,
+        to every version returned by get_write_versions unless the client
+        was given a version.
+
+        Args:
+            interactions (list of dict)
+            - user_id (str)
+            - event_id (str)
+            - type (str), one of view/like/unlike
+        """
+        versions = [self.version] if self.pinned else get_write_versions(self.pool)
+        statements = [
+            statement
+            for version in versions
+            for statement in interaction_statements(interactions, version)
+        ]
+        with self.pool.session() as session:
+            session.execute_write(_write_interactions_tx, statements)
+
     def get_recommendation(self, user_id, k = 20):
         """
-        Recommend 20 events for user based on most view category & preferences.
+        Recommend k events for user based on the events of the most similar users.
+
+        Only users sharing an event or category with the user can have a
+        non-zero Adamic-Adar score, so candidates are taken from the 2-hop
+        neighbourhood. Nodes above the hub degree cap are not expanded and
+        the number of candidates is bounded by the fan-out budget before
+        scoring. Events the user already viewed or liked are excluded.
         Args: user_id (str)
         """
-        query = """
-            MATCH (p1:User {id: $user_id})
-            MATCH (p2:User) WHERE p1 <> p2
-            WITH gds.alpha.linkprediction.adamicAdar(p1, p2) AS aA, p2.id as ids
-            ORDER BY aA DESC
-            LIMIT 10
-            UNWIND ids as id 
-            MATCH (a:User {id:id})-[r:VIEWED|LIKED]->(e:Event) 
-            WITH e, id LIMIT $k
-            WITH e, e.id as event_id, e.name as event_name
-            WITH e {event_id, event_name} as entry
-            RETURN collect(entry) as info
-        """
-        res = []
-        neo4j_response = self.process_query(query, params = {'user_id': user_id, 'k': k})
-        for index, row in neo4j_response.iterrows():
-            for ele in row['info']:
-                res.append(ele['event_id'])
-        return res
+        params = recommendation_params(user_id, k)
+        return [
+            event_id for event_id, in self.stream_query(RECOMMENDATION_QUERY, params=params)
+        ]
+
+    def get_recommendations(self, user_ids, k=20):
+        """
+        get_recommendation for many users in one UNWIND query.
+        Returns {user_id: event_ids}, with an empty list for users without any.
+        """
+        recommendations = {user_id: [] for user_id in user_ids}
+        params = batch_recommendation_params(list(recommendations), k)
+        for user_id, event_ids in self.stream_query(BATCH_RECOMMENDATION_QUERY, params=params):
+            recommendations[user_id] = event_ids
+        return recommendations
@@ -1,209 +1,670 @@
-from collections import defaultdict
-import pandas as pd
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
 from neo4j import GraphDatabase
 import mysql.connector
 from src.utils.logger import logger
-from src.config.constant import MysqlCFG
+from src.config.constant import GraphSyncCFG, MysqlCFG
+from src.module.recommendation_system.graph_version import (
+    GRAPH_NAME, labelled, read_live_version, version_label)
+
+
+def _write_batch_tx(tx, query, rows, params):
+    tx.run(query, params, rows=rows).consume()
+
+
+def _watermark_value(value):
+    """Datetimes are stored as 'YYYY-MM-DD HH:MM:SS[.ffffff]' strings, ids as they are."""
+    return value.isoformat(sep=" ") if hasattr(value, "isoformat") else value
+
+
+def _batched(rows, batch_size):
+    for start in range(0, len(rows), batch_size):
+        yield rows[start:start + batch_size]
+
+
 class Neo4jInit:
-    def __init__(self, url, username, password):
-        self.driver = GraphDatabase.driver(url, auth=(username, password))
+    def __init__(
+        self,
+        url,
+        username,
+        password,
+        batch_size=GraphSyncCFG.BATCH_SIZE,
+        max_in_flight=GraphSyncCFG.MAX_IN_FLIGHT,
+    ):
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.driver = GraphDatabase.driver(
+            url, auth=(username, password), max_connection_pool_size=max_in_flight + 1
+        )
         self.connection = mysql.connector.connect(
             host=MysqlCFG.MYSQL_HOST,
             user=MysqlCFG.MYSQL_USER,
             password=MysqlCFG.MYSQL_PASSWORD,
             database=MysqlCFG.MYSQL_DATABASE,
             port=MysqlCFG.MYSQL_PORT)
-    
+        # graph version the sync reads and writes, the live one by default
+        with self.driver.session() as session:
+            self.live_version = read_live_version(session)
+        self.version = self.live_version
+
+    def close(self):
+        self.connection.close()
+        self.driver.close()
+
     def init_neo4j(self):
+        # read before the rebuild, so rows changed while it runs are picked up
+        # by the next incremental sync
+        watermarks = self.read_watermarks()
         self.clear_all()
         self.create_constraint()
-        self.add_user()
-        self.add_event()
-        self.add_category()
-        self.add_ec_edge()
-        self.add_uc_edge()
-        self.add_view_edge()
-    
-    def clear_all(self):
-        query = """
-        MATCH (n)
-        DETACH DELETE n;
+        stats = {
+            "users": self.add_user(),
+            "events": self.add_event(),
+            "categories": self.add_category(),
+            "event_categories": self.add_ec_edge(),
+            "user_interests": self.add_uc_edge(),
+            "views": self.add_view_edge(),
+        }
+        for table, watermark in watermarks.items():
+            self.set_watermark(table, watermark)
+        return stats
+
+    def rebuild_shadow(self):
         """
-        with self.driver.session() as session:
-            session.run(query)
-        logger.info("CLEARED NEO4J")
-    
-    def create_constraint(self):
-        queries = ['CREATE CONSTRAINT users IF NOT EXISTS FOR (u:User) REQUIRE u.id IS UNIQUE',
-                'CREATE CONSTRAINT events IF NOT EXISTS FOR (e:Event) REQUIRE e.id IS UNIQUE',
-                'CREATE CONSTRAINT categories IF NOT EXISTS FOR (c:Category) REQUIRE c.id IS UNIQUE']
-        for query in queries:
-            with self.driver.session() as session:
-                session.run(query)
-        logger.info("CREATED CONSTRAINTS")
-    
-    def add_user(self):
-        query = "select * from user_account"
-        user_ids = []
-
-        with self.connection.cursor() as cursor:
-            cursor.execute(query)
-            result = cursor.fetchall()
-            for row in result:
-                user_ids.append(row[0])
-
+        Zero-downtime full rebuild: build the graph under the labels of a new
+        version while the live one keeps serving, copy the interactions
+        recorded through the API, validate it and swap the live version
+        pointer in one write. The previous version is left in place for
+        queries still running on it; drop it with drop_version after
+        SHADOW_GC_GRACE seconds.
+
+        The new version is published as the version being built, and API
+        workers write interactions to it as well as to the live one (see
+        get_write_versions), so neither interactions made during the rebuild
+        nor those of workers that have not seen the swap yet are lost.
+        """
+        watermarks = self.read_watermarks()
+        live, previous = self.read_versions()
+        shadow = max(live, previous or 0) + 1
+        # leftovers of an interrupted rebuild or of a skipped garbage collection
+        for version in {previous, shadow} - {None, live}:
+            self.drop_version(version)
+        logger.info("SHADOW REBUILD: LIVE v%s, BUILDING v%s", live, shadow)
+
+        self.set_building(shadow)
+        building_since = time.monotonic()
+        self.version = shadow
+        try:
+            self.create_constraint()
+            stats = {
+                "users": self.add_user(),
+                "events": self.add_event(),
+                "categories": self.add_category(),
+                "event_categories": self.add_ec_edge(),
+                "user_interests": self.add_uc_edge(),
+            }
+            # once every worker has re-read the versions, all interactions are
+            # written to both graphs and the copy below is complete
+            time.sleep(max(0.0, building_since + GraphSyncCFG.VERSION_REFRESH_INTERVAL - time.monotonic()))
+            # copied first so "popular" implicit views are ranked on real interactions
+            stats["interactions"] = self.copy_interactions(live, shadow)
+            stats["interactions_removed"] = self.remove_unliked(live, shadow)
+            stats["views"] = self.add_view_edge()
+            self.validate_shadow(stats, live, shadow)
+        except Exception:
+            logger.info("SHADOW REBUILD FAILED, DROPPING v%s", shadow)
+            self.version = live
+            self.set_building(None)
+            self.drop_version(shadow)
+            raise
+
+        self.swap_version(live, shadow)
+        for table, watermark in watermarks.items():
+            self.set_watermark(table, watermark)
+        stats["versions"] = {"previous": live, "live": shadow}
+        return stats
+
+    def set_building(self, version):
+        """Publish the version being rebuilt, or None, to the API workers."""
         query = """
-        UNWIND $ids AS id
-        MERGE (u: User {id: id})
-        ON CREATE SET u.id = id
+        MERGE (v:GraphVersion {name: $name})
+        SET v.building = $version
         """
+        with self.driver.session() as session:
+            session.run(query, name=GRAPH_NAME, version=version).consume()
 
+    def read_versions(self):
+        query = "MATCH (v:GraphVersion {name: $name}) RETURN v.live, v.previous"
         with self.driver.session() as session:
-            session.run(query, ids=user_ids)
+            record = session.run(query, name=GRAPH_NAME).single()
+        if record is None:
+            return 0, None
+        return record[0] or 0, record[1]
 
+    def swap_version(self, live, shadow):
+        """Point readers at `shadow` in one write; fails if the live version moved."""
         query = """
-        MATCH (n:User)
-        return n
+        MERGE (v:GraphVersion {name: $name})
+        WITH v WHERE coalesce(v.live, 0) = $live
+        SET v.previous = $live, v.live = $shadow, v.building = null, v.swapped_at = datetime()
+        RETURN v.live
         """
-
         with self.driver.session() as session:
-            result = session.run(query).values()
-
-        logger.info("Users mysql: " + str(len(user_ids)) + "    Users neo4j: " + str(len(result)))
-        logger.info("ADDED USER")
-    
-    def add_event(self):
-        query = "select * from event"
-        event_ids = []
+            record = session.run(query, name=GRAPH_NAME, live=live, shadow=shadow).single()
+        if record is None:
+            raise RuntimeError(f"live graph version changed during the rebuild of v{shadow}")
+        self.live_version = shadow
+        logger.info("SWAPPED GRAPH VERSION v%s -> v%s", live, shadow)
 
-        with self.connection.cursor() as cursor:
-            cursor.execute(query)
-            result = cursor.fetchall()
-            for row in result:
-                event_ids.append(row[0])
-
-        query = """
-        UNWIND $ids AS id
-        MERGE (e: Event {id: id})
-        ON CREATE SET e.id = id
+    def copy_interactions(self, source, target):
         """
-
+        Copy the VIEWED/LIKED edges recorded through the API from graph
+        `source` onto the nodes of graph `target`; implicit views are not
+        copied, add_view_edge creates them afresh.
+        """
+        copied = 0
+        for edge in ("VIEWED", "LIKED"):
+            query = f"MATCH (u:User) - [r:{edge}] -> (e:Event) WHERE r.implicit IS NULL RETURN u.id, e.id"
+            with self.driver.session() as session:
+                pairs = [list(record.values()) for record in session.run(labelled(query, source))]
+            version, self.version = self.version, target
+            try:
+                copied += self.write_batches(
+                    f"{edge} COPY",
+                    f"""
+                    UNWIND $rows AS edge
+                    MATCH (u:User {{id: edge[0]}}), (e:Event {{id: edge[1]}})
+                    MERGE (u)-[:{edge}]->(e)
+                    """,
+                    _batched(pairs, self.batch_size),
+                )
+            finally:
+                self.version = version
+        logger.info("COPIED %s INTERACTIONS v%s -> v%s", copied, source, target)
+        return copied
+
+    def remove_unliked(self, source, target):
+        """
+        Delete LIKED edges of graph `target` that are gone from graph `source`:
+        unlikes written to both graphs while copy_interactions was running.
+        """
+        query = "MATCH (u:User) - [:LIKED] -> (e:Event) RETURN u.id, e.id"
+        # target first, so a like written to both graphs in between is kept
         with self.driver.session() as session:
-            session.run(query, ids=event_ids)
-
+            target_pairs = {tuple(record.values()) for record in session.run(labelled(query, target))}
+        with self.driver.session() as session:
+            source_pairs = {tuple(record.values()) for record in session.run(labelled(query, source))}
+        stale = [list(pair) for pair in target_pairs - source_pairs]
+        version, self.version = self.version, target
+        try:
+            self.write_batches(
+                "LIKED REMOVE",
+                """
+                UNWIND $rows AS edge
+                MATCH (u:User {id: edge[0]}) - [r:LIKED] -> (e:Event {id: edge[1]})
+                DELETE r
+                """,
+                _batched(stale, self.batch_size),
+            )
+        finally:
+            self.version = version
+        logger.info("REMOVED %s UNLIKED INTERACTIONS FROM v%s", len(stale), target)
+        return len(stale)
+
+    def count_relationships(self, version):
+        """Outgoing relationships of users and events: PREFERRED, VIEWED, LIKED, IN_CATEGORY."""
+        total = 0
+        for label in ("User", "Event"):
+            query = labelled(f"MATCH (:{label}) - [r] -> () RETURN count(r)", version)
+            with self.driver.session() as session:
+                total += session.run(query).single(strict=True)[0]
+        return total
+
+    def validate_shadow(self, stats, live, shadow):
+        for stage in ("users", "events", "categories"):
+            if stats[stage]["mysql"] != stats[stage]["neo4j"]:
+                raise RuntimeError(
+                    f"shadow v{shadow} has {stats[stage]['neo4j']} {stage}, mysql {stats[stage]['mysql']}"
+                )
+        live_edges = self.count_relationships(live)
+        shadow_edges = self.count_relationships(shadow)
+        if live_edges and shadow_edges < GraphSyncCFG.MIN_EDGE_RATIO * live_edges:
+            raise RuntimeError(
+                f"shadow v{shadow} has {shadow_edges} relationships, live v{live} {live_edges}"
+            )
+        logger.info("VALIDATED SHADOW v%s: %s relationships (live %s)", shadow, shadow_edges, live_edges)
+
+    def drop_version(self, version):
+        """Delete the nodes of graph `version` in batches, then its constraints."""
+        query = labelled("""
+        MATCH (n) WHERE n:User OR n:Event OR n:Category
+        WITH n LIMIT $limit
+        DETACH DELETE n
+        RETURN count(n)
+        """, version)
+        deleted = 0
+        while True:
+            with self.driver.session() as session:
+                batch = session.execute_write(
+                    lambda tx: tx.run(query, limit=GraphSyncCFG.GC_BATCH_SIZE).single(strict=True)[0]
+                )
+            deleted += batch
+            if batch < GraphSyncCFG.GC_BATCH_SIZE:
+                break
+        if version != self.version:
+            suffix = f"_v{version}" if version else ""
+            for name in ("users", "events", "categories"):
+                with self.driver.session() as session:
+                    session.run(f"DROP CONSTRAINT {name}{suffix} IF EXISTS").consume()
+        logger.info("DROPPED GRAPH v%s: %s NODES", version, deleted)
+        return deleted
+
+    def sync_neo4j(self):
+        """
+        Incremental sync: upsert users/events/categories changed since the
+        stored high-water marks, remove nodes deleted from MySQL, reconcile
+        the junction tables and add implicit VIEWED edges for users whose
+        interests changed or who prefer a category that gained events.
+        VIEWED/LIKED edges recorded through the API are kept.
+        """
+        self.create_constraint()
+        stats = {
+            "users": self.sync_changed_nodes(
+                label="User", table="user_account",
+                id_column=GraphSyncCFG.USER_ID_COLUMN,
+                watermark_column=GraphSyncCFG.USER_WATERMARK_COLUMN,
+            ),
+            "events": self.sync_changed_nodes(
+                label="Event", table="event",
+                id_column=GraphSyncCFG.EVENT_ID_COLUMN,
+                watermark_column=GraphSyncCFG.EVENT_WATERMARK_COLUMN,
+            ),
+            "categories": self.sync_changed_nodes(
+                label="Category", table="category",
+                id_column=GraphSyncCFG.CATEGORY_ID_COLUMN,
+                watermark_column=GraphSyncCFG.CATEGORY_WATERMARK_COLUMN,
+            ),
+        }
+        stats["event_categories"], added_event_categories, _ = self.sync_edges(
+            name="EC EDGE",
+            select_query="select event_id, category_id from event_category",
+            match_query="MATCH (e:Event) - [:IN_CATEGORY] -> (c:Category) RETURN e.id, c.id",
+            create_query="""
+            UNWIND $rows as edge
+            MATCH (e:Event {id: edge[0]}), (c:Category {id: edge[1]})
+            MERGE (e)-[:IN_CATEGORY]->(c)
+            """,
+            delete_query="""
+            UNWIND $rows as edge
+            MATCH (e:Event {id: edge[0]}) - [r:IN_CATEGORY] -> (c:Category {id: edge[1]})
+            DELETE r
+            """,
+        )
+        stats["user_interests"], added_interests, removed_interests = self.sync_edges(
+            name="UC EDGE",
+            select_query="select username, category_id from user_interests",
+            match_query="MATCH (u:User) - [:PREFERRED] -> (c:Category) RETURN u.id, c.id",
+            create_query="""
+            UNWIND $rows as edge
+            MATCH (u:User {id: edge[0]}), (c:Category {id: edge[1]})
+            MERGE (u)-[:PREFERRED]->(c)
+            """,
+            delete_query="""
+            UNWIND $rows as edge
+            MATCH (u:User {id: edge[0]}) - [r:PREFERRED] -> (c:Category {id: edge[1]})
+            DELETE r
+            """,
+        )
+        changed_users = {user_id for user_id, _ in added_interests + removed_interests}
+        grown_categories = sorted({category_id for _, category_id in added_event_categories})
+        changed_users.update(self.preferring_users(grown_categories))
+        stats["views"] = self.add_view_edge(user_ids=sorted(changed_users))
+        return stats
+
+    def preferring_users(self, category_ids):
+        """Ids of the users who prefer any of `category_ids`."""
+        if not category_ids:
+            return []
         query = """
-        MATCH (n:Event)
-        return n
+        MATCH (u:User) - [:PREFERRED] -> (c:Category)
+        WHERE c.id IN $category_ids
+        RETURN DISTINCT u.id
         """
-
         with self.driver.session() as session:
-            result = session.run(query).values()
+            result = session.run(labelled(query, self.version), category_ids=category_ids)
+            return [user_id for user_id, in result]
 
-        logger.info("Events mysql: " + str(len(event_ids)) + "    Events neo4j: " + str(len(result)))
-        logger.info("ADDED EVENT")
-    
-    def add_category(self):
-        query = "select * from category"
-        category_ids = []
+    def clear_all(self):
+        self.drop_version(self.version)
+        logger.info("CLEARED NEO4J")
 
-        with self.connection.cursor() as cursor:
-            cursor.execute(query)
-            result = cursor.fetchall()
-            for row in result:
-                category_ids.append(row[0])
+    def create_constraint(self):
+        # constraints are per version so a shadow graph gets its own indexes
+        suffix = f"_v{self.version}" if self.version else ""
+        queries = [f'CREATE CONSTRAINT users{suffix} IF NOT EXISTS FOR (u:{version_label("User", self.version)}) REQUIRE u.id IS UNIQUE',
+                f'CREATE CONSTRAINT events{suffix} IF NOT EXISTS FOR (e:{version_label("Event", self.version)}) REQUIRE e.id IS UNIQUE',
+                f'CREATE CONSTRAINT categories{suffix} IF NOT EXISTS FOR (c:{version_label("Category", self.version)}) REQUIRE c.id IS UNIQUE',
+                'CREATE CONSTRAINT sync_states IF NOT EXISTS FOR (s:SyncState) REQUIRE s.table IS UNIQUE',
+                'CREATE CONSTRAINT graph_versions IF NOT EXISTS FOR (v:GraphVersion) REQUIRE v.name IS UNIQUE']
+        for query in queries:
+            with self.driver.session() as session:
+                session.run(query)
+        logger.info("CREATED CONSTRAINTS")
 
-        query = """
-        UNWIND $ids AS id
-        MERGE (c: Category {id: id})
-        ON CREATE SET c.id = id
-        """
+    def count(self, query, params={}):
+        with self.driver.session() as session:
+            return session.run(labelled(query, self.version), params).single(strict=True)[0]
 
+    def get_watermark(self, table):
+        query = "MATCH (s:SyncState {table: $table}) RETURN s.watermark"
         with self.driver.session() as session:
-            session.run(query, ids=category_ids)
+            record = session.run(query, table=table).single()
+        return None if record is None else record[0]
 
+    def set_watermark(self, table, watermark):
         query = """
-        MATCH (n:Category)
-        return n
+        MERGE (s:SyncState {table: $table})
+        SET s.watermark = $watermark, s.synced_at = datetime()
         """
-
         with self.driver.session() as session:
-            result = session.run(query).values()
-
-        logger.info("Events mysql: " + str(len(category_ids)) + "    Events neo4j: " + str(len(result)))
-        logger.info("ADDED CATEGORY")
-    
-    def add_ec_edge(self):
-        query = "select event_id, category_id from event_category"
-
-        event_category_edges = []
-
-        with self.connection.cursor() as cursor:
-            cursor.execute(query)
-            result = cursor.fetchall()
-            for row in result:
-                event_category_edges.append({'from': row[0], 'to': row[1]})
+            session.run(query, table=table, watermark=watermark).consume()
+
+    def read_watermarks(self):
+        """Current high-water mark of every node table in MySQL."""
+        tables = [
+            ("user_account", GraphSyncCFG.USER_WATERMARK_COLUMN),
+            ("event", GraphSyncCFG.EVENT_WATERMARK_COLUMN),
+            ("category", GraphSyncCFG.CATEGORY_WATERMARK_COLUMN),
+        ]
+        watermarks = {}
+        for table, watermark_column in tables:
+            with self.connection.cursor() as cursor:
+                cursor.execute(f"select max({watermark_column}) from {table}")
+                watermark = cursor.fetchone()[0]
+            if watermark is not None:
+                watermarks[table] = _watermark_value(watermark)
+        return watermarks
+
+    def _write_batch(self, query, rows, params):
+        with self.driver.session() as session:
+            session.execute_write(_write_batch_tx, labelled(query, self.version), rows, params)
 
-        query = """
-        UNWIND $edges as edge
-        MATCH (e:Event {id: edge.from}), (c:Category {id: edge.to})
-        WHERE NOT EXISTS((e)-[:IN_CATEGORY]->(c))
-        CREATE (e)-[:IN_CATEGORY]->(c)
+    def write_batches(self, name, write_query, batches, params=None):
         """
-
+        Write an iterable of row batches with `write_query` ($rows and
+        `params`), keeping up to `max_in_flight` batches in flight, each in
+        its own transaction. Returns the number of rows.
+        """
+        start = time.perf_counter()
+        rows_written = 0
+        count = 0
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            in_flight = set()
+            for batch in batches:
+                if len(in_flight) >= self.max_in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                in_flight.add(executor.submit(self._write_batch, write_query, batch, params or {}))
+                rows_written += len(batch)
+                count += 1
+                if count % GraphSyncCFG.PROGRESS_EVERY == 0:
+                    logger.info(
+                        "SYNC %s: %s rows (%.0f rows/s)",
+                        name, rows_written, rows_written / (time.perf_counter() - start),
+                    )
+            for future in wait(in_flight).done:
+                future.result()
+        return rows_written
+
+    def read_batches(self, select_query, params=(), to_row=tuple):
+        """Stream `select_query` from MySQL in lists of `batch_size` converted rows."""
+        # unbuffered cursor: rows are pulled from the server as they are fetched
+        with self.connection.cursor(buffered=False) as cursor:
+            cursor.execute(select_query, params)
+            while True:
+                rows = cursor.fetchmany(self.batch_size)
+                if not rows:
+                    return
+                yield [to_row(row) for row in rows]
+
+    def sync_stage(self, name, select_query, to_row, write_query, count_query, params=()):
+        """
+        Stream `select_query` from MySQL and write it to Neo4j in UNWIND
+        batches. Returns the number of rows read, the number counted in Neo4j
+        afterwards by `count_query` and the throughput of the stage.
+        """
+        start = time.perf_counter()
+        rows_read = self.write_batches(
+            name, write_query, self.read_batches(select_query, params, to_row)
+        )
+        elapsed = time.perf_counter() - start
+        stats = {
+            "mysql": rows_read,
+            "neo4j": self.count(count_query),
+            "seconds": round(elapsed, 3),
+            "rows_per_second": round(rows_read / elapsed, 1) if elapsed else 0.0,
+        }
+        logger.info(
+            "SYNC %s DONE: mysql %s, neo4j %s, %.1fs (%.0f rows/s)",
+            name, stats["mysql"], stats["neo4j"], elapsed, stats["rows_per_second"],
+        )
+        return stats
+
+    def sync_changed_nodes(self, label, table, id_column, watermark_column):
+        """
+        Upsert the rows of `table` changed since the stored high-water mark,
+        then remove nodes whose row no longer exists in MySQL.
+        """
+        watermark = self.get_watermark(table)
+        select_query = f"select {id_column}, {watermark_column} from {table}"
+        params = ()
+        if watermark is not None:
+            # >= so rows sharing the last timestamp are not missed; upserts are idempotent
+            select_query += f" where {watermark_column} >= %s"
+            params = (watermark,)
+        high = [watermark]
+
+        def to_row(row):
+            value = _watermark_value(row[1])
+            if value is not None and (high[0] is None or value > high[0]):
+                high[0] = value
+            return row[0]
+
+        stats = self.sync_stage(
+            name=f"{label.upper()} (INCREMENTAL)",
+            select_query=select_query,
+            params=params,
+            to_row=to_row,
+            write_query=f"""
+            UNWIND $rows AS id
+            MERGE (n: {label} {{id: id}})
+            """,
+            count_query=f"MATCH (n:{label}) RETURN count(n)",
+        )
+        stats["deleted"] = self.remove_deleted_nodes(label, table, id_column)
+        stats["neo4j"] -= stats["deleted"]
+        if high[0] is not None:
+            self.set_watermark(table, high[0])
+        stats["watermark"] = high[0]
+        return stats
+
+    def remove_deleted_nodes(self, label, table, id_column):
+        mysql_ids = set()
+        for batch in self.read_batches(f"select {id_column} from {table}", to_row=lambda row: row[0]):
+            mysql_ids.update(batch)
         with self.driver.session() as session:
-            session.run(query, edges=event_category_edges)
-
-        query = """
-        MATCH (e:Event) - [r] -> (c:Category)
-        return count(r)
+            result = session.run(labelled(f"MATCH (n:{label}) RETURN n.id", self.version))
+            deleted = [node_id for node_id, in result if node_id not in mysql_ids]
+        self.write_batches(
+            f"{label.upper()} DELETE",
+            f"""
+            UNWIND $rows AS id
+            MATCH (n:{label} {{id: id}})
+            DETACH DELETE n
+            """,
+            _batched(deleted, self.batch_size),
+        )
+        logger.info("SYNC %s: REMOVED %s DELETED NODES", label.upper(), len(deleted))
+        return len(deleted)
+
+    def sync_edges(self, name, select_query, match_query, create_query, delete_query):
         """
-
+        Reconcile a junction table with its relationships: only pairs missing
+        in Neo4j are created and only pairs gone from MySQL are deleted.
+        Returns the stage stats and the created and deleted pairs.
+        """
+        start = time.perf_counter()
+        mysql_pairs = set()
+        for batch in self.read_batches(select_query):
+            mysql_pairs.update(batch)
         with self.driver.session() as session:
-            result = session.run(query).values()
+            neo4j_pairs = {
+                tuple(record.values())
+                for record in session.run(labelled(match_query, self.version))
+            }
+        to_create = [list(pair) for pair in mysql_pairs - neo4j_pairs]
+        to_delete = [list(pair) for pair in neo4j_pairs - mysql_pairs]
+        self.write_batches(name, delete_query, _batched(to_delete, self.batch_size))
+        self.write_batches(name, create_query, _batched(to_create, self.batch_size))
+        elapsed = time.perf_counter() - start
+        logger.info(
+            "SYNC %s DONE: %s created, %s deleted, %.1fs",
+            name, len(to_create), len(to_delete), elapsed,
+        )
+        stats = {
+            "mysql": len(mysql_pairs),
+            "created": len(to_create),
+            "deleted": len(to_delete),
+            "seconds": round(elapsed, 3),
+        }
+        return stats, to_create, to_delete
 
-        logger.info("EC edges mysql: " + str(len(event_category_edges)) + "    EC edges neo4j: " + str(len(result)))
-        logger.info("ADDED EC EDGE")
+    def add_user(self):
+        return self.sync_stage(
+            name="USER",
+            select_query=f"select {GraphSyncCFG.USER_ID_COLUMN} from user_account",
+            to_row=lambda row: row[0],
+            write_query="""
+            UNWIND $rows AS id
+            MERGE (u: User {id: id})
+            """,
+            count_query="MATCH (n:User) RETURN count(n)",
+        )
 
-    def add_uc_edge(self):
-        query = "select username, category_id from user_interests"
+    def add_event(self):
+        return self.sync_stage(
+            name="EVENT",
+            select_query=f"select {GraphSyncCFG.EVENT_ID_COLUMN} from event",
+            to_row=lambda row: row[0],
+            write_query="""
+            UNWIND $rows AS id
+            MERGE (e: Event {id: id})
+            """,
+            count_query="MATCH (n:Event) RETURN count(n)",
+        )
 
-        user_category_edges = []
+    def add_category(self):
+        return self.sync_stage(
+            name="CATEGORY",
+            select_query=f"select {GraphSyncCFG.CATEGORY_ID_COLUMN} from category",
+            to_row=lambda row: row[0],
+            write_query="""
+            UNWIND $rows AS id
+            MERGE (c: Category {id: id})
+            """,
+            count_query="MATCH (n:Category) RETURN count(n)",
+        )
 
-        with self.connection.cursor() as cursor:
-            cursor.execute(query)
-            result = cursor.fetchall()
-            for row in result:
-                user_category_edges.append({'from': row[0], 'to': row[1]})
+    def add_ec_edge(self):
+        return self.sync_stage(
+            name="EC EDGE",
+            select_query="select event_id, category_id from event_category",
+            to_row=lambda row: {'from': row[0], 'to': row[1]},
+            write_query="""
+            UNWIND $rows as edge
+            MATCH (e:Event {id: edge.from}), (c:Category {id: edge.to})
+            MERGE (e)-[:IN_CATEGORY]->(c)
+            """,
+            count_query="MATCH (:Event) - [r:IN_CATEGORY] -> (:Category) RETURN count(r)",
+        )
 
-        query = """
-        UNWIND $edges as edge
-        MATCH (u:User {id: edge.from}), (c:Category {id: edge.to})
-        WHERE NOT EXISTS((u)-[:PREFERRED]->(c))
-        CREATE (u)-[:PREFERRED]->(c)
+    def add_uc_edge(self):
+        return self.sync_stage(
+            name="UC EDGE",
+            select_query="select username, category_id from user_interests",
+            to_row=lambda row: {'from': row[0], 'to': row[1]},
+            write_query="""
+            UNWIND $rows as edge
+            MATCH (u:User {id: edge.from}), (c:Category {id: edge.to})
+            MERGE (u)-[:PREFERRED]->(c)
+            """,
+            count_query="MATCH (:User) - [r:PREFERRED] -> (:Category) RETURN count(r)",
+        )
+
+    def top_category_events(self):
+        """
+        Ids of the events implicit VIEWED edges point to, per category id
+        (as a string): ranked by explicit views and likes ("popular") or by id
+        ("recent"), at most VIEW_EDGES_PER_CATEGORY of them.
+        """
+        if GraphSyncCFG.VIEW_EDGE_ORDER == "recent":
+            popularity = "0"
+        else:
+            # implicit views are left out, so the ranking does not feed on itself
+            popularity = "size([(e) <- [r:VIEWED|LIKED] - (:User) WHERE r.implicit IS NULL | 1])"
+        query = f"""
+        MATCH (c:Category) <- [:IN_CATEGORY] - (e:Event)
+        WITH c, e, {popularity} AS popularity
+        ORDER BY popularity DESC, e.id DESC
+        WITH c, collect(e.id) AS event_ids
+        RETURN c.id, CASE WHEN $per_category > 0 THEN event_ids[..$per_category] ELSE event_ids END
         """
-
         with self.driver.session() as session:
-            session.run(query, edges=user_category_edges)
+            result = session.run(
+                labelled(query, self.version), per_category=GraphSyncCFG.VIEW_EDGES_PER_CATEGORY
+            )
+            return {str(category_id): event_ids for category_id, event_ids in result}
 
-        query = """
-        MATCH (u:User) - [r] -> (c:Category)
-        return count(r)
+    def add_view_edge(self, user_ids=None):
         """
+        Add implicit VIEWED edges between users and the events of their
+        preferred categories, for every user or only for `user_ids`.
+        The events of every category are ranked once, before any edge is
+        written (see top_category_events). Users are then written in batches
+        of VIEW_EDGE_USER_BATCH_SIZE, one transaction each. The edges are
+        marked implicit until the user views the event through the API.
+        """
+        start = time.perf_counter()
+        if user_ids is None:
+            with self.driver.session() as session:
+                result = session.run(labelled("MATCH (u:User) RETURN u.id", self.version))
+                user_ids = [user_id for user_id, in result]
 
-        with self.driver.session() as session:
-            result = session.run(query).values()
-
-        logger.info("UC edges mysql: " + str(len(user_category_edges)) + "    UC edges neo4j: " + str(len(result)))
-        logger.info("ADDED UC EDGE")
-    
-    def add_view_edge(self):
+        top_events = self.top_category_events()
         query = """
-        MATCH (u:User) - [r1:PREFERRED] -> (c:Category) <- [r2:IN_CATEGORY] - (e:Event)
-        WHERE NOT EXISTS((u)-[:VIEWED]->(e))
-        CREATE (u)-[ed:VIEWED]->(e)
+        UNWIND $rows AS user_id
+        MATCH (u:User {id: user_id}) - [:PREFERRED] -> (c:Category)
+        UNWIND coalesce($top_events[toString(c.id)], []) AS event_id
+        MATCH (e:Event {id: event_id})
+        MERGE (u)-[r:VIEWED]->(e)
+        ON CREATE SET r.implicit = true
         """
-
-        with self.driver.session() as session:
-            result = session.run(query)
-        
-        logger.info("ADDED VIEWED EDGE")
\ No newline at end of file
+        users = self.write_batches(
+            "VIEWED EDGE",
+            query,
+            _batched(user_ids, GraphSyncCFG.VIEW_EDGE_USER_BATCH_SIZE),
+            params={"top_events": top_events},
+        )
+        elapsed = time.perf_counter() - start
+
+        stats = {
+            "users": users,
+            "neo4j": self.count("MATCH (:User) - [r:VIEWED] -> (:Event) RETURN count(r)"),
+            "seconds": round(elapsed, 3),
+        }
+        logger.info(
+            "ADDED VIEWED EDGE: %s users, %s edges, %.1fs", users, stats["neo4j"], elapsed,
+        )
+        return stats
@@ -0,0 +1,211 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+from neo4j import AsyncGraphDatabase, GraphDatabase
+
+from src.config.constant import Neo4jCFG
+from src.utils.logger import logger
+
+
+class Neo4jPool:
+    """
+    Process-wide Neo4j driver with a bounded session gate.
+
+    The gate mirrors the driver's connection pool size so that callers
+    waiting for a connection are measured (and time out) here, which is
+    what the pool statistics are built from.
+    """
+
+    _graph_database = GraphDatabase
+    _semaphore = threading.BoundedSemaphore
+
+    def __init__(
+        self,
+        url,
+        username,
+        password,
+        max_pool_size=Neo4jCFG.MAX_CONNECTION_POOL_SIZE,
+        acquisition_timeout=Neo4jCFG.CONNECTION_ACQUISITION_TIMEOUT,
+        max_connection_lifetime=Neo4jCFG.MAX_CONNECTION_LIFETIME,
+    ):
+        self.max_pool_size = max_pool_size
+        self.acquisition_timeout = acquisition_timeout
+        self.driver = self._graph_database.driver(
+            url,
+            auth=(username, password),
+            max_connection_pool_size=max_pool_size,
+            connection_acquisition_timeout=acquisition_timeout,
+            max_connection_lifetime=max_connection_lifetime,
+        )
+        self._gate = self._semaphore(max_pool_size)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._acquired = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @contextmanager
+    def session(self, **kwargs):
+        start = time.perf_counter()
+        if not self._gate.acquire(timeout=self.acquisition_timeout):
+            with self._lock:
+                self._timeouts += 1
+            raise TimeoutError(
+                f"Timed out after {self.acquisition_timeout}s waiting for a Neo4j connection"
+            )
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._in_use += 1
+            self._acquired += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        try:
+            with self.driver.session(**kwargs) as session:
+                yield session
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._gate.release()
+
+    def _driver_connections(self):
+        """Open/in-use bolt connections as seen by the driver's own pool."""
+        pool = getattr(self.driver, "_pool", None)
+        connections = getattr(pool, "connections", None)
+        if connections is None:
+            return None, None
+        opened = 0
+        in_use = 0
+        for address_connections in list(connections.values()):
+            for connection in list(address_connections):
+                opened += 1
+                in_use += bool(getattr(connection, "in_use", False))
+        return opened, in_use
+
+    def stats(self):
+        opened, driver_in_use = self._driver_connections()
+        with self._lock:
+            acquired = self._acquired
+            return {
+                "max_pool_size": self.max_pool_size,
+                "acquisition_timeout": self.acquisition_timeout,
+                "in_use": self._in_use,
+                "idle": None if opened is None else max(opened - driver_in_use, 0),
+                "opened": opened,
+                "acquired_total": acquired,
+                "acquisition_timeouts": self._timeouts,
+                "wait_avg_ms": (self._wait_total / acquired * 1000) if acquired else 0.0,
+                "wait_max_ms": self._wait_max * 1000,
+            }
+
+    def close(self):
+        self.driver.close()
+
+
+class AsyncNeo4jPool(Neo4jPool):
+    """
+    Neo4jPool on the asyncio driver. Sessions are awaited instead of
+    holding a thread, so concurrency is bounded by the pool size only.
+    Must be created and used from the event loop.
+    """
+
+    _graph_database = AsyncGraphDatabase
+    _semaphore = asyncio.BoundedSemaphore
+
+    @asynccontextmanager
+    async def session(self, **kwargs):
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._gate.acquire(), timeout=self.acquisition_timeout)
+        except asyncio.TimeoutError:
+            self._timeouts += 1
+            raise TimeoutError(
+                f"Timed out after {self.acquisition_timeout}s waiting for a Neo4j connection"
+            )
+        waited = time.perf_counter() - start
+        self._in_use += 1
+        self._acquired += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        try:
+            async with self.driver.session(**kwargs) as session:
+                yield session
+        finally:
+            self._in_use -= 1
+            self._gate.release()
+
+    async def close(self):
+        await self.driver.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def init_neo4j_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = Neo4jPool(
+                url=Neo4jCFG.URL,
+                username=Neo4jCFG.USERNAME,
+                password=Neo4jCFG.PASSWORD,
+            )
+            logger.info(
+                "NEO4J POOL CREATED (max size %s, acquisition timeout %ss)",
+                _pool.max_pool_size,
+                _pool.acquisition_timeout,
+            )
+        return _pool
+
+
+def get_neo4j_pool():
+    """Shared pool for this worker; created on first use outside the app lifespan."""
+    if _pool is None:
+        return init_neo4j_pool()
+    return _pool
+
+
+def close_neo4j_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+            logger.info("NEO4J POOL CLOSED")
+
+
+_async_pool = None
+
+
+def init_async_neo4j_pool():
+    global _async_pool
+    if _async_pool is None:
+        _async_pool = AsyncNeo4jPool(
+            url=Neo4jCFG.URL,
+            username=Neo4jCFG.USERNAME,
+            password=Neo4jCFG.PASSWORD,
+        )
+        logger.info(
+            "ASYNC NEO4J POOL CREATED (max size %s, acquisition timeout %ss)",
+            _async_pool.max_pool_size,
+            _async_pool.acquisition_timeout,
+        )
+    return _async_pool
+
+
+def get_async_neo4j_pool():
+    """Shared asyncio pool for this worker; created on first use outside the app lifespan."""
+    if _async_pool is None:
+        return init_async_neo4j_pool()
+    return _async_pool
+
+
+async def close_async_neo4j_pool():
+    global _async_pool
+    if _async_pool is not None:
+        await _async_pool.close()
+        _async_pool = None
+        logger.info("ASYNC NEO4J POOL CLOSED")
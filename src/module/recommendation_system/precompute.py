@@ -0,0 +1,112 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from src.config.constant import RecommendationCFG
+from src.module.recommendation_system.neo4j_client import Neo4jClient, _batched
+from src.module.recommendation_system.neo4j_pool import get_neo4j_pool
+from src.module.recommendation_system.recommendation_store import \
+    RecommendationStore
+from src.module.recommendation_system.sparse_engine import \
+    SparseAdamicAdarEngine
+from src.utils.logger import logger
+
+JOB = "precompute"
+
+
+class RecommendationPrecompute:
+    """
+    Compute the top-k recommendations of every user into the
+    RecommendationStore, in chunks of users scored in parallel.
+
+    Users are processed in id order and the checkpoint is the last user of
+    the longest run of completed chunks, so an interrupted job resumes
+    without recomputing (or skipping) anyone.
+    """
+
+    def __init__(
+        self,
+        store,
+        k=RecommendationCFG.PRECOMPUTE_K,
+        chunk_size=RecommendationCFG.PRECOMPUTE_CHUNK_SIZE,
+        workers=RecommendationCFG.PRECOMPUTE_WORKERS,
+    ):
+        self.store = store
+        self.k = k
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.client = Neo4jClient(pool=get_neo4j_pool())
+        self.engine = None
+        if RecommendationCFG.BACKEND == "sparse":
+            self.engine = SparseAdamicAdarEngine(client_factory=lambda: self.client)
+            self.engine.load()
+
+    def user_ids(self, after=None):
+        query = "MATCH (u:User) WHERE $after IS NULL OR u.id > $after RETURN u.id ORDER BY u.id"
+        return [user_id for user_id, in self.client.stream_query(query, params={"after": after})]
+
+    def compute_chunk(self, user_ids):
+        computed_at = time.time()
+        if self.engine is not None:
+            recommendations = self.engine.recommend_many(user_ids, k=self.k)
+        else:
+            recommendations = self.client.get_recommendations(user_ids, k=self.k)
+        self.store.put_many(list(recommendations.items()), k=self.k, computed_at=computed_at)
+        return len(recommendations)
+
+    def run(self, restart=False):
+        checkpoint = None if restart else self.store.get_checkpoint(JOB)
+        if checkpoint is not None:
+            after, started_at = checkpoint
+            logger.info("PRECOMPUTE RESUMING AFTER USER %s", after)
+        else:
+            after, started_at = None, time.time()
+            self.store.set_checkpoint(JOB, None, started_at)
+        user_ids = self.user_ids(after)
+        chunks = list(_batched(user_ids, self.chunk_size))
+        logger.info("PRECOMPUTE %s USERS IN %s CHUNKS (k=%s)", len(user_ids), len(chunks), self.k)
+
+        start = time.perf_counter()
+        users = 0
+        done_chunks = set()
+        next_checkpoint = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            in_flight = {}
+            position = 0
+            while position < len(chunks) or in_flight:
+                while position < len(chunks) and len(in_flight) < self.workers:
+                    in_flight[executor.submit(self.compute_chunk, chunks[position])] = position
+                    position += 1
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    users += future.result()
+                    done_chunks.add(in_flight.pop(future))
+                if next_checkpoint in done_chunks:
+                    while next_checkpoint in done_chunks:
+                        next_checkpoint += 1
+                    self.store.set_checkpoint(JOB, chunks[next_checkpoint - 1][-1], started_at)
+                    logger.info(
+                        "PRECOMPUTE: %s/%s users (%.0f users/s)",
+                        users, len(user_ids), users / (time.perf_counter() - start),
+                    )
+
+        elapsed = time.perf_counter() - start
+        self.store.clear_checkpoint(JOB)
+        self.store.finish_run(started_at)
+        stats = {
+            "users": users,
+            "chunks": len(chunks),
+            "k": self.k,
+            "seconds": round(elapsed, 3),
+            "users_per_second": round(users / elapsed, 1) if elapsed else 0.0,
+            "resumed_after": after,
+        }
+        logger.info("PRECOMPUTE DONE: %s users, %.1fs (%.0f users/s)", users, elapsed, stats["users_per_second"])
+        return stats
+
+
+def precompute_recommendations(k=RecommendationCFG.PRECOMPUTE_K, restart=False, **kwargs):
+    store = RecommendationStore()
+    try:
+        return RecommendationPrecompute(store, k=k, **kwargs).run(restart=restart)
+    finally:
+        store.close()
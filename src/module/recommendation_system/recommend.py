@@ -1,121 +1,213 @@
-from src.config.constant import Neo4jCFG
-from src.models.recommendation_model import (RecommendationEventResponse,
-                                             RecommendationUserEventResponse,
-                                             RecommendationUserResponse)
+import threading
+import time
+
+from src.config.constant import GraphSyncCFG, Neo4jCFG, RecommendationCFG
+from src.module.recommendation_system.category_index import (
+    get_category_index, init_category_index, stop_category_index)
+from src.module.recommendation_system.interaction_buffer import (
+    UNLIKE, get_interaction_buffer, start_interaction_buffer,
+    stop_interaction_buffer)
 from src.module.recommendation_system.neo4j_client import Neo4jClient
 from src.module.recommendation_system.neo4j_init import Neo4jInit
+from src.module.recommendation_system.neo4j_pool import get_neo4j_pool
+from src.module.recommendation_system.recommendation_cache import \
+    get_recommendation_cache
+from src.module.recommendation_system.recommendation_pages import \
+    get_recommendation_pages
+from src.module.recommendation_system.recommendation_store import \
+    get_recommendation_store
+from src.module.recommendation_system.sparse_engine import (
+    get_sparse_engine, init_sparse_engine, stop_sparse_engine)
 from src.utils.logger import logger
 
 
 def call_neo4j_client():
-    neo4j_client = Neo4jClient(
-        url=Neo4jCFG.URL, username=Neo4jCFG.USERNAME, password=Neo4jCFG.PASSWORD
-    )
+    neo4j_client = Neo4jClient(pool=get_neo4j_pool())
     return neo4j_client
 
 
-def upsert_event(event):
-    event = event.__dict__
-    event["tags"] = "|".join(event["tags"])
-    logger.info("CREATE/UPDATE EVENT")
-    neo4j_client = call_neo4j_client()
-    neo4j_client.upsert_event(event=event)
+def start_interaction_ingestion():
+    if RecommendationCFG.INTERACTION_WRITE_MODE == "buffered":
+        start_interaction_buffer(
+            flush_fn=_flush_interactions, on_flush=_on_interactions_written
+        )
 
-    response_object = RecommendationEventResponse(event_id=str(event["id"]))
 
-    return {"STATUS": "SUCCESS", "CONTENT": response_object}
+def stop_interaction_ingestion():
+    stop_interaction_buffer()
 
 
-def delete_event(event_id):
-    logger.info("DELETE EVENT")
-    neo4j_client = call_neo4j_client()
-    neo4j_client.delete_event(event_id=event_id)
+def start_recommendation_engine():
+    if RecommendationCFG.BACKEND == "sparse":
+        init_sparse_engine(client_factory=call_neo4j_client)
+    if RecommendationCFG.COLD_START_ENABLED:
+        init_category_index(client_factory=call_neo4j_client)
+
 
-    response_object = RecommendationEventResponse(event_id=event_id)
+def stop_recommendation_engine():
+    stop_category_index()
+    stop_sparse_engine()
 
-    return {"STATUS": "SUCCESS", "CONTENT": response_object}
 
+def _cold_start_recommendation(user_id, k):
+    """Popular events of the user's categories when it has too few interactions, else None."""
+    index = get_category_index()
+    return index.recommend(user_id, k) if index is not None else None
 
-def upsert_user(user):
-    user = user.__dict__
-    logger.info("CREATE/UPDATE USER")
+
+def _flush_interactions(interactions):
     neo4j_client = call_neo4j_client()
-    neo4j_client.upsert_user(user=user)
-    response_object = RecommendationUserResponse(user_id=user["id"])
+    neo4j_client.write_interactions(interactions=interactions)
 
-    return {"STATUS": "SUCCESS", "CONTENT": response_object}
 
+def _in_memory_indexes():
+    """In-process structures that follow graph writes: sparse engine and cold-start index."""
+    return [index for index in (get_sparse_engine(), get_category_index()) if index is not None]
 
-def delete_user(user_id):
-    logger.info("DELETE USER")
-    neo4j_client = call_neo4j_client()
-    neo4j_client.delete_user(user_id=user_id)
 
-    response_object = RecommendationUserResponse(user_id=user_id)
+def _apply_events(events):
+    for index in _in_memory_indexes():
+        for event in events:
+            index.apply_event(event["id"], event["categories"])
 
-    return {"STATUS": "SUCCESS", "CONTENT": response_object}
 
+def _remove_event(event_id):
+    for index in _in_memory_indexes():
+        index.remove_event(event_id)
 
-def view_event(data):
-    data = data.__dict__
-    user_id = data["user_id"]
-    event_id = data["event_id"]
-    logger.info("VIEW EVENT")
-    neo4j_client = call_neo4j_client()
-    neo4j_client.view_event(user_id=user_id, event_id=event_id)
 
-    response_object = RecommendationUserEventResponse(
-        event_id=event_id, user_id=user_id
-    )
+def _apply_users(users):
+    for index in _in_memory_indexes():
+        for user in users:
+            index.apply_user(user["id"], user["categories"])
 
-    return {"STATUS": "SUCCESS", "CONTENT": response_object}
 
+def _remove_user(user_id):
+    for index in _in_memory_indexes():
+        index.remove_user(user_id)
 
-def like_event(data):
-    data = data.__dict__
-    user_id = data["user_id"]
-    event_id = data["event_id"]
-    logger.info("LIKE EVENT")
-    neo4j_client = call_neo4j_client()
-    neo4j_client.like_event(user_id=user_id, event_id=event_id)
 
-    response_object = RecommendationUserEventResponse(
-        event_id=event_id, user_id=user_id
-    )
+def _apply_interactions(interactions):
+    for index in _in_memory_indexes():
+        index.apply_interactions(interactions)
 
-    return {"STATUS": "SUCCESS", "CONTENT": response_object}
 
+def _on_interactions_accepted(interactions):
+    """
+    Interactions taken by the API, written or not: later pages skip the
+    events and the users' cached and stored lists are dropped.
+    """
+    pages = get_recommendation_pages()
+    for interaction in interactions:
+        if interaction["type"] != UNLIKE:
+            pages.mark_seen(interaction["user_id"], [interaction["event_id"]])
+    _invalidate_users({interaction["user_id"] for interaction in interactions})
 
-def unlike_event(data):
-    data = data.__dict__
-    user_id = data["user_id"]
-    event_id = data["event_id"]
-    logger.info("UNLIKE EVENT")
-    neo4j_client = call_neo4j_client()
-    neo4j_client.unlike_event(user_id=user_id, event_id=event_id)
 
-    response_object = RecommendationUserEventResponse(
-        event_id=event_id, user_id=user_id
-    )
+def _on_interactions_written(interactions):
+    """
+    Flush callback of the write-behind buffer: the in-memory indexes follow
+    the graph, and lists computed since the interactions were accepted are
+    dropped again.
+    """
+    _apply_interactions(interactions)
+    _invalidate_users({interaction["user_id"] for interaction in interactions})
 
-    return {"STATUS": "SUCCESS", "CONTENT": response_object}
 
+def _invalidate_users(user_ids):
+    cache = get_recommendation_cache()
+    if cache is not None:
+        for user_id in user_ids:
+            cache.invalidate_user(user_id)
+    store = get_recommendation_store()
+    if store is not None:
+        store.mark_stale(user_ids)
 
-def get_user_recommendation(user_id):
-    logger.info("GENERATE RECOMMENDATION OF USER")
-    neo4j_client = call_neo4j_client()
-    recommendations = neo4j_client.get_recommendation(user_id=user_id)
-    logger.info(f"USER ID: {user_id}")
-    logger.info(f"EVENT IDS: {recommendations}")
 
-    # response_object = RecommendationItemResponse(item_list=recommendations)
+def _purge_event(event_id):
+    cache = get_recommendation_cache()
+    if cache is not None:
+        cache.purge_event(event_id)
+    store = get_recommendation_store()
+    if store is not None:
+        store.purge_event(event_id)
 
-    return {"STATUS": "SUCCESS", "CONTENT": recommendations}
 
-def init_neo4j():
-    logger.info("INIT NEO4J STARTING")
+def _stored_recommendation(user_id, k):
+    store = get_recommendation_store()
+    return store.get(user_id, k) if store is not None else None
+
+
+def _page_depth(k):
+    return max(k, RecommendationCFG.PAGE_DEPTH)
+
+
+def _drop_previous_graph(neo4j_init, version):
+    try:
+        neo4j_init.drop_version(version)
+    except Exception as e:
+        logger.error("DROPPING GRAPH v%s FAILED: %s", version, e)
+    finally:
+        neo4j_init.close()
+
+
+def init_neo4j(mode="full", defer_gc=True):
+    """
+    Sync the recommendation graph from MySQL.
+    mode "full" clears and rebuilds the graph in place, "shadow" rebuilds it
+    under a new version and swaps it in without downtime, "incremental" only
+    applies the changes since the last sync.
+
+    The version a shadow rebuild replaced is dropped SHADOW_GC_GRACE seconds
+    after the swap, by a background timer unless `defer_gc` is False.
+    """
+    logger.info("INIT NEO4J STARTING (%s)", mode.upper())
     neo4j_init = Neo4jInit(url=Neo4jCFG.URL, username=Neo4jCFG.USERNAME, password=Neo4jCFG.PASSWORD)
-    neo4j_init.init_neo4j()
+    try:
+        if mode == "incremental":
+            sync_stats = neo4j_init.sync_neo4j()
+        elif mode == "shadow":
+            sync_stats = neo4j_init.rebuild_shadow()
+        else:
+            sync_stats = neo4j_init.init_neo4j()
+    except Exception:
+        neo4j_init.close()
+        raise
     logger.info("INIT NEO4J COMPLETED")
-    
-    return {"STATUS": "SUCCESS", "CONTENT": "onichan baka"}
+
+    if mode != "shadow":
+        neo4j_init.close()
+    elif defer_gc:
+        timer = threading.Timer(
+            GraphSyncCFG.SHADOW_GC_GRACE,
+            _drop_previous_graph,
+            args=(neo4j_init, sync_stats["versions"]["previous"]),
+        )
+        timer.daemon = True
+        timer.start()
+    else:
+        time.sleep(GraphSyncCFG.SHADOW_GC_GRACE)
+        _drop_previous_graph(neo4j_init, sync_stats["versions"]["previous"])
+
+    return {"STATUS": "SUCCESS", "CONTENT": sync_stats}
+
+
+def get_stats():
+    stats = {"neo4j_pool": get_neo4j_pool().stats()}
+    buffer = get_interaction_buffer()
+    if buffer is not None:
+        stats["interaction_buffer"] = buffer.stats()
+    cache = get_recommendation_cache()
+    if cache is not None:
+        stats["recommendation_cache"] = cache.stats()
+    engine = get_sparse_engine()
+    if engine is not None:
+        stats["sparse_engine"] = engine.stats()
+    store = get_recommendation_store()
+    if store is not None:
+        stats["recommendation_store"] = store.stats()
+    index = get_category_index()
+    if index is not None:
+        stats["category_index"] = index.stats()
+    stats["recommendation_pages"] = get_recommendation_pages().stats()
+    return {"STATUS": "SUCCESS", "CONTENT": stats}
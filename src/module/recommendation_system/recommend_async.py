@@ -0,0 +1,323 @@
+"""
+Recommendation service functions of the API routes. Graph I/O goes through
+AsyncNeo4jClient; the write-behind buffer, the sparse engine, the
+cold-start index and their helpers live in recommend.py. Those take locks
+that folds and reloads hold for a long time, so they are called off the
+event loop.
+"""
+import asyncio
+import itertools
+import json
+
+from src.config.constant import RecommendationCFG
+from src.models.recommendation_model import (RecommendationEventResponse,
+                                             RecommendationInteractionResponse,
+                                             RecommendationUserEventResponse,
+                                             RecommendationUserResponse)
+from src.module.recommendation_system.async_neo4j_client import \
+    AsyncNeo4jClient
+from src.module.recommendation_system.interaction_buffer import (
+    LIKE, UNLIKE, VIEW, get_interaction_buffer)
+from src.module.recommendation_system.neo4j_client import _batched
+from src.module.recommendation_system.neo4j_pool import get_async_neo4j_pool
+from src.module.recommendation_system.recommend import (
+    _apply_events, _apply_interactions, _apply_users,
+    _cold_start_recommendation, _invalidate_users, _on_interactions_accepted,
+    _page_depth, _purge_event, _remove_event, _remove_user,
+    _stored_recommendation, call_neo4j_client)
+from src.module.recommendation_system.recommend import \
+    get_stats as get_sync_stats
+from src.module.recommendation_system.recommendation_cache import \
+    get_recommendation_cache
+from src.module.recommendation_system.recommendation_pages import \
+    get_recommendation_pages
+from src.module.recommendation_system.sparse_engine import (
+    get_sparse_engine, init_sparse_engine)
+from src.utils.logger import logger
+
+
+def call_async_neo4j_client():
+    return AsyncNeo4jClient(pool=get_async_neo4j_pool())
+
+
+async def _sparse_engine():
+    """Engine started by the app lifespan, or loaded now (off the event loop) outside it."""
+    engine = get_sparse_engine()
+    if engine is None:
+        engine = await asyncio.to_thread(init_sparse_engine, client_factory=call_neo4j_client)
+    return engine
+
+
+def _local_recommendation(user_id, k):
+    """
+    Cold-start list when the user has too few interactions, else the
+    precomputed one, else None. Cold-start comes first: the precompute job
+    stores a (usually empty) collaborative list for cold users too.
+    """
+    recommendations = _cold_start_recommendation(user_id, k)
+    if recommendations is None:
+        recommendations = _stored_recommendation(user_id, k)
+    return recommendations
+
+
+def _local_recommendations(user_ids, k):
+    recommendations = {}
+    for user_id in user_ids:
+        local = _local_recommendation(user_id, k)
+        if local is not None:
+            recommendations[user_id] = local
+    return recommendations
+
+
+async def _compute_recommendation(user_id, k):
+    if RecommendationCFG.BACKEND == "sparse":
+        engine = await _sparse_engine()
+        # CPU bound, keep it off the event loop
+        return await asyncio.to_thread(engine.recommend, user_id=user_id, k=k)
+    neo4j_client = call_async_neo4j_client()
+    return await neo4j_client.get_recommendation(user_id=user_id, k=k)
+
+
+async def _compute_recommendations(user_ids, k):
+    if RecommendationCFG.BACKEND == "sparse":
+        engine = await _sparse_engine()
+        return await asyncio.to_thread(engine.recommend_many, user_ids=user_ids, k=k)
+    neo4j_client = call_async_neo4j_client()
+    return await neo4j_client.get_recommendations(user_ids=user_ids, k=k)
+
+
+async def _recommend_chunk(user_ids, k):
+    """[(user_id, event_ids)] of one chunk, scoring only the users without a cached, cold-start or stored list."""
+    cache = get_recommendation_cache()
+    recommendations = {}
+    if cache is not None:
+        for user_id in user_ids:
+            cached = cache.get(user_id, k)
+            if cached is not None:
+                recommendations[user_id] = cached
+    # cold-start index and SQLite store, both behind locks
+    found = await asyncio.to_thread(
+        _local_recommendations, [user_id for user_id in user_ids if user_id not in recommendations], k
+    )
+    missing = [user_id for user_id in user_ids if user_id not in recommendations and user_id not in found]
+    if missing:
+        found.update(await _compute_recommendations(missing, k))
+    if cache is not None:
+        for user_id, event_ids in found.items():
+            cache.set(user_id, k, event_ids)
+    recommendations.update(found)
+    return [(user_id, recommendations[user_id]) for user_id in user_ids]
+
+
+async def _record_interactions(interactions):
+    """
+    Hand interactions to the write-behind buffer if it runs, else write
+    them now. The in-memory indexes are updated once, by the buffer's
+    flush callback or here after the write. ValueError if an event id is
+    not numeric.
+    """
+    for interaction in interactions:
+        try:
+            int(interaction["event_id"])
+        except ValueError:
+            raise ValueError(f"Invalid event_id {interaction['event_id']!r}")
+    buffer = get_interaction_buffer()
+    if buffer is not None:
+        # add() blocks while the buffer is full
+        await asyncio.to_thread(buffer.add, interactions)
+    else:
+        await call_async_neo4j_client().write_interactions(interactions=interactions)
+        await asyncio.to_thread(_apply_interactions, interactions)
+    await asyncio.to_thread(_on_interactions_accepted, interactions)
+    return buffer is not None
+
+
+async def _upsert_events(events):
+    events = [event.__dict__ for event in events]
+    for event in events:
+        event["tags"] = "|".join(event["tags"])
+    logger.info("CREATE/UPDATE %s EVENTS", len(events))
+    await call_async_neo4j_client().upsert_events(events=events)
+    await asyncio.to_thread(_apply_events, events)
+
+    return [RecommendationEventResponse(event_id=str(event["id"])) for event in events]
+
+
+async def upsert_event(event):
+    response_object = (await _upsert_events([event]))[0]
+
+    return {"STATUS": "SUCCESS", "CONTENT": response_object}
+
+
+async def upsert_events(events):
+    response_object = await _upsert_events(events)
+
+    return {"STATUS": "SUCCESS", "CONTENT": response_object}
+
+
+async def delete_event(event_id):
+    logger.info("DELETE EVENT")
+    await call_async_neo4j_client().delete_event(event_id=event_id)
+    await asyncio.to_thread(_remove_event, event_id)
+    await asyncio.to_thread(_purge_event, event_id)
+
+    response_object = RecommendationEventResponse(event_id=event_id)
+
+    return {"STATUS": "SUCCESS", "CONTENT": response_object}
+
+
+async def _upsert_users(users):
+    users = [user.__dict__ for user in users]
+    logger.info("CREATE/UPDATE %s USERS", len(users))
+    await call_async_neo4j_client().upsert_users(users=users)
+    await asyncio.to_thread(_apply_users, users)
+    await asyncio.to_thread(_invalidate_users, [user["id"] for user in users])
+
+    return [RecommendationUserResponse(user_id=user["id"]) for user in users]
+
+
+async def upsert_user(user):
+    response_object = (await _upsert_users([user]))[0]
+
+    return {"STATUS": "SUCCESS", "CONTENT": response_object}
+
+
+async def upsert_users(users):
+    response_object = await _upsert_users(users)
+
+    return {"STATUS": "SUCCESS", "CONTENT": response_object}
+
+
+async def delete_user(user_id):
+    logger.info("DELETE USER")
+    await call_async_neo4j_client().delete_user(user_id=user_id)
+    await asyncio.to_thread(_remove_user, user_id)
+    await asyncio.to_thread(_invalidate_users, [user_id])
+
+    response_object = RecommendationUserResponse(user_id=user_id)
+
+    return {"STATUS": "SUCCESS", "CONTENT": response_object}
+
+
+async def _record_interaction(data, interaction_type):
+    data = data.__dict__
+    user_id = data["user_id"]
+    event_id = data["event_id"]
+    logger.info("%s EVENT", interaction_type.upper())
+    await _record_interactions(
+        [{"user_id": user_id, "event_id": event_id, "type": interaction_type}]
+    )
+
+    response_object = RecommendationUserEventResponse(
+        event_id=event_id, user_id=user_id
+    )
+
+    return {"STATUS": "SUCCESS", "CONTENT": response_object}
+
+
+async def view_event(data):
+    return await _record_interaction(data, VIEW)
+
+
+async def like_event(data):
+    return await _record_interaction(data, LIKE)
+
+
+async def unlike_event(data):
+    return await _record_interaction(data, UNLIKE)
+
+
+async def record_interactions(interactions):
+    interactions = [interaction.__dict__ for interaction in interactions]
+    logger.info("RECORD %s INTERACTIONS", len(interactions))
+    buffered = await _record_interactions(interactions)
+
+    response_object = RecommendationInteractionResponse(
+        accepted=len(interactions), buffered=buffered
+    )
+
+    return {"STATUS": "SUCCESS", "CONTENT": response_object}
+
+
+async def _ranked_recommendation(user_id, k):
+    cache = get_recommendation_cache()
+    recommendations = cache.get(user_id, k) if cache is not None else None
+    if recommendations is None:
+        # cold-start index and SQLite store, both behind locks
+        recommendations = await asyncio.to_thread(_local_recommendation, user_id, k)
+        if recommendations is None:
+            recommendations = await _compute_recommendation(user_id, k)
+        if cache is not None:
+            cache.set(user_id, k, recommendations)
+    return recommendations
+
+
+async def get_user_recommendation(user_id, k=20, cursor=None):
+    """
+    One page of k recommendations. Without a cursor a ranked list of
+    PAGE_DEPTH events is computed and carried by the cursor of the
+    following pages; NEXT_CURSOR is None on the last page.
+    """
+    logger.info("GENERATE RECOMMENDATION OF USER")
+    pages = get_recommendation_pages()
+    if cursor is None:
+        ranked = await _ranked_recommendation(user_id, _page_depth(k))
+        recommendations, next_cursor = pages.first_page(user_id, ranked, k)
+    else:
+        recommendations, next_cursor = pages.page(user_id, cursor, k)
+    logger.info(f"USER ID: {user_id}")
+    logger.info(f"EVENT IDS: {recommendations}")
+
+    return {"STATUS": "SUCCESS", "CONTENT": recommendations, "NEXT_CURSOR": next_cursor}
+
+
+async def stream_batch_recommendation(user_ids, k):
+    """
+    Yield NDJSON lines {"user_id", "event_ids"}, one per distinct user, a
+    chunk at a time in completion order. At most BATCH_CONCURRENCY chunks
+    of BATCH_CHUNK_SIZE users are evaluated at once; users of a failed
+    chunk get an {"user_id", "error"} line instead.
+    """
+    user_ids = list(dict.fromkeys(user_ids))
+    logger.info("GENERATE RECOMMENDATIONS OF %s USERS", len(user_ids))
+    chunks = _batched(user_ids, RecommendationCFG.BATCH_CHUNK_SIZE)
+    in_flight = {
+        asyncio.ensure_future(_recommend_chunk(chunk, k)): chunk
+        for chunk in itertools.islice(chunks, RecommendationCFG.BATCH_CONCURRENCY)
+    }
+    try:
+        while in_flight:
+            done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                chunk = in_flight.pop(task)
+                try:
+                    lines = [
+                        {"user_id": user_id, "event_ids": event_ids}
+                        for user_id, event_ids in task.result()
+                    ]
+                except Exception as err:
+                    logger.error("BATCH RECOMMENDATION OF %s USERS FAILED: %s", len(chunk), err)
+                    lines = [{"user_id": user_id, "error": str(err)} for user_id in chunk]
+                next_chunk = next(chunks, None)
+                if next_chunk is not None:
+                    in_flight[asyncio.ensure_future(_recommend_chunk(next_chunk, k))] = next_chunk
+                yield "".join(json.dumps(line) + "\n" for line in lines)
+    finally:
+        # the client went away mid-stream
+        for task in in_flight:
+            task.cancel()
+
+
+def get_batch_recommendation(data):
+    data = data.__dict__
+    if len(data["user_ids"]) > RecommendationCFG.BATCH_MAX_USERS:
+        raise ValueError(
+            f"At most {RecommendationCFG.BATCH_MAX_USERS} users per batch, got {len(data['user_ids'])}"
+        )
+    return stream_batch_recommendation(data["user_ids"], k=data["k"])
+
+
+async def get_stats():
+    stats = get_sync_stats()
+    stats["CONTENT"]["neo4j_async_pool"] = get_async_neo4j_pool().stats()
+    return stats
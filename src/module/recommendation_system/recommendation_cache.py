@@ -0,0 +1,94 @@
+from abc import ABC, abstractmethod
+
+from src.config.constant import RecommendationCFG
+from src.utils.ttl_cache import TTLCache
+
+
+class RecommendationCache(ABC):
+    """
+    Cache of computed recommendations keyed by (user_id, k).
+    A shared backend (e.g. Redis) only has to implement these methods.
+    """
+
+    @abstractmethod
+    def get(self, user_id, k):
+        """Cached event ids, or None on a miss."""
+
+    @abstractmethod
+    def set(self, user_id, k, event_ids):
+        pass
+
+    @abstractmethod
+    def invalidate_user(self, user_id):
+        """Drop every cached list of one user."""
+
+    @abstractmethod
+    def purge_event(self, event_id):
+        """Remove a deleted event from every cached list."""
+
+    @abstractmethod
+    def stats(self):
+        pass
+
+
+class InMemoryRecommendationCache(RecommendationCache):
+    """
+    Per-worker LRU cache. Entries are stored per user ({k: event_ids}) so a
+    user can be invalidated in O(1); the entry count bound is on users.
+    """
+
+    def __init__(
+        self,
+        max_entries=RecommendationCFG.CACHE_MAX_ENTRIES,
+        ttl=RecommendationCFG.CACHE_TTL,
+    ):
+        self._cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, k):
+        lists = self._cache.get(user_id)
+        if lists is None or k not in lists:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return list(lists[k])
+
+    def set(self, user_id, k, event_ids):
+        event_ids = list(event_ids)
+        if not self._cache.update(user_id, lambda lists: {**lists, k: event_ids}):
+            self._cache.set(user_id, {k: event_ids})
+
+    def invalidate_user(self, user_id):
+        self._cache.pop(user_id)
+
+    def purge_event(self, event_id):
+        event_id = int(event_id)
+        for user_id in self._cache.keys():
+            self._cache.update(
+                user_id,
+                lambda lists: {
+                    k: [cached for cached in event_ids if cached != event_id]
+                    for k, event_ids in lists.items()
+                },
+            )
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            **self._cache.stats(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+
+_cache = None
+
+
+def get_recommendation_cache():
+    """Recommendation cache of this worker, or None when caching is disabled."""
+    global _cache
+    if _cache is None and RecommendationCFG.CACHE_ENABLED:
+        _cache = InMemoryRecommendationCache()
+    return _cache
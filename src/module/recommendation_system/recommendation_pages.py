@@ -0,0 +1,111 @@
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+from src.config.constant import RecommendationCFG
+from src.utils.ttl_cache import TTLCache
+
+_SIGNATURE_SIZE = 16
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _sign(payload):
+    key = RecommendationCFG.PAGE_CURSOR_SECRET.encode()
+    return hmac.new(key, payload, hashlib.sha256).digest()[:_SIGNATURE_SIZE]
+
+
+def encode_cursor(user_id, ranked, offset, expires_at):
+    payload = json.dumps(
+        {"u": user_id, "e": ranked, "o": offset, "x": expires_at}, separators=(",", ":")
+    ).encode()
+    return _b64encode(payload) + "." + _b64encode(_sign(payload))
+
+
+def decode_cursor(cursor):
+    """(user_id, ranked, offset, expires_at) of a cursor; ValueError if it is malformed or forged."""
+    try:
+        payload, signature = cursor.split(".")
+        payload = _b64decode(payload)
+        if not hmac.compare_digest(_b64decode(signature), _sign(payload)):
+            raise ValueError
+        fields = json.loads(payload)
+        user_id, ranked, offset, expires_at = (
+            str(fields["u"]), list(fields["e"]), int(fields["o"]), float(fields["x"])
+        )
+    except (ValueError, KeyError, TypeError):
+        raise ValueError("Invalid cursor")
+    if not 0 <= offset <= len(ranked):
+        raise ValueError("Invalid cursor")
+    return user_id, ranked, offset, expires_at
+
+
+class RecommendationPages:
+    """
+    Ranked recommendation lists behind cursor pagination.
+
+    The first page computes a deep, de-duplicated list; the cursor of every
+    later page carries that list and the offset into it, signed, so any
+    worker serves the next page without recomputing anything. Events the
+    user interacts with after the list was built are skipped when pages
+    are served by the worker that recorded the interaction.
+    """
+
+    def __init__(
+        self,
+        max_entries=RecommendationCFG.PAGE_CACHE_MAX_ENTRIES,
+        ttl=RecommendationCFG.PAGE_CACHE_TTL,
+    ):
+        self.ttl = ttl
+        self._seen = TTLCache(max_entries=max_entries, ttl=ttl)
+
+    def first_page(self, user_id, ranked, limit):
+        """(page, next_cursor) of a freshly computed `ranked` list."""
+        ranked = list(dict.fromkeys(ranked))
+        return self._page(user_id, ranked, 0, limit, time.time() + self.ttl)
+
+    def page(self, user_id, cursor, limit):
+        """(page, next_cursor) of a cursor; ValueError if it is invalid or expired."""
+        cursor_user_id, ranked, offset, expires_at = decode_cursor(cursor)
+        if cursor_user_id != user_id or expires_at < time.time():
+            raise ValueError("Invalid or expired cursor")
+        return self._page(user_id, ranked, offset, limit, expires_at)
+
+    def _page(self, user_id, ranked, offset, limit, expires_at):
+        seen = self._seen.get(user_id, frozenset())
+        page = []
+        position = offset
+        while position < len(ranked) and len(page) < limit:
+            if ranked[position] not in seen:
+                page.append(ranked[position])
+            position += 1
+        next_cursor = (
+            encode_cursor(user_id, ranked, position, expires_at) if position < len(ranked) else None
+        )
+        return page, next_cursor
+
+    def mark_seen(self, user_id, event_ids):
+        event_ids = {int(event_id) for event_id in event_ids}
+        if not self._seen.update(user_id, lambda seen: seen | event_ids):
+            self._seen.set(user_id, frozenset(event_ids))
+
+    def stats(self):
+        return {"seen_users": len(self._seen)}
+
+
+_pages = None
+
+
+def get_recommendation_pages():
+    global _pages
+    if _pages is None:
+        _pages = RecommendationPages()
+    return _pages
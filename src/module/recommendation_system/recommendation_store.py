@@ -0,0 +1,187 @@
+import sqlite3
+import threading
+import time
+from array import array
+
+from src.config.constant import RecommendationCFG
+
+# host parameters per statement, below SQLite's historical limit of 999
+_MAX_PARAMS = 500
+
+
+def _pack(event_ids):
+    return array("q", event_ids).tobytes()
+
+
+def _unpack(blob):
+    event_ids = array("q")
+    event_ids.frombytes(blob)
+    return event_ids.tolist()
+
+
+class RecommendationStore:
+    """
+    Precomputed recommendations in an embedded SQLite file, one row per
+    user with the event ids packed as int64. Shared by the precompute job
+    and every API worker on the host (WAL mode, one connection per process).
+
+    A user is stale when an interaction or profile change was recorded
+    after its list was computed; stale users are served live until the
+    next job run. Deleted events are filtered out on read until then.
+    """
+
+    def __init__(self, path=RecommendationCFG.STORE_PATH):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS recommendations (
+                    user_id TEXT PRIMARY KEY,
+                    k INTEGER NOT NULL,
+                    event_ids BLOB NOT NULL,
+                    computed_at REAL NOT NULL
+                )""")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS stale_users (
+                    user_id TEXT PRIMARY KEY,
+                    marked_at REAL NOT NULL
+                )""")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS deleted_events (
+                    event_id INTEGER PRIMARY KEY,
+                    deleted_at REAL NOT NULL
+                )""")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    job TEXT PRIMARY KEY,
+                    last_user_id TEXT,
+                    started_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )""")
+
+    def get(self, user_id, k):
+        """Stored event ids, or None when missing, stale or computed for a smaller k."""
+        with self._lock:
+            row = self._connection.execute(
+                """
+                SELECT r.k, r.event_ids, s.user_id IS NOT NULL
+                FROM recommendations r LEFT JOIN stale_users s USING (user_id)
+                WHERE r.user_id = ?
+                """,
+                (user_id,),
+            ).fetchone()
+            event_ids = deleted = None
+            if row is not None and row[0] >= k and not row[2]:
+                event_ids = _unpack(row[1])
+                deleted = self._deleted(event_ids)
+        if row is None or row[0] < k:
+            self.misses += 1
+            return None
+        if row[2]:
+            self.stale += 1
+            return None
+        self.hits += 1
+        if deleted:
+            event_ids = [event_id for event_id in event_ids if event_id not in deleted]
+        return event_ids[:k]
+
+    def _deleted(self, event_ids):
+        """The ones of `event_ids` marked deleted since the last complete run."""
+        deleted = set()
+        for start in range(0, len(event_ids), _MAX_PARAMS):
+            chunk = event_ids[start:start + _MAX_PARAMS]
+            deleted.update(event_id for event_id, in self._connection.execute(
+                f"SELECT event_id FROM deleted_events WHERE event_id IN ({', '.join('?' * len(chunk))})",
+                chunk,
+            ))
+        return deleted
+
+    def put_many(self, rows, k, computed_at):
+        """
+        Store [(user_id, event_ids)] computed for `k`. Stale marks recorded
+        before `computed_at` (the start of the computation) are cleared.
+        """
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO recommendations VALUES (?, ?, ?, ?)",
+                [(user_id, k, _pack(event_ids), computed_at) for user_id, event_ids in rows],
+            )
+            self._connection.executemany(
+                "DELETE FROM stale_users WHERE user_id = ? AND marked_at < ?",
+                [(user_id, computed_at) for user_id, _ in rows],
+            )
+
+    def mark_stale(self, user_ids):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO stale_users VALUES (?, ?)",
+                [(user_id, now) for user_id in user_ids],
+            )
+
+    def purge_event(self, event_id):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO deleted_events VALUES (?, ?)", (int(event_id), time.time())
+            )
+
+    def finish_run(self, started_at):
+        """Drop deleted-event marks a complete run (started at `started_at`) has applied."""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM deleted_events WHERE deleted_at < ?", (started_at,))
+
+    def get_checkpoint(self, job):
+        """(last_user_id, started_at) of an unfinished run of `job`, or None."""
+        with self._lock:
+            return self._connection.execute(
+                "SELECT last_user_id, started_at FROM checkpoints WHERE job = ?", (job,)
+            ).fetchone()
+
+    def set_checkpoint(self, job, last_user_id, started_at):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?)",
+                (job, last_user_id, started_at, time.time()),
+            )
+
+    def clear_checkpoint(self, job):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM checkpoints WHERE job = ?", (job,))
+
+    def stats(self):
+        with self._lock:
+            users = self._connection.execute("SELECT count(*) FROM recommendations").fetchone()[0]
+            stale = self._connection.execute("SELECT count(*) FROM stale_users").fetchone()[0]
+        lookups = self.hits + self.misses + self.stale
+        return {
+            "path": self.path,
+            "users": users,
+            "stale_users": stale,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_lookups": self.stale,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+        }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_recommendation_store():
+    """Precomputed recommendation store, or None when it is disabled."""
+    global _store
+    if _store is None and RecommendationCFG.STORE_ENABLED:
+        with _store_lock:
+            if _store is None:
+                _store = RecommendationStore()
+    return _store
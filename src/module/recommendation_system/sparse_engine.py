@@ -0,0 +1,528 @@
+import threading
+import time
+
+import numpy as np
+from scipy import sparse
+
+from src.config.constant import RecommendationCFG
+from src.utils.logger import logger
+
+VIEWED = "VIEWED"
+LIKED = "LIKED"
+PREFERRED = "PREFERRED"
+RELATIONS = (VIEWED, LIKED, PREFERRED)
+
+EVENT = "Event"
+CATEGORY = "Category"
+
+
+class _Snapshot:
+    """Immutable matrices a query runs against; replaced as a whole on every fold."""
+
+    def __init__(self, relations, degree, node_event_ids, active_users):
+        n_users, n_nodes = len(active_users), len(node_event_ids)
+        for rel in RELATIONS:
+            relations[rel].resize((n_users, n_nodes))
+        combined = relations[VIEWED] + relations[LIKED] + relations[PREFERRED]
+        # users x (events + categories): every node a user is directly connected to
+        self.neighbours = (combined > 0).astype(np.float32).tocsr()
+        self.neighbours_by_node = self.neighbours.tocsc()
+        # users x events: number of VIEWED/LIKED relationships, one row each in Cypher
+        self.interactions = (relations[VIEWED] + relations[LIKED]).tocsr()
+        self.interactions.eliminate_zeros()
+        self.degree = degree[:n_nodes]
+        self.weights = np.zeros(n_nodes)
+        linked = self.degree > 1
+        self.weights[linked] = 1.0 / np.log(self.degree[linked])
+        self.node_event_ids = node_event_ids
+        self.active_users = active_users
+
+
+class _Graph:
+    """
+    User-Event (VIEWED/LIKED) and User-Category (PREFERRED) bipartite graph.
+
+    Relationships are kept as one binary CSR matrix per relationship type
+    (users x nodes). Incremental changes are recorded as overrides and
+    folded into new matrices at most every `fold_interval` seconds.
+    """
+
+    def __init__(self):
+        self.user_index = {}
+        self.node_index = {}
+        self.n_users = 0
+        self.n_nodes = 0
+        self.active_users = np.zeros(0, dtype=bool)
+        self.node_event_ids = np.zeros(0, dtype=np.int64)
+        self.degree = np.zeros(0)
+        self.event_categories = {}
+        self.relations = {
+            rel: sparse.csr_matrix((0, 0), dtype=np.int8) for rel in RELATIONS
+        }
+        self.overrides = {rel: {} for rel in RELATIONS}
+        self.snapshot = None
+        self.folded_at = 0.0
+
+    @staticmethod
+    def _grow(array, size, fill):
+        if size <= len(array):
+            return array
+        grown = np.full(max(size, 2 * len(array), 16), fill, dtype=array.dtype)
+        grown[:len(array)] = array
+        return grown
+
+    def add_user(self, user_id):
+        row = self.n_users
+        self.n_users += 1
+        self.active_users = self._grow(self.active_users, self.n_users, False)
+        self.active_users[row] = True
+        self.user_index[user_id] = row
+        return row
+
+    def add_node(self, label, node_id, degree=0):
+        col = self.n_nodes
+        self.n_nodes += 1
+        self.degree = self._grow(self.degree, self.n_nodes, 0.0)
+        self.node_event_ids = self._grow(self.node_event_ids, self.n_nodes, -1)
+        self.degree[col] = degree
+        self.node_event_ids[col] = node_id if label == EVENT else -1
+        self.node_index[(label, node_id)] = col
+        return col
+
+    def value(self, rel, row, col):
+        override = self.overrides[rel].get((row, col))
+        if override is not None:
+            return override
+        matrix = self.relations[rel]
+        if row >= matrix.shape[0]:
+            return 0
+        start, end = matrix.indptr[row], matrix.indptr[row + 1]
+        cols = matrix.indices[start:end]
+        position = np.searchsorted(cols, col)
+        return int(position < len(cols) and cols[position] == col and matrix.data[start + position] != 0)
+
+    def row_cols(self, rel, row):
+        matrix = self.relations[rel]
+        cols = set()
+        if row < matrix.shape[0]:
+            start, end = matrix.indptr[row], matrix.indptr[row + 1]
+            cols.update(matrix.indices[start:end][matrix.data[start:end] != 0].tolist())
+        for (override_row, col), value in self.overrides[rel].items():
+            if override_row == row:
+                (cols.add if value else cols.discard)(col)
+        return cols
+
+    def col_rows(self, rel, col):
+        matrix = self.relations[rel]
+        positions = np.flatnonzero((matrix.indices == col) & (matrix.data != 0))
+        rows = set((np.searchsorted(matrix.indptr, positions, side="right") - 1).tolist())
+        for (row, override_col), value in self.overrides[rel].items():
+            if override_col == col:
+                (rows.add if value else rows.discard)(row)
+        return rows
+
+    def set_edge(self, rel, row, col, value):
+        current = self.value(rel, row, col)
+        if current == value:
+            return
+        self.overrides[rel][(row, col)] = value
+        self.degree[col] += value - current
+
+    def pending(self):
+        return sum(len(overrides) for overrides in self.overrides.values())
+
+    def fold(self):
+        shape = (self.n_users, self.n_nodes)
+        for rel in RELATIONS:
+            matrix = self.relations[rel]
+            matrix.resize(shape)
+            overrides = self.overrides[rel]
+            if overrides:
+                keys = list(overrides)
+                rows = np.fromiter((row for row, _ in keys), dtype=np.int64, count=len(keys))
+                cols = np.fromiter((col for _, col in keys), dtype=np.int64, count=len(keys))
+                desired = np.fromiter(overrides.values(), dtype=np.int8, count=len(keys))
+                current = np.asarray(matrix[rows, cols]).ravel().astype(np.int8)
+                delta = sparse.csr_matrix((desired - current, (rows, cols)), shape=shape)
+                matrix = (matrix + delta).tocsr()
+                matrix.eliminate_zeros()
+                matrix.sort_indices()
+            self.relations[rel] = matrix
+            self.overrides[rel] = {}
+        self.snapshot = _Snapshot(
+            relations={rel: matrix.copy() for rel, matrix in self.relations.items()},
+            degree=self.degree.copy(),
+            node_event_ids=self.node_event_ids[:self.n_nodes].copy(),
+            active_users=self.active_users[:self.n_users].copy(),
+        )
+        self.folded_at = time.monotonic()
+
+
+class SparseAdamicAdarEngine:
+    """
+    In-process replacement for the Cypher recommendation query.
+
+    Adamic-Adar scores of all users against one user are a single sparse
+    matrix-vector product over the user x node incidence matrix, weighted by
+    1 / log(degree) of every shared node (degree counts all relationships,
+    as gds.alpha.linkprediction.adamicAdar does).
+
+    Candidates are pruned like RECOMMENDATION_QUERY: nodes above
+    `max_hub_degree` are not expanded and at most `fan_out` candidate users
+    are scored. Where Cypher keeps an arbitrary `fan_out` candidates and
+    orders tied neighbours arbitrarily, the engine keeps the first ones in
+    load order and breaks score ties by load order, so results are
+    deterministic.
+    """
+
+    def __init__(
+        self,
+        client_factory,
+        neighbours=RecommendationCFG.NEIGHBOURS,
+        max_hub_degree=RecommendationCFG.CANDIDATE_MAX_HUB_DEGREE,
+        fan_out=RecommendationCFG.CANDIDATE_FAN_OUT,
+        fold_interval=RecommendationCFG.SPARSE_FOLD_INTERVAL,
+        reload_interval=RecommendationCFG.SPARSE_RELOAD_INTERVAL,
+    ):
+        self.client_factory = client_factory
+        self.neighbours = neighbours
+        self.max_hub_degree = max_hub_degree
+        self.fan_out = fan_out
+        self.fold_interval = fold_interval
+        self.reload_interval = reload_interval
+        self._lock = threading.RLock()
+        self._graph = _Graph()
+        self._journal = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---------- loading ----------
+
+    def load(self):
+        """(Re)load the whole graph from Neo4j without blocking queries."""
+        start = time.perf_counter()
+        with self._lock:
+            self._journal = []
+        try:
+            graph = self._read_graph(self.client_factory())
+            with self._lock:
+                for name, args in self._journal:
+                    getattr(self, name)(graph, *args)
+                graph.fold()
+                self._graph = graph
+        finally:
+            with self._lock:
+                self._journal = None
+        logger.info(
+            "SPARSE ENGINE LOADED %s USERS, %s NODES IN %.2fs",
+            graph.n_users, graph.n_nodes, time.perf_counter() - start,
+        )
+
+    def _read_graph(self, neo4j_client):
+        graph = _Graph()
+        for user_id, in neo4j_client.stream_query("MATCH (u:User) RETURN u.id"):
+            graph.add_user(user_id)
+
+        query = """
+            MATCH (n) WHERE n:Event OR n:Category
+            RETURN n:Event AS is_event, n.id AS id, size([(n)--() | 1]) AS degree
+            """
+        for is_event, node_id, degree in neo4j_client.stream_query(query):
+            graph.add_node(EVENT if is_event else CATEGORY, node_id, degree)
+
+        query = "MATCH (e:Event)-[:IN_CATEGORY]->(c:Category) RETURN e.id, c.id"
+        for event_id, category_id in neo4j_client.stream_query(query):
+            graph.event_categories.setdefault(event_id, set()).add(category_id)
+
+        coordinates = {rel: ([], []) for rel in RELATIONS}
+        query = """
+            MATCH (u:User)-[r:VIEWED|LIKED|PREFERRED]->(n)
+            RETURN u.id, type(r), n.id
+            """
+        for user_id, rel, node_id in neo4j_client.stream_query(query):
+            label = CATEGORY if rel == PREFERRED else EVENT
+            col = graph.node_index.get((label, node_id))
+            row = graph.user_index.get(user_id)
+            if col is None or row is None:
+                continue
+            rows, cols = coordinates[rel]
+            rows.append(row)
+            cols.append(col)
+
+        shape = (graph.n_users, graph.n_nodes)
+        for rel, (rows, cols) in coordinates.items():
+            matrix = sparse.csr_matrix(
+                (np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=shape
+            )
+            # duplicate relationships of one type only count once as a neighbour
+            matrix.data[:] = 1
+            matrix.sort_indices()
+            graph.relations[rel] = matrix
+        return graph
+
+    def _reload_loop(self):
+        while not self._stop.wait(self.reload_interval):
+            try:
+                self.load()
+            except Exception as e:
+                logger.error("SPARSE ENGINE RELOAD FAILED: %s", e)
+
+    def start(self):
+        self.load()
+        if self.reload_interval > 0:
+            self._thread = threading.Thread(
+                target=self._reload_loop, name="sparse-engine-reload", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # ---------- incremental updates ----------
+
+    def _record(self, name, *args):
+        with self._lock:
+            getattr(self, name)(self._graph, *args)
+            if self._journal is not None:
+                self._journal.append((name, args))
+
+    def apply_interactions(self, interactions):
+        self._record("_apply_interactions", [dict(i) for i in interactions])
+
+    def apply_user(self, user_id, categories):
+        self._record("_apply_user", user_id, [int(c) for c in categories])
+
+    def remove_user(self, user_id):
+        self._record("_remove_user", user_id)
+
+    def apply_event(self, event_id, categories):
+        self._record("_apply_event", int(event_id), [int(c) for c in categories])
+
+    def remove_event(self, event_id):
+        self._record("_remove_event", int(event_id))
+
+    @staticmethod
+    def _apply_interactions(graph, interactions):
+        for interaction in interactions:
+            row = graph.user_index.get(interaction["user_id"])
+            col = graph.node_index.get((EVENT, int(interaction["event_id"])))
+            if row is None or col is None:
+                continue
+            if interaction["type"] == "view":
+                graph.set_edge(VIEWED, row, col, 1)
+            elif interaction["type"] == "like":
+                graph.set_edge(LIKED, row, col, 1)
+            else:
+                graph.set_edge(LIKED, row, col, 0)
+
+    @staticmethod
+    def _apply_user(graph, user_id, categories):
+        row = graph.user_index.get(user_id)
+        if row is None:
+            row = graph.add_user(user_id)
+        desired = {
+            graph.node_index[(CATEGORY, category_id)]
+            for category_id in categories
+            if (CATEGORY, category_id) in graph.node_index
+        }
+        for col in graph.row_cols(PREFERRED, row) - desired:
+            graph.set_edge(PREFERRED, row, col, 0)
+        for col in desired:
+            graph.set_edge(PREFERRED, row, col, 1)
+
+    @staticmethod
+    def _remove_user(graph, user_id):
+        row = graph.user_index.pop(user_id, None)
+        if row is None:
+            return
+        for rel in RELATIONS:
+            for col in graph.row_cols(rel, row):
+                graph.set_edge(rel, row, col, 0)
+        graph.active_users[row] = False
+
+    @staticmethod
+    def _apply_event(graph, event_id, categories):
+        col = graph.node_index.get((EVENT, event_id))
+        if col is None:
+            col = graph.add_node(EVENT, event_id)
+        old = graph.event_categories.get(event_id, set())
+        new = {c for c in categories if (CATEGORY, c) in graph.node_index}
+        for category_id in old - new:
+            graph.degree[graph.node_index[(CATEGORY, category_id)]] -= 1
+        for category_id in new - old:
+            graph.degree[graph.node_index[(CATEGORY, category_id)]] += 1
+        graph.degree[col] += len(new) - len(old)
+        graph.event_categories[event_id] = new
+
+    @staticmethod
+    def _remove_event(graph, event_id):
+        col = graph.node_index.pop((EVENT, event_id), None)
+        if col is None:
+            return
+        for rel in (VIEWED, LIKED):
+            for row in graph.col_rows(rel, col):
+                graph.set_edge(rel, row, col, 0)
+        for category_id in graph.event_categories.pop(event_id, set()):
+            category_col = graph.node_index.get((CATEGORY, category_id))
+            if category_col is not None:
+                graph.degree[category_col] -= 1
+        graph.degree[col] = 0
+
+    # ---------- queries ----------
+
+    def _snapshot_for(self, user_id):
+        with self._lock:
+            graph = self._graph
+            if graph.pending() and time.monotonic() - graph.folded_at >= self.fold_interval:
+                graph.fold()
+            return graph.snapshot, graph.user_index.get(user_id)
+
+    def _scores(self, snapshot, row):
+        """
+        Adamic-Adar score of every user against `row`.
+        Users that are not candidates (no shared node below the hub degree
+        cap, beyond the fan-out budget, the user itself, deleted users) get -inf.
+        """
+        scores = np.full(snapshot.neighbours.shape[0], -np.inf)
+        if row >= len(scores):
+            return scores
+        start, end = snapshot.neighbours.indptr[row], snapshot.neighbours.indptr[row + 1]
+        user_nodes = snapshot.neighbours.indices[start:end]
+        if not len(user_nodes):
+            return scores
+        # only the columns of the user's own nodes are touched
+        shared = snapshot.neighbours_by_node[:, user_nodes]
+        expandable = user_nodes
+        if self.max_hub_degree:
+            expandable = user_nodes[snapshot.degree[user_nodes] <= self.max_hub_degree]
+        candidates = np.zeros(len(scores), dtype=bool)
+        if len(expandable):
+            candidates[snapshot.neighbours_by_node[:, expandable].indices] = True
+        candidates[row] = False
+        candidates &= snapshot.active_users
+        if self.fan_out:
+            candidates[np.flatnonzero(candidates)[self.fan_out:]] = False
+        scores[candidates] = (shared @ snapshot.weights[user_nodes])[candidates]
+        return scores
+
+    def _top_neighbours(self, scores):
+        candidates = np.flatnonzero(np.isfinite(scores))
+        top = np.lexsort((candidates, -scores[candidates]))[:self.neighbours]
+        return candidates[top].tolist()
+
+    def _seen_events(self, snapshot, row):
+        interactions = snapshot.interactions
+        if row >= interactions.shape[0]:
+            return np.zeros(0, dtype=np.int64)
+        return interactions.indices[interactions.indptr[row]:interactions.indptr[row + 1]]
+
+    def _expand(self, snapshot, neighbours, k, seen):
+        """
+        Distinct unseen events of the neighbours, best neighbour first: an
+        event ranks by the highest score of the neighbours it came from.
+        """
+        interactions = snapshot.interactions
+        events = {}
+        for row in neighbours:
+            start, end = interactions.indptr[row], interactions.indptr[row + 1]
+            cols = interactions.indices[start:end]
+            cols = cols[~np.isin(cols, seen)]
+            for event_id in snapshot.node_event_ids[cols].tolist():
+                events.setdefault(event_id, None)
+            if len(events) >= k:
+                break
+        return list(events)[:k]
+
+    def recommend(self, user_id, k=20):
+        snapshot, row = self._snapshot_for(user_id)
+        if snapshot is None or row is None:
+            return []
+        scores = self._scores(snapshot, row)
+        seen = self._seen_events(snapshot, row)
+        return self._expand(snapshot, self._top_neighbours(scores), k, seen)
+
+    def recommend_many(self, user_ids, k=20):
+        """
+        recommend() for many users in one pass: the Adamic-Adar scores of the
+        whole batch come from one sparse product (users x batch), so only
+        candidate pairs are ever materialized. Returns {user_id: event_ids}.
+        """
+        with self._lock:
+            graph = self._graph
+            if graph.pending() and time.monotonic() - graph.folded_at >= self.fold_interval:
+                graph.fold()
+            snapshot = graph.snapshot
+            rows = {user_id: graph.user_index.get(user_id) for user_id in user_ids}
+        recommendations = {user_id: [] for user_id in rows}
+        n_users = snapshot.neighbours.shape[0]
+        batch = [(user_id, row) for user_id, row in rows.items() if row is not None and row < n_users]
+        if not batch:
+            return recommendations
+
+        batch_nodes = snapshot.neighbours[[row for _, row in batch]]
+        # users x batch, non-zero exactly where a user shares a node with a batch user
+        scores = (snapshot.neighbours @ batch_nodes.multiply(snapshot.weights).T).tocsc()
+        scores.sort_indices()
+        if self.max_hub_degree:
+            expandable = batch_nodes.multiply(snapshot.degree <= self.max_hub_degree)
+            candidates = (snapshot.neighbours @ expandable.T).tocsc()
+            candidates.sort_indices()
+        else:
+            candidates = scores
+
+        for column, (user_id, row) in enumerate(batch):
+            start, end = candidates.indptr[column], candidates.indptr[column + 1]
+            candidate_rows = candidates.indices[start:end]
+            candidate_rows = candidate_rows[
+                (candidate_rows != row) & snapshot.active_users[candidate_rows]
+            ]
+            if self.fan_out:
+                candidate_rows = candidate_rows[:self.fan_out]
+            start, end = scores.indptr[column], scores.indptr[column + 1]
+            # candidates are a subset of the (sorted) scored rows
+            positions = np.searchsorted(scores.indices[start:end], candidate_rows)
+            candidate_scores = scores.data[start:end][positions]
+            top = np.argsort(-candidate_scores, kind="stable")[:self.neighbours]
+            neighbours = candidate_rows[top].tolist()
+            seen = self._seen_events(snapshot, row)
+            recommendations[user_id] = self._expand(snapshot, neighbours, k, seen)
+        return recommendations
+
+    def stats(self):
+        with self._lock:
+            graph = self._graph
+            return {
+                "users": len(graph.user_index),
+                "nodes": graph.n_nodes,
+                "relationships": {
+                    rel: int(matrix.nnz) for rel, matrix in graph.relations.items()
+                },
+                "pending_changes": graph.pending(),
+            }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def init_sparse_engine(client_factory):
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            engine = SparseAdamicAdarEngine(client_factory=client_factory)
+            engine.start()
+            _engine = engine
+        return _engine
+
+
+def get_sparse_engine():
+    """Loaded engine of this worker, or None when it has not been started."""
+    return _engine
+
+
+def stop_sparse_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is not None:
+            _engine.stop()
+            _engine = None
@@ -0,0 +1,335 @@
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+
+from src.config.constant import RelatedItemsCFG
+from src.utils.logger import logger
+
+QUEUED = "queued"
+PROCESSING = "processing"
+DONE = "done"
+DEAD = "dead"
+
+
+class IngestQueue:
+    """
+    Durable write-behind queue of related-item inserts, in a SQLite file
+    shared by the workers of a host (WAL mode).
+
+    `enqueue` only writes the event; a background thread in every worker
+    claims up to `batch_size` due events at a time and hands them to
+    `process_fn`, which embeds them in one batched call and writes them
+    with one bulk insert. One row is kept per event id, so an event edited
+    again before it was processed is only ingested once, with its latest
+    fields; an edit that arrives while the event is being processed is
+    queued again.
+
+    Failed events are retried with exponential backoff and moved to the
+    dead-letter list (status "dead") after `max_attempts`. Processed events
+    are kept for `done_retention` seconds for status lookups.
+    """
+
+    def __init__(
+        self,
+        process_fn,
+        path=RelatedItemsCFG.QUEUE_PATH,
+        batch_size=RelatedItemsCFG.QUEUE_BATCH_SIZE,
+        poll_interval=RelatedItemsCFG.QUEUE_POLL_INTERVAL,
+        linger=RelatedItemsCFG.QUEUE_LINGER,
+        max_attempts=RelatedItemsCFG.QUEUE_MAX_ATTEMPTS,
+        backoff_base=RelatedItemsCFG.QUEUE_BACKOFF_BASE,
+        backoff_max=RelatedItemsCFG.QUEUE_BACKOFF_MAX,
+        claim_timeout=RelatedItemsCFG.QUEUE_CLAIM_TIMEOUT,
+        done_retention=RelatedItemsCFG.QUEUE_DONE_RETENTION,
+    ):
+        self.process_fn = process_fn
+        self.path = path
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.linger = linger
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.claim_timeout = claim_timeout
+        self.done_retention = done_retention
+        self.worker_id = f"{os.getpid()}"
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.batches = 0
+        self.processed = 0
+        self.failed = 0
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS ingest_queue (
+                    event_id INTEGER PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    version INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL,
+                    next_attempt_at REAL NOT NULL,
+                    claimed_by TEXT,
+                    claimed_at REAL,
+                    error TEXT,
+                    enqueued_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )""")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS ingest_queue_due ON ingest_queue (status, next_attempt_at)"
+            )
+
+    # ---------- producers ----------
+
+    def enqueue(self, events):
+        """
+        Args:
+            events (list of dict): RelatedItemModel fields, with event_id
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.executemany(
+                """
+                INSERT INTO ingest_queue VALUES (?, ?, 1, 'queued', 0, ?, NULL, NULL, NULL, ?, ?)
+                ON CONFLICT (event_id) DO UPDATE SET
+                    payload = excluded.payload,
+                    version = version + 1,
+                    status = 'queued',
+                    attempts = 0,
+                    next_attempt_at = excluded.next_attempt_at,
+                    error = NULL,
+                    enqueued_at = excluded.enqueued_at,
+                    updated_at = excluded.updated_at
+                """,
+                [(int(event["event_id"]), json.dumps(event), now, now, now) for event in events],
+            )
+        self._wake.set()
+
+    # ---------- worker ----------
+
+    def _claim(self):
+        now = time.time()
+        with self._lock:
+            try:
+                self._connection.execute("BEGIN IMMEDIATE")
+                rows = self._connection.execute(
+                    """
+                    SELECT event_id, payload, version, attempts FROM ingest_queue
+                    WHERE (status = 'queued' AND next_attempt_at <= ?)
+                       OR (status = 'processing' AND claimed_at <= ?)
+                    ORDER BY next_attempt_at
+                    LIMIT ?
+                    """,
+                    (now, now - self.claim_timeout, self.batch_size),
+                ).fetchall()
+                self._connection.executemany(
+                    """
+                    UPDATE ingest_queue SET status = 'processing', claimed_by = ?,
+                        claimed_at = ?, updated_at = ?
+                    WHERE event_id = ?
+                    """,
+                    [(self.worker_id, now, now, event_id) for event_id, _, _, _ in rows],
+                )
+                self._connection.commit()
+            except Exception:
+                self._connection.rollback()
+                raise
+        return rows
+
+    def _backoff(self, attempts):
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _finish(self, rows, results):
+        """Record the outcome of a batch; rows edited since they were claimed are left queued."""
+        now = time.time()
+        done, retry, dead = [], [], []
+        for (event_id, _, version, attempts), result in zip(rows, results):
+            if result["status"]:
+                done.append((now, event_id, version))
+            elif attempts + 1 >= self.max_attempts:
+                dead.append((attempts + 1, result["error"], now, event_id, version))
+            else:
+                retry.append((
+                    attempts + 1, now + self._backoff(attempts + 1), result["error"], now,
+                    event_id, version,
+                ))
+        with self._lock, self._connection:
+            self._connection.executemany(
+                """
+                UPDATE ingest_queue SET status = 'done', error = NULL, updated_at = ?
+                WHERE event_id = ? AND version = ?
+                """,
+                done,
+            )
+            self._connection.executemany(
+                """
+                UPDATE ingest_queue SET status = 'queued', attempts = ?, next_attempt_at = ?,
+                    error = ?, updated_at = ?
+                WHERE event_id = ? AND version = ?
+                """,
+                retry,
+            )
+            self._connection.executemany(
+                """
+                UPDATE ingest_queue SET status = 'dead', attempts = ?, error = ?, updated_at = ?
+                WHERE event_id = ? AND version = ?
+                """,
+                dead,
+            )
+            self._connection.execute(
+                "DELETE FROM ingest_queue WHERE status = 'done' AND updated_at < ?",
+                (now - self.done_retention,),
+            )
+        self.processed += len(done)
+        self.failed += len(retry) + len(dead)
+        if dead:
+            logger.error("INGEST QUEUE DEAD-LETTERED EVENTS %s", [row[3] for row in dead])
+        return len(done)
+
+    def drain_once(self):
+        """Process one batch of due events. Returns the number of events claimed."""
+        rows = self._claim()
+        if not rows:
+            return 0
+        start = time.perf_counter()
+        try:
+            results = self.process_fn([json.loads(payload) for _, payload, _, _ in rows])
+        except Exception as e:
+            logger.error("INGEST QUEUE BATCH FAILED: %s", e)
+            results = [{"status": False, "error": str(e)} for _ in rows]
+        done = self._finish(rows, results)
+        self.batches += 1
+        logger.info(
+            "INGEST QUEUE PROCESSED %s/%s EVENTS IN %.2fs",
+            done, len(rows), time.perf_counter() - start,
+        )
+        return len(rows)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                claimed = self.drain_once()
+            except Exception as e:
+                logger.error("INGEST QUEUE WORKER ERROR: %s", e)
+                claimed = 0
+            if claimed < self.batch_size:
+                if self._wake.wait(self.poll_interval):
+                    self._stop.wait(self.linger)
+                self._wake.clear()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="related-ingest-queue", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the worker after its current batch; queued events stay on disk."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+        with self._lock:
+            self._connection.close()
+
+    # ---------- status ----------
+
+    def status(self, event_id):
+        with self._lock:
+            row = self._connection.execute(
+                """
+                SELECT status, attempts, error, enqueued_at, updated_at, next_attempt_at
+                FROM ingest_queue WHERE event_id = ?
+                """,
+                (int(event_id),),
+            ).fetchone()
+        if row is None:
+            return None
+        status, attempts, error, enqueued_at, updated_at, next_attempt_at = row
+        return {
+            "event_id": int(event_id),
+            "status": status,
+            "attempts": attempts,
+            "error": error,
+            "enqueued_at": enqueued_at,
+            "updated_at": updated_at,
+            "next_attempt_at": next_attempt_at if status == QUEUED else None,
+        }
+
+    def dead_letters(self, limit=100):
+        with self._lock:
+            rows = self._connection.execute(
+                """
+                SELECT event_id, attempts, error, updated_at FROM ingest_queue
+                WHERE status = 'dead' ORDER BY updated_at DESC LIMIT ?
+                """,
+                (limit,),
+            ).fetchall()
+        return [
+            {"event_id": event_id, "attempts": attempts, "error": error, "failed_at": failed_at}
+            for event_id, attempts, error, failed_at in rows
+        ]
+
+    def retry_dead_letters(self, event_ids=None):
+        """Queue dead-lettered events again (all of them when `event_ids` is None)."""
+        now = time.time()
+        query = """
+            UPDATE ingest_queue SET status = 'queued', attempts = 0, next_attempt_at = ?, updated_at = ?
+            WHERE status = 'dead'
+            """
+        with self._lock, self._connection:
+            if event_ids is None:
+                retried = self._connection.execute(query, (now, now)).rowcount
+            else:
+                retried = sum(
+                    self._connection.execute(query + " AND event_id = ?", (now, now, int(event_id))).rowcount
+                    for event_id in event_ids
+                )
+        self._wake.set()
+        return retried
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._connection.execute(
+                "SELECT status, count(*) FROM ingest_queue GROUP BY status"
+            ).fetchall())
+            oldest = self._connection.execute(
+                "SELECT min(enqueued_at) FROM ingest_queue WHERE status IN ('queued', 'processing')"
+            ).fetchone()[0]
+        return {
+            "path": self.path,
+            **{status: counts.get(status, 0) for status in (QUEUED, PROCESSING, DONE, DEAD)},
+            "oldest_pending_seconds": round(time.time() - oldest, 1) if oldest else 0.0,
+            "batches": self.batches,
+            "processed": self.processed,
+            "failed_attempts": self.failed,
+        }
+
+
+_queue = None
+
+
+def start_ingest_queue(process_fn):
+    global _queue
+    if _queue is None:
+        _queue = IngestQueue(process_fn=process_fn)
+        _queue.start()
+        logger.info("RELATED ITEMS INGEST QUEUE STARTED")
+    return _queue
+
+
+def get_ingest_queue():
+    """Running ingest queue of this worker, or None when inserts are synchronous."""
+    return _queue
+
+
+def stop_ingest_queue():
+    global _queue
+    if _queue is not None:
+        _queue.stop()
+        _queue = None
+        logger.info("RELATED ITEMS INGEST QUEUE STOPPED")
@@ -0,0 +1,118 @@
+import re
+import sqlite3
+import threading
+from concurrent.futures import Future
+
+from src.config.constant import RelatedItemsCFG
+from src.utils.ttl_cache import TTLCache
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    return _WHITESPACE.sub(" ", query).strip()
+
+
+class RelatedEventsCache:
+    """
+    Per-worker cache of related-event search results, keyed by
+    (backend, normalized query, limit, generation).
+
+    Inserting or deleting events bumps the generation, which makes every
+    cached result unreachable; results of searches that started before the
+    bump are not cached. The generation is a row in the tag index SQLite
+    file, read with every lookup, so all workers of a host see a bump at
+    once; other hosts only see it once their entries expire (`ttl`).
+
+    Concurrent misses for the same key are collapsed: the first caller
+    runs the search and the others wait for its result.
+    """
+
+    def __init__(
+        self,
+        max_entries=RelatedItemsCFG.CACHE_MAX_ENTRIES,
+        ttl=RelatedItemsCFG.CACHE_TTL,
+        generation_path=RelatedItemsCFG.TAG_INDEX_PATH,
+    ):
+        self._cache = TTLCache(max_entries=max_entries, ttl=ttl)
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._connection = sqlite3.connect(generation_path, check_same_thread=False, timeout=30)
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS cache_generation (
+                    name TEXT PRIMARY KEY,
+                    generation INTEGER NOT NULL
+                )""")
+            self._connection.execute(
+                "INSERT OR IGNORE INTO cache_generation VALUES ('related_events', 0)"
+            )
+        self.generation = 0
+        self.collapsed = 0
+
+    def _read_generation(self):
+        """Shared generation; drops this worker's entries when another worker bumped it."""
+        with self._lock:
+            generation = self._connection.execute(
+                "SELECT generation FROM cache_generation WHERE name = 'related_events'"
+            ).fetchone()[0]
+            changed = generation != self.generation
+            self.generation = generation
+        if changed:
+            self._cache.clear()
+        return generation
+
+    def get_or_search(self, backend, query, limit, search):
+        """Cached result of `search()` for the query, running it at most once at a time."""
+        key = (backend, normalize_query(query), limit, self._read_generation())
+        result = self._cache.get(key)
+        if result is not None:
+            return list(result)
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            leader = future is None
+            if leader:
+                future = self._in_flight[key] = Future()
+            else:
+                self.collapsed += 1
+        if not leader:
+            return list(future.result())
+
+        try:
+            result = list(search())
+            if key[-1] == self._read_generation():
+                self._cache.set(key, result)
+            future.set_result(result)
+            return list(result)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+
+    def invalidate(self):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE cache_generation SET generation = generation + 1 WHERE name = 'related_events'"
+            )
+        self._read_generation()
+
+    def stats(self):
+        return {**self._cache.stats(), "generation": self.generation, "collapsed": self.collapsed}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_related_events_cache():
+    """Related-events cache of this worker, or None when caching is disabled."""
+    global _cache
+    if _cache is None and RelatedItemsCFG.CACHE_ENABLED:
+        with _cache_lock:
+            if _cache is None:
+                _cache = RelatedEventsCache()
+    return _cache
@@ -1,12 +1,86 @@
 import json
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from src.config.constant import MongodbCFG
+from src.config.constant import MongodbCFG, RelatedItemsCFG
+from src.models.related_item_model import RelatedItemModel
 from src.module.embedding.gemini_embedding import GeminiEmbeddingModel
-from src.module.mongodb.mongodb_client import MongoDBClient
-from src.module.zillizdb.zilliz_client import ZillizClient
+from src.module.embedding.vector_codec import get_vector_codec
+from src.module.local_index.local_index_client import (
+    close_local_index_client, get_local_index_client, init_local_index_client)
+from src.module.mongodb.mongodb_client import (MongoDBClient,
+                                               close_mongodb_client,
+                                               init_mongodb_client,
+                                               mongodb_health)
+from src.module.related_items.ingest_queue import (get_ingest_queue,
+                                                   start_ingest_queue,
+                                                   stop_ingest_queue)
+from src.module.related_items.related_cache import \
+    get_related_events_cache
+from src.module.related_items.tag_index import (get_tag_index,
+                                                reciprocal_rank_fusion)
+from src.module.zillizdb.zilliz_client import (close_zilliz_client,
+                                               get_zilliz_client,
+                                               init_zilliz_client)
 from src.utils.logger import logger
 
 
+def get_vector_client():
+    """Vector store of the related-items feature selected by RELATED_ITEMS_VECTOR_BACKEND."""
+    if RelatedItemsCFG.VECTOR_BACKEND == "local":
+        return get_local_index_client()
+    return get_zilliz_client()
+
+
+def start_related_items_clients():
+    """
+    Create the shared vector store clients of this worker. A store that is
+    unreachable at startup is retried on first use instead of failing the app.
+    """
+    vector_init = init_local_index_client if RelatedItemsCFG.VECTOR_BACKEND == "local" else init_zilliz_client
+    for name, init in (("VECTOR STORE", vector_init), ("MONGODB", init_mongodb_client)):
+        try:
+            init()
+        except Exception as e:
+            logger.error("%s CLIENT NOT CREATED: %s", name, e)
+    if RelatedItemsCFG.INSERT_MODE == "queued":
+        start_ingest_queue(process_fn=_process_queued_events)
+
+
+def stop_related_items_clients():
+    stop_ingest_queue()
+    close_local_index_client()
+    close_zilliz_client()
+    close_mongodb_client()
+
+
+def related_items_health():
+    try:
+        vector_store = get_vector_client().health()
+    except Exception as e:
+        vector_store = {"status": "error", "error": str(e)}
+    health = {RelatedItemsCFG.VECTOR_BACKEND: vector_store, "mongodb": mongodb_health()}
+    health["status"] = "ok" if all(h["status"] == "ok" for h in health.values()) else "error"
+    return health
+
+
+def _cached_search(backend, query, limit_num, search):
+    cache = get_related_events_cache()
+    if cache is None:
+        return search()
+    return cache.get_or_search(backend, query, limit_num, search)
+
+
+def _index_tags(events):
+    get_tag_index().set_many([(event.event_id, event.event_tags) for event in events])
+
+
+def _invalidate_related_events():
+    cache = get_related_events_cache()
+    if cache is not None:
+        cache.invalidate()
+
+
 def insert_event_to_mongodb(event):
     try:
         document = document_builder(event)
@@ -14,36 +88,118 @@ def insert_event_to_mongodb(event):
             collection_name=MongodbCFG.MONGODB_COLLECTION_NAME_RELATED_EVENT
         )
         mongo.insert_records([document])
+        _index_tags([event])
+        _invalidate_related_events()
         return {"status": True}
     except Exception as e:
         logger.error(e)
         return {"status": False}
 
 
+def _process_queued_events(payloads):
+    events = [RelatedItemModel(**payload) for payload in payloads]
+    return insert_events_to_zilliz(events)["results"]
+
+
 def insert_event_to_zilliz(event):
+    queue = get_ingest_queue()
+    if queue is not None:
+        # embedded and inserted in a micro-batch by the queue worker
+        queue.enqueue([event.model_dump()])
+        return {"status": True, "queued": True}
     try:
         document = document_builder(event)
-        zilliz = ZillizClient()
-        zilliz.insert_records([document])
+        vector_store = get_vector_client()
+        vector_store.insert_records([document])
+        _index_tags([event])
+        _invalidate_related_events()
+        return {"status": True}
+    except Exception as e:
+        logger.error(e)
+        return {"status": False}
+
+
+def insert_events_to_zilliz(events, batch_size=RelatedItemsCFG.INGEST_BATCH_SIZE):
+    """
+    Bulk ingestion: events are embedded batch by batch through batched
+    embedding calls, and each batch is written to the vector store in one insert
+    while the next one is being embedded. Returns the status of every event
+    and the overall throughput.
+    """
+    start = time.perf_counter()
+    vector_store = get_vector_client()
+    embedding = GeminiEmbeddingModel()
+    results = []
+    pending = None
+
+    def finish(batch_results, insert):
+        try:
+            insert.result()
+        except Exception as e:
+            logger.error("BULK INSERT FAILED: %s", e)
+            for result in batch_results:
+                if result["status"]:
+                    result.update(status=False, error=str(e))
+        results.extend(batch_results)
+
+    with ThreadPoolExecutor(max_workers=1) as writer:
+        for offset in range(0, len(events), batch_size):
+            batch_results, documents = build_documents(events[offset:offset + batch_size], embedding)
+            if pending is not None:
+                finish(*pending)
+                pending = None
+            if documents:
+                pending = (batch_results, writer.submit(vector_store.insert_records, documents))
+            else:
+                results.extend(batch_results)
+        if pending is not None:
+            finish(*pending)
+    inserted = [event for event, result in zip(events, results) if result["status"]]
+    if inserted:
+        _index_tags(inserted)
+        _invalidate_related_events()
+
+    elapsed = time.perf_counter() - start
+    succeeded = sum(result["status"] for result in results)
+    stats = {
+        "total": len(results),
+        "succeeded": succeeded,
+        "failed": len(results) - succeeded,
+        "seconds": round(elapsed, 3),
+        "events_per_second": round(len(results) / elapsed, 1) if elapsed else 0.0,
+    }
+    logger.info("BULK INGESTED %s/%s EVENTS IN %.2fs", succeeded, len(results), elapsed)
+    return {"status": stats["failed"] == 0, "stats": stats, "results": results}
+
+
+def delete_event_from_zilliz(event_id):
+    try:
+        get_vector_client().delete_records([event_id])
+        get_tag_index().remove(event_id)
+        _invalidate_related_events()
         return {"status": True}
     except Exception as e:
         logger.error(e)
         return {"status": False}
 
 
-def retrieve_related_events(event):
+def retrieve_related_events(event, limit_num=10):
     event_name = event.event_name
     event_tags = event.event_tags
     event_tags_str = ",".join(event_tags)
     event_query = f"{event_name} {event_tags_str}"
 
-    mongo = MongoDBClient(
-        collection_name=MongodbCFG.MONGODB_COLLECTION_NAME_RELATED_EVENT
-    )
-    related_events = mongo.vector_search(
-        index_name=MongodbCFG.MONGODB_INDEX_NAME_RELATED_EVENT,
-        query=event_query
-    )
+    def search():
+        mongo = MongoDBClient(
+            collection_name=MongodbCFG.MONGODB_COLLECTION_NAME_RELATED_EVENT
+        )
+        return mongo.vector_search(
+            index_name=MongodbCFG.MONGODB_INDEX_NAME_RELATED_EVENT,
+            query=event_query,
+            limit_num=limit_num,
+        )
+
+    related_events = _cached_search("mongodb", event_query, limit_num, search)
 
     logger.info(
         "RETRIEVED RELATED EVENTS: %s",
@@ -54,7 +210,7 @@ def retrieve_related_events(event):
     return response
 
 
-def retrieve_related_events_zilliz(event):
+def retrieve_related_events_zilliz(event, limit_num=16):
     event_name = event.event_name
     event_tags = event.event_tags
     event_tags_str = ",".join(event_tags)
@@ -62,17 +218,22 @@ def retrieve_related_events_zilliz(event):
     event_query = event_query.lower().strip()
     logger.info("SEARCH QUERY: %s", event_query)
 
-    zilliz = ZillizClient()
-    search_results = zilliz.vector_search(
-        query=event_query
-    )
-    search_results = search_results[0]
-    logger.info(
-        "SEARCH RESULT: %s",
-        str(json.dumps(search_results, indent=4, ensure_ascii=True)),
-    )
+    def search():
+        vector_store = get_vector_client()
+        search_results = vector_store.vector_search(
+            query=event_query,
+            limit_num=limit_num,
+        )
+        search_results = search_results[0]
+        logger.info(
+            "SEARCH RESULT: %s",
+            str(json.dumps(search_results, indent=4, ensure_ascii=True)),
+        )
+        return [item.get("entity").get("event_id") for item in search_results]
 
-    related_events = [item.get("entity").get("event_id") for item in search_results]
+    related_events = _cached_search(
+        RelatedItemsCFG.VECTOR_BACKEND, event_query, limit_num, search
+    )
     logger.info(
         "RETRIEVED RELATED EVENTS: %s",
         str(json.dumps(related_events, indent=4, ensure_ascii=True)),
@@ -82,32 +243,153 @@ def retrieve_related_events_zilliz(event):
     return response
 
 
-def document_builder(data):
-    embedding = GeminiEmbeddingModel()
+def _hybrid_search(vector_store, vector, tags, limit_num, exclude_event_id=None):
+    """
+    Dense results fused with tag relatedness by reciprocal rank fusion over
+    three rankings: the dense search over the whole collection, the events
+    sharing the most tags, and the dense search restricted to those events.
+    """
+    def ranked(search_results):
+        return [item.get("entity").get("event_id") for item in search_results[0]]
 
-    event_id = data.event_id
-    event_name = data.event_name
-    event_tags = data.event_tags
-    event_description = data.event_description
+    rankings = [ranked(vector_store.search_vector(
+        vector, limit_num=limit_num * RelatedItemsCFG.HYBRID_VECTOR_OVERFETCH,
+        exclude_event_id=exclude_event_id,
+    ))]
+    tag_ids = [event_id for event_id, _ in get_tag_index().events_sharing(tags, exclude=exclude_event_id)]
+    if tag_ids:
+        rankings.append(tag_ids)
+        rankings.append(ranked(vector_store.search_vector(
+            vector, limit_num=limit_num, exclude_event_id=exclude_event_id, event_ids=tag_ids,
+        )))
+    return reciprocal_rank_fusion(rankings)[:limit_num]
 
-    event_name = event_name.lower().strip()
-    event_description = event_description.lower().strip()
-    event_tags_str = " ".join([tag.lower().strip() for tag in event_tags])
 
-    event_info = (
-        f"{event_name}    #tags: {event_tags_str}    #description: {event_description}"
+def retrieve_related_events_hybrid(event, limit_num=16):
+    """retrieve_related_events_zilliz, with the results fused with the events sharing its tags."""
+    event_query = f"{event.event_name} {','.join(event.event_tags)}".lower().strip()
+    logger.info("HYBRID SEARCH QUERY: %s", event_query)
+
+    def search():
+        embedding = GeminiEmbeddingModel()
+        vector = embedding.get_embedding(event_query, task_type="retrieval_query").get("embedding")
+        vector = get_vector_codec().encode(vector)
+        return _hybrid_search(get_vector_client(), vector, event.event_tags, limit_num)
+
+    related_events = _cached_search(
+        f"{RelatedItemsCFG.VECTOR_BACKEND}:hybrid", event_query, limit_num, search
     )
-    event_info_embedding = embedding.get_embedding(
-        event_info, task_type="retrieval_document", title="document"
+    logger.info("RETRIEVED RELATED EVENTS: %s", str(json.dumps(related_events, ensure_ascii=True)))
+    return {"related_events": related_events}
+
+
+def retrieve_related_events_by_id(event_id, event=None, limit_num=16, hybrid=False):
+    """
+    Related events of an indexed event, searched with its stored document
+    vector so no embedding call is made. When the id is not in the vector
+    store, `event` (name and tags) is embedded as in
+    retrieve_related_events_zilliz; without it, LookupError is raised.
+    With `hybrid`, the results are fused with the events sharing its tags.
+    """
+    event_query = None
+    if event is not None:
+        event_query = f"{event.event_name or ''} {','.join(event.event_tags)}".lower().strip()
+
+    def search():
+        vector_store = get_vector_client()
+        vector = vector_store.get_vector(event_id)
+        if vector is None:
+            if event is None or not event.event_name:
+                raise LookupError(f"Event {event_id} is not indexed")
+            logger.info("EVENT %s NOT INDEXED, EMBEDDING QUERY: %s", event_id, event_query)
+            embedding = GeminiEmbeddingModel()
+            vector = embedding.get_embedding(event_query, task_type="retrieval_query").get("embedding")
+            vector = get_vector_codec().encode(vector)
+        if hybrid:
+            tags = get_tag_index().tags_of(event_id) or (event.event_tags if event is not None else [])
+            return _hybrid_search(vector_store, vector, tags, limit_num, exclude_event_id=event_id)
+        search_results = vector_store.search_vector(
+            vector, limit_num=limit_num, exclude_event_id=event_id
+        )
+        return [item.get("entity").get("event_id") for item in search_results[0]]
+
+    mode = "event-hybrid" if hybrid else "event"
+    # the fallback query and tags come from `event`, so they are part of the key
+    cache_query = str(event_id) if event_query is None else f"{event_id} {event_query}"
+    related_events = _cached_search(
+        f"{RelatedItemsCFG.VECTOR_BACKEND}:{mode}", cache_query, limit_num, search
     )
+    logger.info(
+        "RETRIEVED RELATED EVENTS OF %s: %s",
+        event_id, str(json.dumps(related_events, ensure_ascii=True)),
+    )
+    return {"related_events": related_events}
+
 
-    document = {
-        "event_id": event_id,
+def _event_fields(data):
+    event_name = data.event_name.lower().strip()
+    event_description = data.event_description.lower().strip()
+    event_tags_str = " ".join([tag.lower().strip() for tag in data.event_tags])
+
+    event_info = (
+        f"{event_name}    #tags: {event_tags_str}    #description: {event_description}"
+    )
+    return {
+        "event_id": data.event_id,
         "event_name": event_name,
-        "event_tags": event_tags,
+        "event_tags": data.event_tags,
         "event_description": event_description,
         "event_info": event_info,
-        "embedding": event_info_embedding.get("embedding"),
     }
 
+
+def _set_embedding(document, vector):
+    codec = get_vector_codec()
+    document["embedding"] = codec.encode(vector)
+    if not codec.identity:
+        document["embedding_codec"] = codec.version
+
+
+def document_builder(data):
+    embedding = GeminiEmbeddingModel()
+
+    document = _event_fields(data)
+    event_info_embedding = embedding.get_embedding(
+        document["event_info"], task_type="retrieval_document", title="document"
+    )
+    _set_embedding(document, event_info_embedding.get("embedding"))
+
     return document
+
+
+def build_documents(events, embedding=None):
+    """
+    Documents of many events, embedded with batched calls. Returns the
+    per-event results ({event_id, status, error}) and the documents of the
+    events that succeeded.
+    """
+    embedding = embedding or GeminiEmbeddingModel()
+    results = []
+    documents = []
+    for event in events:
+        try:
+            documents.append(_event_fields(event))
+            results.append({"event_id": event.event_id, "status": True, "error": None})
+        except Exception as e:
+            results.append({"event_id": getattr(event, "event_id", None), "status": False, "error": str(e)})
+
+    try:
+        vectors = embedding.get_embeddings(
+            [document["event_info"] for document in documents],
+            task_type="retrieval_document", title="document",
+        )
+    except Exception as e:
+        logger.error("BULK EMBEDDING FAILED: %s", e)
+        for result in results:
+            if result["status"]:
+                result.update(status=False, error=str(e))
+        return results, []
+
+    for document, vector in zip(documents, vectors):
+        _set_embedding(document, vector)
+    return results, documents
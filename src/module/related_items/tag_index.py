@@ -0,0 +1,121 @@
+import re
+import sqlite3
+import threading
+
+from src.config.constant import RelatedItemsCFG
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_tag(tag):
+    return _WHITESPACE.sub(" ", tag).strip().lower().lstrip("#")
+
+
+def normalize_tags(tags):
+    return sorted({normalize_tag(tag) for tag in tags} - {""})
+
+
+class TagIndex:
+    """
+    Inverted index from normalized tag to event ids, in a SQLite file
+    shared by the workers of a host (WAL mode). It is maintained on insert
+    and delete alongside the vector store.
+    """
+
+    def __init__(self, path=RelatedItemsCFG.TAG_INDEX_PATH):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("""
+                CREATE TABLE IF NOT EXISTS event_tags (
+                    tag TEXT NOT NULL,
+                    event_id INTEGER NOT NULL,
+                    PRIMARY KEY (tag, event_id)
+                ) WITHOUT ROWID""")
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS event_tags_event ON event_tags (event_id)"
+            )
+
+    def set_many(self, events):
+        """Replace the tags of [(event_id, tags)]."""
+        rows = [(int(event_id), normalize_tags(tags)) for event_id, tags in events]
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "DELETE FROM event_tags WHERE event_id = ?", [(event_id,) for event_id, _ in rows]
+            )
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO event_tags VALUES (?, ?)",
+                [(tag, event_id) for event_id, tags in rows for tag in tags],
+            )
+
+    def remove(self, event_id):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM event_tags WHERE event_id = ?", (int(event_id),))
+
+    def tags_of(self, event_id):
+        with self._lock:
+            return [tag for tag, in self._connection.execute(
+                "SELECT tag FROM event_tags WHERE event_id = ? ORDER BY tag", (int(event_id),)
+            )]
+
+    def events_sharing(self, tags, exclude=None, limit=RelatedItemsCFG.HYBRID_TAG_CANDIDATES):
+        """
+        [(event_id, shared tag count)] of the events sharing any of `tags`,
+        most shared first. Rarer tags count for more on ties.
+        """
+        tags = normalize_tags(tags)
+        if not tags:
+            return []
+        placeholders = ", ".join("?" * len(tags))
+        with self._lock:
+            rows = self._connection.execute(
+                f"""
+                WITH df AS (
+                    SELECT tag, count(*) AS events FROM event_tags
+                    WHERE tag IN ({placeholders}) GROUP BY tag
+                )
+                SELECT t.event_id, count(*) AS shared, sum(1.0 / df.events) AS rarity
+                FROM event_tags t JOIN df USING (tag)
+                WHERE t.event_id != ?
+                GROUP BY t.event_id
+                ORDER BY shared DESC, rarity DESC, t.event_id
+                LIMIT ?
+                """,
+                (*tags, -1 if exclude is None else int(exclude), limit),
+            ).fetchall()
+        return [(event_id, shared) for event_id, shared, _ in rows]
+
+    def stats(self):
+        with self._lock:
+            tags, events, pairs = self._connection.execute(
+                "SELECT count(DISTINCT tag), count(DISTINCT event_id), count(*) FROM event_tags"
+            ).fetchone()
+        return {"path": self.path, "tags": tags, "events": events, "pairs": pairs}
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+def reciprocal_rank_fusion(rankings, k=RelatedItemsCFG.HYBRID_RRF_K):
+    """Event ids ordered by sum(1 / (k + rank)) over the rankings they appear in."""
+    scores = {}
+    for ranking in rankings:
+        for rank, event_id in enumerate(ranking, start=1):
+            scores[event_id] = scores.get(event_id, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda event_id: (-scores[event_id], event_id))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_tag_index():
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = TagIndex()
+    return _index
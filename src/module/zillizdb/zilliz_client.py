@@ -1,20 +1,36 @@
+import threading
+import time
+
 from pymilvus import MilvusClient
 
 from src.config.constant import ZillizCFG
 from src.module.embedding.gemini_embedding import GeminiEmbeddingModel
+from src.module.embedding.vector_codec import get_vector_codec
+from src.utils.logger import logger
+
+
+def _codec_condition():
+    """
+    Filter on the codec the documents were encoded with. Identity-encoded
+    documents carry no embedding_codec field, so they are not filtered.
+    """
+    codec = get_vector_codec()
+    return None if codec.identity else f'embedding_codec == "{codec.version}"'
 
 
 class ZillizClient:
-    def __init__(self):
+    def __init__(self, timeout=ZillizCFG.REQUEST_TIMEOUT):
         self.uri = f'https://{ZillizCFG.ZILLIZDB_HOST}:{ZillizCFG.ZILLIZDB_PORT}'
         self.token = f'{ZillizCFG.ZILLIZDB_USERNAME}:{ZillizCFG.ZILLIZDB_PASSWORD}'
         self.collection_name = ZillizCFG.ZILLIZDB_COLLECTION_NAME_RELATED_EVENT
+        self.timeout = timeout
         self.client = self.connect_db()
 
     def connect_db(self):
         client = MilvusClient(
             uri=self.uri,
-            token=self.token
+            token=self.token,
+            timeout=ZillizCFG.CONNECT_TIMEOUT,
         )
         return client
 
@@ -25,20 +41,88 @@ class ZillizClient:
         self.client.drop_collection(self.collection_name)
 
     def insert_records(self, records):
-        self.client.insert(self.collection_name, records)
+        self.client.insert(self.collection_name, records, timeout=self.timeout)
+
+    def delete_records(self, event_ids):
+        event_ids = ", ".join(str(int(event_id)) for event_id in event_ids)
+        self.client.delete(
+            self.collection_name, filter=f"event_id in [{event_ids}]", timeout=self.timeout
+        )
+
+    def health(self):
+        start = time.perf_counter()
+        try:
+            self.client.has_collection(self.collection_name, timeout=self.timeout)
+            return {"status": "ok", "latency_ms": round((time.perf_counter() - start) * 1000, 1)}
+        except Exception as e:
+            return {"status": "error", "error": str(e)}
+
+    def get_vector(self, event_id):
+        conditions = [f"event_id == {int(event_id)}", _codec_condition()]
+        rows = self.client.query(
+            self.collection_name,
+            filter=" and ".join(condition for condition in conditions if condition),
+            output_fields=["embedding"],
+            limit=1,
+            timeout=self.timeout,
+        )
+        return rows[0]["embedding"] if rows else None
 
     def vector_search(self, query, limit_num=16):
         embedding = GeminiEmbeddingModel()
         query_emb = embedding.get_embedding(query, task_type="retrieval_query")
-        query_emb = query_emb.get("embedding")
+        query_emb = get_vector_codec().encode(query_emb.get("embedding"))
+        return self.search_vector(query_emb, limit_num=limit_num)
+
+    def search_vector(self, vector, limit_num=16, exclude_event_id=None, event_ids=None):
+        conditions = []
+        codec_condition = _codec_condition()
+        if codec_condition:
+            conditions.append(codec_condition)
+        if exclude_event_id is not None:
+            conditions.append(f"event_id != {int(exclude_event_id)}")
+        if event_ids is not None:
+            conditions.append(f"event_id in [{', '.join(str(int(event_id)) for event_id in event_ids)}]")
+        event_filter = " and ".join(conditions)
         results = self.client.search(
             collection_name=self.collection_name,
-            data=[query_emb],
+            data=[vector],
+            filter=event_filter,
             limit=limit_num,
             search_params={
                 "metric_type": "COSINE",
                 "params": {}  
             },
             output_fields=["event_id"],
+            timeout=self.timeout,
         )
-        return results
\ No newline at end of file
+        return results
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def init_zilliz_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ZillizClient()
+            logger.info("ZILLIZ CLIENT CREATED (%s)", ZillizCFG.ZILLIZDB_HOST)
+        return _client
+
+
+def get_zilliz_client():
+    """Shared client for this worker; created on first use outside the app lifespan."""
+    if _client is None:
+        return init_zilliz_client()
+    return _client
+
+
+def close_zilliz_client():
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.disconnect_db()
+            _client = None
+            logger.info("ZILLIZ CLIENT CLOSED")
@@ -1,21 +1,40 @@
-from typing import Any, Dict
+from typing import Any, Dict, List, Literal, Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import StreamingResponse
 
 import src.module.recommendation_system.recommend as recsys
-from src.models.recommendation_model import (RecommendationEventModel,
+import src.module.recommendation_system.recommend_async as recsys_async
+from src.config.constant import RecommendationCFG
+from src.models.recommendation_model import (RecommendationBatchModel,
+                                             RecommendationEventModel,
+                                             RecommendationInteractionModel,
                                              RecommendationUserEventEdge,
                                              RecommendationUserModel)
+from src.module.recommendation_system.interaction_buffer import \
+    InteractionBufferOverflow
 from src.utils.logger import logger
 
 router = APIRouter(prefix="/api/v1/recommendation", tags=["recommendation"])
 
 
 @router.post(path="/event")
-def upsert_event_api(data: RecommendationEventModel) -> Dict[str, Any]:
+async def upsert_event_api(data: RecommendationEventModel) -> Dict[str, Any]:
     logger.info("API - Upsert event")
     try:
-        response = recsys.upsert_event(data)
+        response = await recsys_async.upsert_event(data)
+        return response
+    except TimeoutError as err:
+        raise HTTPException(status_code=408, detail=err)
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=err)
+
+
+@router.post(path="/event/batch")
+async def upsert_events_api(data: List[RecommendationEventModel]) -> Dict[str, Any]:
+    logger.info("API - Upsert events in batch")
+    try:
+        response = await recsys_async.upsert_events(data)
         return response
     except TimeoutError as err:
         raise HTTPException(status_code=408, detail=err)
@@ -24,10 +43,10 @@ def upsert_event_api(data: RecommendationEventModel) -> Dict[str, Any]:
 
 
 @router.delete(path="/event/{id}")
-def delete_event_api(id: str) -> Dict[str, Any]:
+async def delete_event_api(id: str) -> Dict[str, Any]:
     logger.info("API - Delete event")
     try:
-        response = recsys.delete_event(id)
+        response = await recsys_async.delete_event(id)
         return response
     except TimeoutError as err:
         raise HTTPException(status_code=408, detail=err)
@@ -36,10 +55,22 @@ def delete_event_api(id: str) -> Dict[str, Any]:
 
 
 @router.post(path="/user")
-def upsert_user_api(data: RecommendationUserModel) -> Dict[str, Any]:
+async def upsert_user_api(data: RecommendationUserModel) -> Dict[str, Any]:
     logger.info("API - Upsert user")
     try:
-        response = recsys.upsert_user(data)
+        response = await recsys_async.upsert_user(data)
+        return response
+    except TimeoutError as err:
+        raise HTTPException(status_code=408, detail=err)
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=err)
+
+
+@router.post(path="/user/batch")
+async def upsert_users_api(data: List[RecommendationUserModel]) -> Dict[str, Any]:
+    logger.info("API - Upsert users in batch")
+    try:
+        response = await recsys_async.upsert_users(data)
         return response
     except TimeoutError as err:
         raise HTTPException(status_code=408, detail=err)
@@ -48,10 +79,10 @@ def upsert_user_api(data: RecommendationUserModel) -> Dict[str, Any]:
 
 
 @router.delete(path="/user/{id}")
-def delete_user_api(id: str) -> Dict[str, Any]:
+async def delete_user_api(id: str) -> Dict[str, Any]:
     logger.info("API - Delete user")
     try:
-        response = recsys.delete_user(id)
+        response = await recsys_async.delete_user(id)
         return response
     except TimeoutError as err:
         raise HTTPException(status_code=408, detail=err)
@@ -60,11 +91,13 @@ def delete_user_api(id: str) -> Dict[str, Any]:
 
 
 @router.put(path="/view")
-def view_event_api(data: RecommendationUserEventEdge) -> Dict[str, Any]:
+async def view_event_api(data: RecommendationUserEventEdge) -> Dict[str, Any]:
     logger.info("API - User views event")
     try:
-        response = recsys.view_event(data)
+        response = await recsys_async.view_event(data)
         return response
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
     except TimeoutError as err:
         raise HTTPException(status_code=408, detail=err)
     except Exception as err:
@@ -72,11 +105,13 @@ def view_event_api(data: RecommendationUserEventEdge) -> Dict[str, Any]:
 
 
 @router.put(path="/like")
-def follow_event_api(data: RecommendationUserEventEdge) -> Dict[str, Any]:
+async def follow_event_api(data: RecommendationUserEventEdge) -> Dict[str, Any]:
     logger.info("API - User likes event")
     try:
-        response = recsys.like_event(data)
+        response = await recsys_async.like_event(data)
         return response
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
     except TimeoutError as err:
         raise HTTPException(status_code=408, detail=err)
     except Exception as err:
@@ -84,11 +119,29 @@ def follow_event_api(data: RecommendationUserEventEdge) -> Dict[str, Any]:
 
 
 @router.delete(path="/like")
-def unfollow_event_api(data: RecommendationUserEventEdge) -> Dict[str, Any]:
+async def unfollow_event_api(data: RecommendationUserEventEdge) -> Dict[str, Any]:
     logger.info("API - User unlikes event")
     try:
-        response = recsys.unlike_event(data)
+        response = await recsys_async.unlike_event(data)
+        return response
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
+    except TimeoutError as err:
+        raise HTTPException(status_code=408, detail=err)
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=err)
+
+
+@router.post(path="/interactions")
+async def record_interactions_api(data: List[RecommendationInteractionModel]) -> Dict[str, Any]:
+    logger.info("API - Record user interactions")
+    try:
+        response = await recsys_async.record_interactions(data)
         return response
+    except InteractionBufferOverflow as err:
+        raise HTTPException(status_code=413, detail=str(err))
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
     except TimeoutError as err:
         raise HTTPException(status_code=408, detail=err)
     except Exception as err:
@@ -96,23 +149,50 @@ def unfollow_event_api(data: RecommendationUserEventEdge) -> Dict[str, Any]:
 
 
 @router.get(path="/user/{id}")
-def get_user_recommendation_api(id: str) -> Dict[str, Any]:
+async def get_user_recommendation_api(
+    id: str, k: int = Query(20, ge=1, le=RecommendationCFG.PAGE_MAX_K), cursor: Optional[str] = None
+) -> Dict[str, Any]:
     logger.info("API - Get user recommendation")
     try:
-        response = recsys.get_user_recommendation(id)
+        response = await recsys_async.get_user_recommendation(id, k=k, cursor=cursor)
         return response
+    except ValueError as err:
+        raise HTTPException(status_code=400, detail=str(err))
     except TimeoutError as err:
         raise HTTPException(status_code=408, detail=err)
     except Exception as err:
         raise HTTPException(status_code=500, detail=err)
 
+@router.post(path="/batch")
+async def get_batch_recommendation_api(data: RecommendationBatchModel) -> StreamingResponse:
+    logger.info("API - Get batch recommendation")
+    try:
+        lines = recsys_async.get_batch_recommendation(data)
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+    except ValueError as err:
+        raise HTTPException(status_code=413, detail=str(err))
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=err)
+
+
+# long running sync job, kept on the threadpool
 @router.get(path="/init")
-def get_user_recommendation_api() -> Dict[str, Any]:
+def get_user_recommendation_api(mode: Literal["full", "shadow", "incremental"] = "full") -> Dict[str, Any]:
     logger.info("API - Init Neo4j")
     try:
-        response = recsys.init_neo4j()
+        response = recsys.init_neo4j(mode=mode)
         return response
     except TimeoutError as err:
         raise HTTPException(status_code=408, detail=err)
     except Exception as err:
-        raise HTTPException(status_code=500, detail=err)
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=err)
+
+
+@router.get(path="/stats")
+async def get_stats_api() -> Dict[str, Any]:
+    logger.info("API - Get recommendation stats")
+    try:
+        response = await recsys_async.get_stats()
+        return response
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=err)
@@ -1,12 +1,23 @@
-from typing import Any, Dict
+from typing import Any, Dict, List, Optional
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Body, HTTPException, Query
 
-from src.models.related_item_model import RelatedItemModel
+from src.models.related_item_model import (RelatedItemBatchModel,
+                                           RelatedItemModel)
+from src.module.embedding.embedding_cache import get_embedding_cache
+from src.module.related_items.ingest_queue import get_ingest_queue
+from src.module.related_items.related_cache import \
+    get_related_events_cache
 from src.module.related_items.related_events import (
+    delete_event_from_zilliz,
     insert_event_to_zilliz,
+    insert_events_to_zilliz,
+    related_items_health,
+    retrieve_related_events_by_id,
+    retrieve_related_events_hybrid,
     retrieve_related_events_zilliz
 )
+from src.module.related_items.tag_index import get_tag_index
 from src.utils.logger import logger
 
 router = APIRouter(prefix="/api/v1/related-items", tags=["related-items"])
@@ -24,6 +35,30 @@ def insert_event_api(data: RelatedItemModel) -> Dict[str, Any]:
         raise HTTPException(status_code=500, detail=err)
 
 
+@router.post(path="/insert-events")
+def insert_events_api(data: RelatedItemBatchModel) -> Dict[str, Any]:
+    logger.info("API - Bulk insert %s events to Zilliz", len(data.events))
+    try:
+        response = insert_events_to_zilliz(data.events)
+        return response
+    except TimeoutError as err:
+        raise HTTPException(status_code=408, detail=err)
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=err)
+
+
+@router.delete(path="/event/{event_id}")
+def delete_event_api(event_id: int) -> Dict[str, Any]:
+    logger.info("API - Delete event %s from the vector store", event_id)
+    try:
+        response = delete_event_from_zilliz(event_id)
+        return response
+    except TimeoutError as err:
+        raise HTTPException(status_code=408, detail=err)
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=err)
+
+
 @router.post(path="/retrieve-related-events")
 def get_related_events_api(data: RelatedItemModel) -> Dict[str, Any]:
     logger.info("API - Retrieve related events")
@@ -34,3 +69,134 @@ def get_related_events_api(data: RelatedItemModel) -> Dict[str, Any]:
         raise HTTPException(status_code=408, detail=err)
     except Exception as err:
         raise HTTPException(status_code=500, detail=err)
+
+
+@router.post(path="/retrieve-related-events-hybrid")
+def get_related_events_hybrid_api(data: RelatedItemModel) -> Dict[str, Any]:
+    logger.info("API - Retrieve related events (hybrid)")
+    try:
+        response = retrieve_related_events_hybrid(data)
+        return response
+    except TimeoutError as err:
+        raise HTTPException(status_code=408, detail=err)
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=err)
+
+
+@router.get(path="/health")
+def get_related_items_health_api() -> Dict[str, Any]:
+    logger.info("API - Related items health")
+    try:
+        health = related_items_health()
+        if health["status"] != "ok":
+            raise HTTPException(status_code=503, detail=health)
+        return {"STATUS": "SUCCESS", "CONTENT": health}
+    except HTTPException:
+        raise
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=err)
+
+
+@router.get(path="/embedding-cache/stats")
+def get_embedding_cache_stats_api() -> Dict[str, Any]:
+    logger.info("API - Get embedding cache stats")
+    try:
+        cache = get_embedding_cache()
+        return {"STATUS": "SUCCESS", "CONTENT": cache.stats() if cache is not None else None}
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=err)
+
+
+@router.get(path="/related-cache/stats")
+def get_related_cache_stats_api() -> Dict[str, Any]:
+    logger.info("API - Get related events cache stats")
+    try:
+        cache = get_related_events_cache()
+        return {"STATUS": "SUCCESS", "CONTENT": cache.stats() if cache is not None else None}
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=err)
+
+
+@router.get(path="/tag-index/stats")
+def get_tag_index_stats_api() -> Dict[str, Any]:
+    logger.info("API - Get tag index stats")
+    try:
+        return {"STATUS": "SUCCESS", "CONTENT": get_tag_index().stats()}
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=err)
+
+
+def _ingest_queue():
+    queue = get_ingest_queue()
+    if queue is None:
+        raise HTTPException(status_code=404, detail="Ingest queue is not enabled")
+    return queue
+
+
+@router.get(path="/ingest-queue/stats")
+def get_ingest_queue_stats_api() -> Dict[str, Any]:
+    logger.info("API - Get ingest queue stats")
+    queue = get_ingest_queue()
+    try:
+        return {"STATUS": "SUCCESS", "CONTENT": queue.stats() if queue is not None else None}
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=err)
+
+
+@router.get(path="/ingest-queue/dead-letter")
+def get_ingest_dead_letters_api(limit: int = Query(100, ge=1, le=1000)) -> Dict[str, Any]:
+    logger.info("API - Get ingest queue dead letters")
+    queue = _ingest_queue()
+    try:
+        return {"STATUS": "SUCCESS", "CONTENT": queue.dead_letters(limit=limit)}
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=err)
+
+
+@router.post(path="/ingest-queue/dead-letter/retry")
+def retry_ingest_dead_letters_api(
+    event_ids: Optional[List[int]] = Body(None, embed=True),
+) -> Dict[str, Any]:
+    logger.info("API - Retry ingest queue dead letters")
+    queue = _ingest_queue()
+    try:
+        return {"STATUS": "SUCCESS", "CONTENT": {"retried": queue.retry_dead_letters(event_ids)}}
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=err)
+
+
+@router.get(path="/ingest-queue/{event_id}")
+def get_ingest_status_api(event_id: int) -> Dict[str, Any]:
+    logger.info("API - Get ingest status of %s", event_id)
+    queue = _ingest_queue()
+    try:
+        status = queue.status(event_id)
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=err)
+    if status is None:
+        raise HTTPException(status_code=404, detail=f"Event {event_id} is not in the ingest queue")
+    return {"STATUS": "SUCCESS", "CONTENT": status}
+
+
+# declared last: the catch-all path would otherwise shadow the GET routes above
+@router.get(path="/{event_id}")
+def get_related_events_by_id_api(
+    event_id: int,
+    limit: int = Query(16, ge=1, le=100),
+    event_name: str = "",
+    event_tags: List[str] = Query([]),
+    hybrid: bool = False,
+) -> Dict[str, Any]:
+    logger.info("API - Retrieve related events of %s", event_id)
+    try:
+        event = RelatedItemModel(event_id=event_id, event_name=event_name, event_tags=event_tags)
+        response = retrieve_related_events_by_id(
+            event_id, event=event, limit_num=limit, hybrid=hybrid
+        )
+        return response
+    except LookupError as err:
+        raise HTTPException(status_code=404, detail=str(err))
+    except TimeoutError as err:
+        raise HTTPException(status_code=408, detail=err)
+    except Exception as err:
+        raise HTTPException(status_code=500, detail=err)
@@ -0,0 +1,30 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# src.config.constant reads these when imported; the tests never connect to the services
+for name in (
+    "GEMINI_API_KEY",
+    "NEO4J_URL",
+    "NEO4J_USERNAME",
+    "NEO4J_PASSWORD",
+    "MONGODB_USERNAME",
+    "MONGODB_PASSWORD",
+    "MONGODB_HOST",
+    "MONGODB_NAME",
+    "MONGODB_COLLECTION_NAME_RELATED_EVENT",
+    "MONGODB_INDEX_NAME_RELATED_EVENT",
+    "ZILLIZDB_USERNAME",
+    "ZILLIZDB_PASSWORD",
+    "ZILLIZDB_HOST",
+    "ZILLIZDB_PORT",
+    "ZILLIZDB_COLLECTION_NAME_RELATED_EVENT",
+    "MYSQL_HOST",
+    "MYSQL_USER",
+    "MYSQL_PASSWORD",
+    "MYSQL_DATABASE",
+    "MYSQL_PORT",
+    "RECOMMENDATION_PAGE_CURSOR_SECRET",
+):
+    os.environ.setdefault(name, "test")
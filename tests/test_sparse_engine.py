@@ -0,0 +1,214 @@
+import math
+import random
+
+import pytest
+
+from src.module.recommendation_system.sparse_engine import SparseAdamicAdarEngine
+
+VIEWED, LIKED, PREFERRED = "VIEWED", "LIKED", "PREFERRED"
+
+
+class SyntheticGraph:
+    """
+    User/Event/Category graph held in plain Python, with the Adamic-Adar
+    recommendation of RECOMMENDATION_QUERY computed by brute force.
+    """
+
+    def __init__(self, users, categories, events, edges):
+        self.users = list(users)
+        self.categories = list(categories)
+        self.events = dict(events)
+        self.edges = set(edges)
+
+    @classmethod
+    def random(cls, seed, n_users=60, n_events=80, n_categories=6):
+        rng = random.Random(seed)
+        categories = list(range(1, n_categories + 1))
+        events = {
+            100 + i: set(rng.sample(categories, rng.randint(1, 2))) for i in range(n_events)
+        }
+        users = [f"user-{i}" for i in range(n_users)]
+        edges = set()
+        for user_id in users:
+            for category_id in rng.sample(categories, rng.randint(0, 2)):
+                edges.add((user_id, PREFERRED, category_id))
+            for event_id in rng.sample(sorted(events), rng.randint(0, 6)):
+                edges.add((user_id, VIEWED, event_id))
+                if rng.random() < 0.3:
+                    edges.add((user_id, LIKED, event_id))
+        return cls(users, categories, events, edges)
+
+    # ---------- the Neo4j side ----------
+
+    def degree(self, label, node_id):
+        if label == "Category":
+            in_category = sum(node_id in categories for categories in self.events.values())
+            users = sum(1 for _, rel, node in self.edges if rel == PREFERRED and node == node_id)
+            return in_category + users
+        users = sum(1 for _, rel, node in self.edges if rel != PREFERRED and node == node_id)
+        return len(self.events[node_id]) + users
+
+    def nodes(self):
+        """Nodes in load order: categories, then events."""
+        return [("Category", c) for c in self.categories] + [("Event", e) for e in self.events]
+
+    def stream_query(self, query, params={}):
+        if "type(r)" in query:
+            for user_id, rel, node_id in sorted(self.edges, key=str):
+                yield user_id, rel, node_id
+        elif "IN_CATEGORY" in query:
+            for event_id, categories in self.events.items():
+                for category_id in sorted(categories):
+                    yield event_id, category_id
+        elif "n:Event OR n:Category" in query:
+            for label, node_id in self.nodes():
+                yield label == "Event", node_id, self.degree(label, node_id)
+        elif "MATCH (u:User)" in query:
+            for user_id in self.users:
+                yield (user_id,)
+        else:
+            raise AssertionError(f"Unexpected query {query}")
+
+    # ---------- changes, as the engine receives them ----------
+
+    def apply_interactions(self, interactions):
+        for interaction in interactions:
+            edge = (
+                interaction["user_id"],
+                LIKED if interaction["type"] != "view" else VIEWED,
+                int(interaction["event_id"]),
+            )
+            if interaction["type"] == "unlike":
+                self.edges.discard(edge)
+            else:
+                self.edges.add(edge)
+
+    def apply_user(self, user_id, categories):
+        if user_id not in self.users:
+            self.users.append(user_id)
+        self.edges = {edge for edge in self.edges if not (edge[0] == user_id and edge[1] == PREFERRED)}
+        self.edges.update((user_id, PREFERRED, category_id) for category_id in categories)
+
+    def remove_user(self, user_id):
+        self.users.remove(user_id)
+        self.edges = {edge for edge in self.edges if edge[0] != user_id}
+
+    def apply_event(self, event_id, categories):
+        self.events[event_id] = set(categories)
+
+    def remove_event(self, event_id):
+        del self.events[event_id]
+        self.edges = {edge for edge in self.edges if edge[1] == PREFERRED or edge[2] != event_id}
+
+    # ---------- brute force ----------
+
+    def recommend(self, user_id, k, neighbours, max_hub_degree=0, fan_out=0):
+        column = {node: position for position, node in enumerate(self.nodes())}
+        node_sets = {u: set() for u in self.users}
+        for u, rel, node_id in self.edges:
+            node_sets[u].add(("Category" if rel == PREFERRED else "Event", node_id))
+        if user_id not in node_sets:
+            return []
+        own = node_sets[user_id]
+        expandable = {
+            node for node in own if not max_hub_degree or self.degree(*node) <= max_hub_degree
+        }
+        candidates = [u for u in self.users if u != user_id and node_sets[u] & expandable]
+        if fan_out:
+            candidates = candidates[:fan_out]
+
+        def score(other):
+            shared = sorted(own & node_sets[other], key=column.get)
+            return sum(1.0 / math.log(self.degree(*node)) for node in shared)
+
+        order = {u: position for position, u in enumerate(self.users)}
+        top = sorted(candidates, key=lambda other: (-score(other), order[other]))[:neighbours]
+        seen = {node_id for u, rel, node_id in self.edges if u == user_id and rel != PREFERRED}
+        # one entry per event, at the best neighbour it came from
+        events = []
+        for other in top:
+            for event_id in self.events:
+                if event_id in seen or event_id in events:
+                    continue
+                if any((other, rel, event_id) in self.edges for rel in (VIEWED, LIKED)):
+                    events.append(event_id)
+        return events[:k]
+
+
+def make_engine(graph, **kwargs):
+    engine = SparseAdamicAdarEngine(
+        client_factory=lambda: graph, fold_interval=0, reload_interval=0, **kwargs
+    )
+    engine.load()
+    return engine
+
+
+PRUNING = [
+    {"neighbours": 5, "max_hub_degree": 0, "fan_out": 0},
+    {"neighbours": 3, "max_hub_degree": 12, "fan_out": 0},
+    {"neighbours": 5, "max_hub_degree": 0, "fan_out": 8},
+    {"neighbours": 10, "max_hub_degree": 15, "fan_out": 20},
+]
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+@pytest.mark.parametrize("pruning", PRUNING)
+def test_recommend_matches_brute_force(seed, pruning):
+    graph = SyntheticGraph.random(seed)
+    engine = make_engine(graph, **pruning)
+    for user_id in graph.users + ["unknown-user"]:
+        recommendations = engine.recommend(user_id, k=15)
+        assert recommendations == graph.recommend(user_id, k=15, **pruning)
+        assert len(set(recommendations)) == len(recommendations)
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+@pytest.mark.parametrize("pruning", PRUNING)
+def test_recommend_many_matches_brute_force(seed, pruning):
+    graph = SyntheticGraph.random(seed)
+    engine = make_engine(graph, **pruning)
+    user_ids = graph.users + ["unknown-user"]
+    expected = {user_id: graph.recommend(user_id, k=15, **pruning) for user_id in user_ids}
+    assert engine.recommend_many(user_ids, k=15) == expected
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_incremental_updates_match_reload(seed):
+    rng = random.Random(seed)
+    graph = SyntheticGraph.random(seed)
+    engine = make_engine(graph, neighbours=5, max_hub_degree=20, fan_out=30)
+    removed_user = graph.users[1]
+
+    changes = [
+        ("apply_event", 999, [1, 2]),
+        ("apply_user", "new-user", [2, 3]),
+        ("apply_user", graph.users[0], [4]),
+        ("remove_user", removed_user),
+        ("remove_event", 100),
+        ("apply_event", 101, [5]),
+    ]
+    event_ids = sorted(set(graph.events) - {100}) + [999]
+    interactions = [
+        {
+            "user_id": rng.choice(graph.users[2:] + ["new-user"]),
+            "event_id": str(rng.choice(event_ids)),
+            "type": rng.choice(["view", "like", "unlike"]),
+        }
+        for _ in range(200)
+    ]
+    for name, *args in changes:
+        getattr(engine, name)(*args)
+        getattr(graph, name)(*args)
+    for start in range(0, len(interactions), 50):
+        engine.apply_interactions(interactions[start:start + 50])
+        graph.apply_interactions(interactions[start:start + 50])
+        # fold between batches, as queries do in production
+        engine.recommend(graph.users[2], k=15)
+
+    reloaded = make_engine(graph, neighbours=5, max_hub_degree=20, fan_out=30)
+    user_ids = graph.users + [removed_user]
+    for user_id in user_ids:
+        expected = graph.recommend(user_id, k=15, neighbours=5, max_hub_degree=20, fan_out=30)
+        assert reloaded.recommend(user_id, k=15) == expected
+        assert engine.recommend(user_id, k=15) == expected
+    assert engine.recommend_many(user_ids, k=15) == reloaded.recommend_many(user_ids, k=15)